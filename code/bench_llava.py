@@ -0,0 +1,162 @@
+"""Throughput benchmark for the llava_quant inference paths.
+
+Without ``--model-dir`` a tiny random-weight LLaVA is generated first (see ``llava_tiny.py``),
+so the numbers are reproducible on any CPU box with no network access. Each benchmark runs on
+seeded random images and reports calls/s and items/s (one item = one image-question pair).
+
+  python code/bench_llava.py
+  python code/bench_llava.py --model-dir models/llava-1.5-7b-hf --quant cpu-int8 --repeat 1 --json reports/bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from llava_quant import (
+    QUANT_CHOICES,
+    build,
+    infer,
+    infer_batch,
+    infer_with_prefix,
+    prepare_image_prefix,
+    score_with_prefix,
+    score_yes_no,
+)
+
+BENCHMARKS = ("infer", "infer_batch", "score_yes_no", "infer_with_prefix", "score_with_prefix")
+QUESTIONS = (
+    "Is the face fake? Please answer yes or no.",
+    "Is the skin blurry? Please answer yes or no.",
+    "Is the jawline edge blending real? Please answer yes or no.",
+    "Is the lighting shadow real? Please answer yes or no.",
+)
+
+
+def random_images(count: int, size: int, seed: int) -> List[Image.Image]:
+    rng = np.random.RandomState(seed)
+    return [Image.fromarray(rng.randint(0, 256, (size, size, 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def time_runs(fn: Callable[[], int], repeat: int, warmup: int) -> Tuple[float, int, int]:
+    """Run ``fn`` (returns model calls made) warmup + repeat times; time only the measured runs."""
+    for _ in range(warmup):
+        fn()
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        calls += fn()
+    return time.perf_counter() - start, calls, repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark LLaVA inference paths (calls/s)")
+    parser.add_argument("--model-dir", default=None, help="Model to load (default: build a tiny random LLaVA)")
+    parser.add_argument("--quant", choices=QUANT_CHOICES, default="none")
+    parser.add_argument("--cpu-bf16", action="store_true")
+    parser.add_argument("--force-cpu", action="store_true")
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--image-size", type=int, default=224)
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS), help=f"Questions per image (max {len(QUESTIONS)})")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    parser.add_argument("--image-tokens", type=int, default=None, help="Visual-token budget (pooled image tokens)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bench", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--json", default=None, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    if model_dir is None:
+        from llava_tiny import make_tiny_llava
+
+        model_dir = make_tiny_llava(seed=args.seed)
+        print(f"[INFO] Tiny LLaVA built at {model_dir}")
+
+    processor, model, device = build(
+        model_dir, args.quant, args.max_new_tokens, args.force_cpu, cpu_bf16=args.cpu_bf16
+    )
+    images = random_images(args.images, args.image_size, args.seed)
+    questions = QUESTIONS[: max(1, min(args.questions, len(QUESTIONS)))]
+    pairs = [(image, question) for image in images for question in questions]
+    tokens = args.max_new_tokens
+    budget = args.image_tokens
+
+    def run_infer() -> int:
+        for image, question in pairs:
+            infer(processor, model, device, image, question, tokens, image_tokens=budget)
+        return len(pairs)
+
+    def run_infer_batch() -> int:
+        infer_batch(processor, model, device, pairs, tokens, batch_size=args.batch_size, image_tokens=budget)
+        return -(-len(pairs) // args.batch_size)
+
+    def run_score() -> int:
+        score_yes_no(processor, model, device, pairs, batch_size=args.batch_size, image_tokens=budget)
+        return -(-len(pairs) // args.batch_size)
+
+    def with_prefix(ask: Callable[..., object]) -> Callable[[], int]:
+        def run() -> int:
+            for image in images:
+                prefix = prepare_image_prefix(processor, model, device, image, image_tokens=budget)
+                for question in questions:
+                    ask(prefix, question)
+            return len(pairs)
+
+        return run
+
+    runners: Dict[str, Callable[[], int]] = {
+        "infer": run_infer,
+        "infer_batch": run_infer_batch,
+        "score_yes_no": run_score,
+        "infer_with_prefix": with_prefix(lambda p, q: infer_with_prefix(processor, model, device, p, q, tokens)),
+        "score_with_prefix": with_prefix(lambda p, q: score_with_prefix(processor, model, device, p, q)),
+    }
+
+    results: List[Dict[str, object]] = []
+    print(f"\n{'benchmark':<20}{'calls':>8}{'items':>8}{'seconds':>10}{'calls/s':>10}{'items/s':>10}")
+    for name in args.bench:
+        seconds, calls, runs = time_runs(runners[name], args.repeat, args.warmup)
+        items = len(pairs) * runs
+        row = {
+            "benchmark": name,
+            "calls": calls,
+            "items": items,
+            "seconds": round(seconds, 4),
+            "calls_per_sec": round(calls / seconds, 3) if seconds else None,
+            "items_per_sec": round(items / seconds, 3) if seconds else None,
+        }
+        results.append(row)
+        print(f"{name:<20}{calls:>8}{items:>8}{seconds:>10.3f}{row['calls_per_sec']:>10}{row['items_per_sec']:>10}")
+
+    if args.json:
+        out = Path(args.json)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "model_dir": model_dir,
+            "quant": args.quant + ("+bf16" if args.cpu_bf16 else ""),
+            "device": str(device),
+            "settings": {
+                "images": args.images,
+                "questions": len(questions),
+                "batch_size": args.batch_size,
+                "max_new_tokens": tokens,
+                "image_tokens": budget,
+                "repeat": args.repeat,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        out.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
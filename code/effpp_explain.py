@@ -36,18 +36,48 @@ def truncate_words(text: str, limit: int) -> str:
 
 
 class LlavaSession:
-    def __init__(self, model_dir: Path, quant: str, max_new_tokens: int, force_cpu: bool = False) -> None:
-        from llava_quant import build as llava_build, infer as llava_infer
+    def __init__(
+        self,
+        model_dir: Path,
+        quant: str,
+        max_new_tokens: int,
+        force_cpu: bool = False,
+        batch_size: int = 1,
+        cache_path: Optional[Path] = None,
+        quant_cache: Optional[Path] = None,
+        cpu_bf16: bool = False,
+        server: Optional[str] = None,
+    ) -> None:
+        from llava_quant import build as llava_build, infer_batch as llava_infer_batch
 
-        self.llava_infer = llava_infer
+        self.llava_infer_batch = llava_infer_batch
         self.processor, self.model, self.device = llava_build(
-            str(model_dir), quant=quant, max_new_tokens=max_new_tokens, force_cpu=force_cpu
+            str(model_dir),
+            quant=quant,
+            max_new_tokens=max_new_tokens,
+            force_cpu=force_cpu,
+            quant_cache=str(quant_cache) if quant_cache else None,
+            cpu_bf16=cpu_bf16,
+            server=server,
         )
         self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+        self.cache = None
+        if cache_path is not None:
+            from llava_cache import InferenceCache
+
+            quant_label = quant + ("+bf16" if cpu_bf16 else "")
+            self.cache = InferenceCache(cache_path, model_dir=str(model_dir), quant=quant_label)
+            self.llava_infer_batch = self.cache.infer_batch
 
     def describe(self, image_path: Path, prompt: str) -> str:
-        image = Image.open(image_path).convert("RGB")
-        return self.llava_infer(self.processor, self.model, self.device, image, prompt, self.max_new_tokens)
+        return self.describe_batch([(image_path, prompt)])[0]
+
+    def describe_batch(self, items: List[Tuple[Path, str]]) -> List[str]:
+        pairs = [(Image.open(image_path).convert("RGB"), prompt) for image_path, prompt in items]
+        return self.llava_infer_batch(
+            self.processor, self.model, self.device, pairs, self.max_new_tokens, batch_size=self.batch_size
+        )
 
 
 class ChatGPTSession:
@@ -332,6 +362,43 @@ def build_chatgpt_session(args: argparse.Namespace) -> Optional[ChatGPTSession]:
     )
 
 
+def llava_prompt(manipulated: bool) -> str:
+    if manipulated:
+        return (
+            "Identify visible manipulation artefacts (boundary seams, lighting mismatch, texture loss,"
+            " warped geometry, color bleed). Provide at most 55 English words."
+        )
+    return (
+        "Explain why this face appears authentic. Describe consistent lighting, textures, or geometry"
+        " in at most 55 English words."
+    )
+
+
+def describe_rank_with_llava(
+    llava_session: LlavaSession,
+    crops_dir: Path,
+    videos: Dict[str, Dict[str, object]],
+    identity: str,
+    rank: int,
+) -> Dict[str, str]:
+    """Run every technique crop of one frame rank through a single batched LLaVA call."""
+    items: List[Tuple[Path, str]] = []
+    methods: List[str] = []
+    for method in TECHNIQUE_ORDER:
+        video_meta = videos.get(method)
+        if video_meta is None:
+            continue
+        try:
+            image_path, _, _ = prepare_pair(crops_dir, video_meta["split"], identity, method, rank)
+        except FileNotFoundError:
+            continue
+        items.append((image_path, llava_prompt(method != ORIGINAL_METHOD)))
+        methods.append(method)
+    if not items:
+        return {}
+    return dict(zip(methods, llava_session.describe_batch(items)))
+
+
 def process_identity_record(
     identity: str,
     index_path: Path,
@@ -362,6 +429,10 @@ def process_identity_record(
             if args.verbose:
                 print(f"Missing original crop for identity {identity} rank {rank}, skipping pairs.")
             continue
+        llava_descriptions: Dict[str, str] = {}
+        if args.mode == "llava":
+            assert llava_session is not None
+            llava_descriptions = describe_rank_with_llava(llava_session, crops_dir, videos, identity, rank)
         for method in TECHNIQUE_ORDER:
             video_meta = videos.get(method)
             if video_meta is None:
@@ -382,18 +453,7 @@ def process_identity_record(
             if args.mode == "placeholder":
                 description = "explanation pending"
             elif args.mode == "llava":
-                assert llava_session is not None
-                if manipulated:
-                    prompt = (
-                        "Identify visible manipulation artefacts (boundary seams, lighting mismatch, texture loss,"
-                        " warped geometry, color bleed). Provide at most 55 English words."
-                    )
-                else:
-                    prompt = (
-                        "Explain why this face appears authentic. Describe consistent lighting, textures, or geometry"
-                        " in at most 55 English words."
-                    )
-                description = llava_session.describe(target_image_path, prompt)
+                description = llava_descriptions[method]
             else:
                 assert chatgpt_session is not None
                 context = {
@@ -539,6 +599,11 @@ def generate_annotations(args: argparse.Namespace) -> None:
             quant=args.quant,
             max_new_tokens=args.max_new_tokens,
             force_cpu=args.force_cpu,
+            batch_size=args.llava_batch_size,
+            cache_path=project_root / args.infer_cache if args.infer_cache else None,
+            quant_cache=project_root / args.quant_cache if args.quant_cache else None,
+            cpu_bf16=args.cpu_bf16,
+            server=args.llava_server,
         )
 
     chatgpt_session: Optional[ChatGPTSession] = None
@@ -632,9 +697,34 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--technique-summary", default="config/effpp_mts.json", help="Technique description JSON.")
     parser.add_argument("--tag-list", default="config/effpp_tags.json", help="Evidence tag list JSON.")
     parser.add_argument("--model-dir", default="models/llava-1.5-7b-hf", help="Path to LLaVA model directory (llava mode only).")
-    parser.add_argument("--quant", choices=["none", "4bit", "8bit"], default="4bit", help="Quantisation mode for LLaVA.")
+    parser.add_argument(
+        "--quant",
+        choices=["none", "4bit", "8bit", "cpu-int8"],
+        default="4bit",
+        help="Quantisation mode for LLaVA (cpu-int8: dynamic int8 on CPU).",
+    )
+    parser.add_argument("--quant-cache", default=None, help="Cache file for cpu-int8 quantised weights.")
+    parser.add_argument("--cpu-bf16", action="store_true", help="Enable bf16 autocast for CPU LLaVA inference.")
     parser.add_argument("--max-new-tokens", type=int, default=120, help="Maximum tokens generated by LLaVA.")
     parser.add_argument("--force-cpu", action="store_true", help="Force CPU inference for LLaVA.")
+    parser.add_argument(
+        "--llava-batch-size",
+        type=int,
+        default=5,
+        help="Technique crops per batched LLaVA generate call (llava mode only).",
+    )
+    parser.add_argument(
+        "--infer-cache",
+        nargs="?",
+        const="cache/llava_infer.sqlite",
+        default=None,
+        help="Persistent LLaVA answer cache shared with run_mfa_ffpp (llava mode only).",
+    )
+    parser.add_argument(
+        "--llava-server",
+        default=None,
+        help="URL of a running llava_server.py; avoids reloading the model (llava mode only).",
+    )
     parser.add_argument("--mode", choices=["placeholder", "chatgpt", "llava"], default="chatgpt", help="Annotation generation mode.")
     parser.add_argument("--chatgpt-model", default="gpt-4.1-mini", help="Model name for ChatGPT mode.")
     parser.add_argument("--chatgpt-api-key", default=None, help="API key for ChatGPT mode (falls back to env variable).")
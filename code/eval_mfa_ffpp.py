@@ -1,6 +1,7 @@
 ﻿from __future__ import annotations
 
 import json
+import re
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple
@@ -9,7 +10,12 @@ import numpy as np
 from scipy.stats import kendalltau, pointbiserialr, spearmanr
 from sklearn.metrics import average_precision_score, f1_score, roc_auc_score
 
+from mfa_store import find_logs, load_records
+
 TOP_K = 5
+POOLING_CHOICES = ("mean", "max", "topk")
+BUDGET_LOG = re.compile(r"mfa_ffpp_(?P<split>[a-z]+)(?:_img(?P<tokens>\d+))?_progress\.jsonl$")
+CASCADE_LOG = re.compile(r"mfa_ffpp_(?P<split>[a-z]+).*_cascade-(?P<aggregation>[a-z]+)_progress\.jsonl$")
 
 
 @dataclass
@@ -23,9 +29,18 @@ class QuestionMeta:
 class QuestionStats:
     yes: int
     total: int
+    scores: Optional[List[float]] = None
+    skipped: Optional[int] = None  # run_mfa_ffpp.py --early-exit: frames never asked; total counts the frames used
+
+    @property
+    def truncated(self) -> bool:
+        return bool(self.skipped)
 
     @property
     def score(self) -> float:
+        # Logprob-scored runs store per-frame P(yes); fall back to the vote fraction otherwise.
+        if self.scores:
+            return float(np.mean(self.scores))
         return self.yes / self.total if self.total else 0.0
 
     @property
@@ -40,6 +55,13 @@ class VideoRecord:
     label: int
     method: str
     question_stats: Dict[str, QuestionStats]
+    runtime_sec: Optional[float] = None
+    cascade: Optional[Dict[str, object]] = None  # run_mfa_ffpp.py --cascade: question order, questions asked, verdict
+
+    @property
+    def truncated(self) -> bool:
+        # Early-exited questions averaged fewer frames: their votes match the full run, their scores do not.
+        return any(stats.truncated for stats in self.question_stats.values())
 
 
 def load_question_meta(root: Path) -> Dict[str, QuestionMeta]:
@@ -56,28 +78,54 @@ def load_question_meta(root: Path) -> Dict[str, QuestionMeta]:
 
 
 def load_progress(path: Path, split: str) -> List[VideoRecord]:
+    # Reads the run's result store (one indexed query per split) or, for logs never imported, the JSONL.
     records: List[VideoRecord] = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            data = json.loads(line)
-            if data.get("split") != split:
-                continue
-            questions = {
-                qid: QuestionStats(yes=stats.get("yes", 0), total=stats.get("total", 0))
-                for qid, stats in data.get("questions", {}).items()
-            }
-            records.append(
-                VideoRecord(
-                    key=data.get("video_key", data.get("video_id", "")),
-                    split=data.get("split", split),
-                    label=int(data.get("label", 0)),
-                    method=data.get("method", ""),
-                    question_stats=questions,
-                )
+    for data in load_records(path, split):
+        questions = {
+            qid: QuestionStats(
+                yes=stats.get("yes", 0),
+                total=stats.get("total", 0),
+                scores=stats.get("scores"),
+                skipped=stats.get("skipped"),
+            )
+            for qid, stats in data.get("questions", {}).items()
+        }
+        records.append(
+            VideoRecord(
+                key=data.get("video_key", data.get("video_id", "")),
+                split=data.get("split", split),
+                label=int(data.get("label", 0)),
+                method=data.get("method", ""),
+                question_stats=questions,
+                runtime_sec=data.get("runtime_sec"),
+                cascade=data.get("cascade"),
             )
+        )
     return records
 
 
+def split_truncated(records: List[VideoRecord]) -> Tuple[List[VideoRecord], List[VideoRecord]]:
+    """Separate videos scored on every frame from videos an --early-exit run cut short."""
+    full = [record for record in records if not record.truncated]
+    truncated = [record for record in records if record.truncated]
+    return full, truncated
+
+
+def summarize_truncated(records: List[VideoRecord], question_ids: List[str]) -> Dict[str, object]:
+    """Vote metrics of early-exited videos; their truncated score means are left out of every ranking."""
+    if not records:
+        return {}
+    used = sum(stats.total for record in records for stats in record.question_stats.values())
+    skipped = sum(stats.skipped or 0 for record in records for stats in record.question_stats.values())
+    return {
+        "videos": len(records),
+        "frames_used_fraction": used / (used + skipped) if used + skipped else None,
+        "vote_balanced_accuracy": {
+            qid: balanced_accuracy(*collect_scores(records, qid)[2:]) for qid in question_ids
+        },
+    }
+
+
 def collect_scores(records: Iterable[VideoRecord], question_id: str) -> Tuple[List[float], List[int], int, int, int, int]:
     scores: List[float] = []
     labels: List[int] = []
@@ -211,35 +259,127 @@ def compute_question_table(
     return table, val_map, test_map
 
 
+def rank_question_ids(rows: List[Dict[str, object]], diversify: bool = False) -> List[str]:
+    """Question ids by val balanced accuracy, best first.
+
+    ``rows`` are ``compute_question_table`` rows or the ``ranking`` list of mfa_feature_rankings.json.
+    With ``diversify`` the order cycles through categories: each category's best question comes
+    first, then each category's second best, and so on, so a small budget still covers several
+    categories.
+    """
+    ordered = sorted(rows, key=lambda row: row.get("val", {}).get("balanced_accuracy") or 0.0, reverse=True)
+    if not diversify:
+        return [str(row["id"]) for row in ordered]
+    seen: Dict[str, int] = {}
+    keyed = []
+    for position, row in enumerate(ordered):
+        category = str(row.get("category", ""))
+        keyed.append((seen.get(category, 0), position, str(row["id"])))
+        seen[category] = seen.get(category, 0) + 1
+    return [qid for _, _, qid in sorted(keyed)]
+
+
+def compute_question_budget_curve(
+    val_records: List[VideoRecord], test_records: List[VideoRecord], ranked_ids: List[str]
+) -> List[Dict[str, object]]:
+    """Video-level accuracy when only the top-K ranked questions are asked, for every K.
+
+    The video score is the mean score of its K questions, thresholded where it maximises val balanced
+    accuracy (an F1 threshold, as in ``compute_pooling_metrics``, tends to call every video fake and
+    flatten the curve at 0.5). AUC on both splits is threshold-free. ``relative_cost`` is K over the full question set, i.e. the share of
+    LLaVA calls a ``run_mfa_ffpp.py --question-budget K`` run makes.
+    """
+    rows: List[Dict[str, object]] = []
+    for k in range(1, len(ranked_ids) + 1):
+        top_ids = ranked_ids[:k]
+        val_mean = build_score_arrays(val_records, top_ids)["mean"]
+        test_mean = build_score_arrays(test_records, top_ids)["mean"]
+        thr, val_metrics = find_best_threshold(val_mean["scores"], val_mean["labels"], objective="balanced_accuracy")
+        preds = [1 if s >= thr else 0 for s in test_mean["scores"]]
+        labels = test_mean["labels"]
+        tp = sum(1 for p, y in zip(preds, labels) if p == 1 and y == 1)
+        fp = sum(1 for p, y in zip(preds, labels) if p == 1 and y == 0)
+        tn = sum(1 for p, y in zip(preds, labels) if p == 0 and y == 0)
+        fn = sum(1 for p, y in zip(preds, labels) if p == 0 and y == 1)
+        rows.append(
+            {
+                "k": k,
+                "question_ids": top_ids,
+                "relative_cost": k / len(ranked_ids),
+                "threshold": thr,
+                "val_balanced_accuracy": val_metrics.get("balanced_accuracy"),
+                "val_auc": safe_auc(val_mean["labels"], val_mean["scores"]),
+                "test_balanced_accuracy": balanced_accuracy(tp, tn, fp, fn),
+                "test_auc": safe_auc(labels, test_mean["scores"]),
+            }
+        )
+    return rows
+
+
+def print_question_budget_curve(rows: List[Dict[str, object]]) -> None:
+    fmt = lambda value, spec: format(value, spec) if value is not None else "-"
+    print(f"{'K':>4}{'cost':>7}{'val BA':>9}{'val AUC':>9}{'test BA':>9}{'test AUC':>10}")
+    for row in rows:
+        print(
+            f"{row['k']:>4}{row['relative_cost']:>7.2f}{fmt(row['val_balanced_accuracy'], '.3f'):>9}{fmt(row['val_auc'], '.3f'):>9}"
+            f"{fmt(row['test_balanced_accuracy'], '.3f'):>9}{fmt(row['test_auc'], '.3f'):>10}"
+        )
+
+
+def pool_scores(scores: List[float], aggregation: str) -> float:
+    """Video score from its question scores: mean, max, or mean of the TOP_K highest."""
+    if aggregation == "mean":
+        return float(np.mean(scores))
+    if aggregation == "max":
+        return float(np.max(scores))
+    if aggregation == "topk":
+        return float(np.mean(sorted(scores, reverse=True)[: min(TOP_K, len(scores))]))
+    raise ValueError(f"aggregation must be one of {POOLING_CHOICES}")
+
+
+def pooled_bounds(scores: List[float], remaining: int, aggregation: str) -> Tuple[float, float]:
+    """Lowest and highest pooled score once ``remaining`` more question scores in [0, 1] come in.
+
+    All three poolings are monotone in each score, so the extremes are all zeros and all ones. A
+    question that yields no parseable answer drops out of the pool, which stays within the same range.
+    """
+    if not scores and not remaining:
+        return 0.0, 0.0
+    low = pool_scores(list(scores) + [0.0] * remaining, aggregation)
+    high = pool_scores(list(scores) + [1.0] * remaining, aggregation)
+    return low, high
+
+
 def build_score_arrays(records: List[VideoRecord], top_ids: List[str]) -> Dict[str, Dict[str, List[float]]]:
-    aggregations = {name: {"scores": [], "labels": []} for name in ("mean", "max", "topk")}
+    aggregations = {name: {"scores": [], "labels": []} for name in POOLING_CHOICES}
     for record in records:
         scores = [record.question_stats[qid].score for qid in top_ids if qid in record.question_stats]
         if not scores:
             continue
-        mean_score = float(np.mean(scores))
-        max_score = float(np.max(scores))
-        topk_score = float(np.mean(sorted(scores, reverse=True)[: min(TOP_K, len(scores))]))
-        for name, value in (("mean", mean_score), ("max", max_score), ("topk", topk_score)):
-            aggregations[name]["scores"].append(value)
+        for name in POOLING_CHOICES:
+            aggregations[name]["scores"].append(pool_scores(scores, name))
             aggregations[name]["labels"].append(int(record.label))
     return aggregations
 
 
-def find_best_threshold(scores: List[float], labels: List[int]) -> Tuple[float, Dict[str, float]]:
+def find_best_threshold(
+    scores: List[float], labels: List[int], objective: str = "f1"
+) -> Tuple[float, Dict[str, float]]:
+    """The score threshold maximising ``objective`` (``"f1"`` or ``"balanced_accuracy"``) on these labels."""
     unique = sorted(set(scores))
     best_thr = 0.5
-    best_f1 = -1.0
+    best_value = -1.0
     best_stats: Dict[str, float] = {}
     for thr in unique:
         preds = [1 if s >= thr else 0 for s in scores]
+        tp = sum(1 for p, y in zip(preds, labels) if p == 1 and y == 1)
+        fp = sum(1 for p, y in zip(preds, labels) if p == 1 and y == 0)
+        tn = sum(1 for p, y in zip(preds, labels) if p == 0 and y == 0)
+        fn = sum(1 for p, y in zip(preds, labels) if p == 0 and y == 1)
         f1 = f1_score(labels, preds, zero_division=0)
-        if f1 > best_f1:
-            best_f1 = f1
-            tp = sum(1 for p, y in zip(preds, labels) if p == 1 and y == 1)
-            fp = sum(1 for p, y in zip(preds, labels) if p == 1 and y == 0)
-            tn = sum(1 for p, y in zip(preds, labels) if p == 0 and y == 0)
-            fn = sum(1 for p, y in zip(preds, labels) if p == 0 and y == 1)
+        value = balanced_accuracy(tp, tn, fp, fn) if objective == "balanced_accuracy" else f1
+        if value > best_value:
+            best_value = value
             precision = tp / (tp + fp) if (tp + fp) else 0.0
             recall = tp / (tp + fn) if (tp + fn) else 0.0
             best_stats = {
@@ -353,12 +493,160 @@ def load_summary(path: Path) -> Dict[str, float]:
     }
 
 
+def summarize_runtime(records: Iterable[VideoRecord]) -> Dict[str, float]:
+    durations = [record.runtime_sec for record in records if record.runtime_sec is not None]
+    if not durations:
+        return {}
+    return {
+        "count": len(durations),
+        "total_seconds": float(sum(durations)),
+        "avg_seconds": float(np.mean(durations)),
+        "median_seconds": float(np.median(durations)),
+        "p95_seconds": float(np.percentile(durations, 95)),
+    }
+
+
+def find_budget_logs(progress_dir: Path, split: str) -> Dict[Optional[int], Path]:
+    """Progress logs of one split keyed by visual-token budget (None = full resolution)."""
+    logs: Dict[Optional[int], Path] = {}
+    for path in find_logs(progress_dir, f"mfa_ffpp_{split}*_progress.jsonl"):
+        match = BUDGET_LOG.match(path.name)
+        if match and match.group("split") == split:
+            tokens = match.group("tokens")
+            logs[int(tokens) if tokens else None] = path
+    return logs
+
+
+def compare_runs(runs: Dict[str, List[VideoRecord]], top_ids: Optional[List[str]] = None) -> List[Dict[str, object]]:
+    """Accuracy vs latency of several progress logs of one split, on the videos every run has processed.
+
+    The first run is the baseline for ``speedup_vs_baseline``. ``top_ids`` defaults to the baseline's
+    TOP_K questions by balanced accuracy.
+    """
+    if not runs:
+        return []
+    common = set.intersection(*({record.key for record in records} for records in runs.values()))
+    baseline_seconds = None
+    rows: List[Dict[str, object]] = []
+    for label, all_records in runs.items():
+        records = [record for record in all_records if record.key in common]
+        question_ids = sorted({qid for record in records for qid in record.question_stats})
+        question_ba = {qid: balanced_accuracy(*collect_scores(records, qid)[2:]) for qid in question_ids}
+        if top_ids is None:
+            top_ids = sorted(question_ba, key=question_ba.get, reverse=True)[:TOP_K]
+        topk = build_score_arrays(records, top_ids)["mean"]
+        runtime = summarize_runtime(records)
+        avg_seconds = runtime.get("avg_seconds")
+        if not rows:
+            baseline_seconds = avg_seconds
+        rows.append(
+            {
+                "run": label,
+                "videos": len(records),
+                "avg_seconds": avg_seconds,
+                "p95_seconds": runtime.get("p95_seconds"),
+                "speedup_vs_baseline": baseline_seconds / avg_seconds if baseline_seconds and avg_seconds else None,
+                "mean_question_balanced_accuracy": float(np.mean(list(question_ba.values()))) if question_ba else None,
+                "best_question_balanced_accuracy": max(question_ba.values()) if question_ba else None,
+                "topk_mean_auc": safe_auc(topk["labels"], topk["scores"]),
+            }
+        )
+    return rows
+
+
+def compute_cascade_report(cascade_records: List[VideoRecord], full_records: List[VideoRecord]) -> Dict[str, object]:
+    """Questions asked and BA of a ``--cascade`` run against the all-questions run on the same videos.
+
+    The full run's verdict pools the same ranked questions with the cascade's aggregation and
+    threshold, so ``agreement`` below 1 only comes from answers that differ between the two runs.
+    """
+    full_by_key = {record.key: record for record in full_records}
+    asked: List[int] = []
+    candidates: List[int] = []
+    histogram: Dict[int, int] = {}
+    counts = {"cascade": [0, 0, 0, 0], "full": [0, 0, 0, 0]}  # tp, tn, fp, fn
+    agree = 0
+    cascade_seconds: List[float] = []
+    full_seconds: List[float] = []
+    for record in cascade_records:
+        cascade = record.cascade
+        full = full_by_key.get(record.key)
+        if not cascade or full is None:
+            continue
+        order = list(cascade.get("order", []))
+        full_scores = [full.question_stats[qid].score for qid in order if qid in full.question_stats]
+        aggregation = str(cascade.get("aggregation", "mean"))
+        threshold = float(cascade.get("threshold", 0.5))
+        verdicts = {
+            "cascade": bool(cascade.get("prediction")),
+            "full": bool(full_scores) and pool_scores(full_scores, aggregation) >= threshold,
+        }
+        for name, prediction in verdicts.items():
+            slot = (0 if record.label else 2) if prediction else (3 if record.label else 1)
+            counts[name][slot] += 1
+        agree += verdicts["cascade"] == verdicts["full"]
+        count = int(cascade.get("asked", len(order)))
+        asked.append(count)
+        candidates.append(len(order))
+        histogram[count] = histogram.get(count, 0) + 1
+        if record.runtime_sec is not None and full.runtime_sec is not None:
+            cascade_seconds.append(record.runtime_sec)
+            full_seconds.append(full.runtime_sec)
+    if not asked:
+        return {}
+    return {
+        "videos": len(asked),
+        "candidate_questions": float(np.mean(candidates)),
+        "avg_questions": float(np.mean(asked)),
+        "question_share": float(np.sum(asked) / np.sum(candidates)) if np.sum(candidates) else None,
+        "questions_histogram": {str(k): histogram[k] for k in sorted(histogram)},
+        "balanced_accuracy": balanced_accuracy(*counts["cascade"]),
+        "full_balanced_accuracy": balanced_accuracy(*counts["full"]),
+        "agreement": agree / len(asked),
+        "avg_seconds": float(np.mean(cascade_seconds)) if cascade_seconds else None,
+        "full_avg_seconds": float(np.mean(full_seconds)) if full_seconds else None,
+    }
+
+
+def print_comparison(rows: List[Dict[str, object]]) -> None:
+    fmt = lambda value, spec: format(value, spec) if value is not None else "-"
+    print(f"{'run':>24}{'videos':>8}{'avg s':>9}{'speedup':>9}{'mean BA':>9}{'best BA':>9}{'top-k AUC':>11}")
+    for row in rows:
+        print(
+            f"{row['run']!s:>24}{row['videos']:>8}{fmt(row['avg_seconds'], '.2f'):>9}"
+            f"{fmt(row['speedup_vs_baseline'], '.2f'):>9}{fmt(row['mean_question_balanced_accuracy'], '.3f'):>9}"
+            f"{fmt(row['best_question_balanced_accuracy'], '.3f'):>9}{fmt(row['topk_mean_auc'], '.3f'):>11}"
+        )
+
+
+def compute_budget_tradeoff(progress_dir: Path, split: str, top_ids: List[str]) -> List[Dict[str, object]]:
+    """``compare_runs`` over the full-resolution log and every ``--image-tokens`` log of ``split``, early-exited videos excluded."""
+    logs = find_budget_logs(progress_dir, split)
+    if len(logs) < 2:
+        return []
+    ordered = sorted(logs, key=lambda tokens: -(tokens if tokens is not None else 1 << 30))
+    runs = {
+        str(tokens) if tokens is not None else "full": split_truncated(load_progress(logs[tokens], split))[0]
+        for tokens in ordered
+    }
+    return compare_runs(runs, top_ids)
+
+
 def main() -> None:
     project_root = Path(__file__).resolve().parents[1]
     meta = load_question_meta(project_root)
 
-    val_records = load_progress(project_root / "mfa" / "ffpp_c23" / "mfa_ffpp_val_progress.jsonl", "val")
-    test_records = load_progress(project_root / "mfa" / "ffpp_c23" / "mfa_ffpp_test_progress.jsonl", "test")
+    val_records, val_truncated = split_truncated(
+        load_progress(project_root / "mfa" / "ffpp_c23" / "mfa_ffpp_val_progress.jsonl", "val")
+    )
+    test_records, test_truncated = split_truncated(
+        load_progress(project_root / "mfa" / "ffpp_c23" / "mfa_ffpp_test_progress.jsonl", "test")
+    )
+    if val_truncated or test_truncated:
+        print(
+            f"[warn] {len(val_truncated)} val / {len(test_truncated)} test videos were scored with --early-exit; "
+            "their means cover only the frames asked, so they are reported under efficiency.early_exit only"
+        )
 
     question_table, val_rank_map, test_rank_map = compute_question_table(val_records, test_records, meta)
 
@@ -379,17 +667,59 @@ def main() -> None:
     extraction_val = load_summary(project_root / "data" / "processed" / "ffpp_c23" / "summary_val.json")
     extraction_test = load_summary(project_root / "data" / "processed" / "ffpp_c23" / "summary_test.json")
 
+    efficiency: Dict[str, object] = {
+        "extraction_val": extraction_val,
+        "extraction_test": extraction_test,
+        "mfa_runtime_val": summarize_runtime(val_records),
+        "mfa_runtime_test": summarize_runtime(test_records),
+    }
+    if not efficiency["mfa_runtime_val"] and not efficiency["mfa_runtime_test"]:
+        efficiency["mfa_runtime_note"] = "Per-video MFA runtime not logged; re-run run_mfa_ffpp.py to record runtime_sec."
+    if val_truncated or test_truncated:
+        efficiency["early_exit"] = {
+            "val": summarize_truncated(val_truncated, top_ids),
+            "test": summarize_truncated(test_truncated, top_ids),
+        }
+    # run_mfa_ffpp.py --image-tokens N writes mfa_ffpp_val_imgN_progress.jsonl next to the full-resolution log
+    token_budget = compute_budget_tradeoff(project_root / "mfa" / "ffpp_c23", "val", top_ids)
+    if token_budget:
+        efficiency["token_budget_val"] = token_budget
+        print_comparison(token_budget)
+
+    # run_mfa_ffpp.py --cascade AGG writes mfa_ffpp_val[...]_cascade-AGG_progress.jsonl
+    cascade_reports: Dict[str, object] = {}
+    for path in find_logs(project_root / "mfa" / "ffpp_c23", "mfa_ffpp_val*_cascade-*_progress.jsonl"):
+        if not CASCADE_LOG.match(path.name):
+            continue
+        report = compute_cascade_report(load_progress(path, "val"), val_records)
+        if report:
+            cascade_reports[path.stem.replace("_progress", "")] = report
+            print(
+                f"[cascade] {path.name}: {report['avg_questions']:.2f}/{report['candidate_questions']:.0f} questions per video, "
+                f"BA {report['balanced_accuracy']:.3f} vs full {report['full_balanced_accuracy']:.3f}, "
+                f"agreement {report['agreement']:.3f}"
+            )
+    if cascade_reports:
+        efficiency["cascade_val"] = cascade_reports
+
+    # Accuracy vs number of questions asked (run_mfa_ffpp.py --question-budget K), ranked on val only.
+    question_budget = {
+        "ranked": compute_question_budget_curve(val_records, test_records, rank_question_ids(question_table)),
+        "diversified": compute_question_budget_curve(
+            val_records, test_records, rank_question_ids(question_table, diversify=True)
+        ),
+    }
+    efficiency["question_budget"] = question_budget
+    if question_budget["ranked"]:
+        print_question_budget_curve(question_budget["ranked"])
+
     output = {
         "top_k": TOP_K,
         "rank_stability": {"spearman": spearman, "kendall_tau": kendall},
         "question_metrics": question_table,
         "pooling_metrics": pooling_metrics,
         "frame_metrics": frame_metrics,
-        "efficiency": {
-            "extraction_val": extraction_val,
-            "extraction_test": extraction_test,
-            "mfa_runtime_note": "Per-video MFA runtime not logged; enable profiling in future runs.",
-        },
+        "efficiency": efficiency,
     }
 
     out_path = project_root / "eval" / "ffpp_c23" / "metrics.json"
@@ -2,12 +2,10 @@
 from pathlib import Path
 from typing import Dict, List
 
+from mfa_store import load_records
+
 def load_progress(path: Path) -> List[Dict[str, object]]:
-    records = []
-    with path.open('r', encoding='utf-8') as f:
-        for line in f:
-            records.append(json.loads(line))
-    return records
+    return load_records(path)
 
 def build_cases(records: List[Dict[str, object]], question_id: str, base_faces: Path, limit: int = 4) -> Dict[str, List[Dict[str, object]]]:
     buckets = {"tp": [], "tn": [], "fp": [], "fn": []}
@@ -0,0 +1,298 @@
+"""Persistent content-addressed cache for LLaVA answers (single SQLite file).
+
+Keys combine the decoded image pixels, the prompt, a fingerprint of the model directory,
+the quantisation mode, ``max_new_tokens`` and the inference kind (generate / logprob score),
+so identical work is served from disk across runs and tools.
+
+CLI:
+  python code/llava_cache.py stats --path cache/llava_infer.sqlite
+  python code/llava_cache.py clear --path cache/llava_infer.sqlite
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+DEFAULT_CACHE_PATH = "cache/llava_infer.sqlite"
+DEFAULT_MAX_MB = 512
+FINGERPRINT_FILES = (
+    "config.json",
+    "generation_config.json",
+    "preprocessor_config.json",
+    "tokenizer_config.json",
+    "special_tokens_map.json",
+)
+WEIGHT_PATTERNS = ("*.safetensors", "*.bin")
+
+
+def model_fingerprint(model_dir: str) -> str:
+    """Hash config files plus weight file names/sizes; avoids reading multi-GB weights."""
+    digest = hashlib.sha256()
+    root = Path(model_dir)
+    if not model_dir or not root.is_dir():
+        digest.update(str(model_dir).encode("utf-8"))  # hub id
+        return digest.hexdigest()[:16]
+    for name in FINGERPRINT_FILES:
+        path = root / name
+        if path.exists():
+            digest.update(name.encode("utf-8"))
+            digest.update(path.read_bytes())
+    for pattern in WEIGHT_PATTERNS:
+        for path in sorted(root.glob(pattern)):
+            digest.update(f"{path.name}:{path.stat().st_size}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def image_digest(image: Image.Image) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def generate_kind(stop_on_verdict: bool, rationale_tokens: int) -> str:
+    """Cache kind for free-text answers; early-stopped answers are stored separately."""
+    return f"generate-stop{rationale_tokens}" if stop_on_verdict else "generate"
+
+
+def budget_kind(kind: str, image_tokens: Optional[int]) -> str:
+    """Answers computed under a visual-token budget are stored apart from full-resolution ones."""
+    return kind if image_tokens is None else f"{kind}-img{image_tokens}"
+
+
+class InferenceCache:
+    def __init__(
+        self,
+        path: Path | str,
+        model_dir: str,
+        quant: str,
+        max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fingerprint = model_fingerprint(model_dir)
+        self.quant = quant
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.commit()
+
+    def key(self, image: Image.Image, prompt: str, max_new_tokens: int, kind: str = "generate") -> str:
+        payload = "\x1f".join(
+            [image_digest(image), prompt, self.fingerprint, self.quant, str(max_new_tokens), kind]
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[object]:
+        """Stored value or None. Read-only: ``touch`` records the access, so no write lock is taken here."""
+        row = self.conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def touch(self, keys: Sequence[str]) -> None:
+        if keys:
+            now = time.time()
+            self.conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(now, key) for key in keys])
+
+    def put(self, key: str, value: object) -> None:
+        text = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, text, len(text.encode("utf-8")) + len(key), now, now),
+        )
+
+    def _bump(self, name: str, amount: int) -> None:
+        if amount:
+            self.conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount),
+            )
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the store is under 90% of max_bytes."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC").fetchall():
+            if total <= target:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        self._bump("evicted", removed)
+        return removed
+
+    def cached(
+        self,
+        kind: str,
+        pairs: Sequence[Tuple[Image.Image, str]],
+        max_new_tokens: int,
+        compute: Callable[[List[int]], List[object]],
+    ) -> List[object]:
+        """Serve each (image, prompt) from the store; ``compute`` receives the indices of misses.
+
+        ``compute`` (the model call) runs with no transaction open. Access times, new entries, counters
+        and eviction are written afterwards in one short transaction, so other processes sharing the
+        store never wait on inference.
+        """
+        keys = [self.key(image, prompt, max_new_tokens, kind) for image, prompt in pairs]
+        results: List[Optional[object]] = [self.get(key) for key in keys]
+        missing = [idx for idx, value in enumerate(results) if value is None]
+        computed = compute(missing) if missing else []
+        self.touch([key for key, value in zip(keys, results) if value is not None])
+        for idx, value in zip(missing, computed):
+            results[idx] = value
+            self.put(keys[idx], value)
+        hits = len(pairs) - len(missing)
+        self.hits += hits
+        self.misses += len(missing)
+        self._bump("hits", hits)
+        self._bump("misses", len(missing))
+        if missing:
+            self.evict()
+        self.conn.commit()
+        return results  # type: ignore[return-value]
+
+    def infer(
+        self,
+        processor,
+        model,
+        device,
+        image: Image.Image,
+        question: str,
+        max_new_tokens: int,
+        stop_on_verdict: bool = False,
+        rationale_tokens: int = 0,
+        image_tokens: Optional[int] = None,
+    ) -> str:
+        return self.infer_batch(
+            processor,
+            model,
+            device,
+            [(image, question)],
+            max_new_tokens,
+            stop_on_verdict=stop_on_verdict,
+            rationale_tokens=rationale_tokens,
+            image_tokens=image_tokens,
+        )[0]
+
+    def infer_batch(
+        self,
+        processor,
+        model,
+        device,
+        pairs: Sequence[Tuple[Image.Image, str]],
+        max_new_tokens: int,
+        batch_size: int = 8,
+        stop_on_verdict: bool = False,
+        rationale_tokens: int = 0,
+        image_tokens: Optional[int] = None,
+        **generate_kwargs,
+    ) -> List[str]:
+        from llava_quant import infer_batch
+
+        def compute(indices: List[int]) -> List[object]:
+            subset = [pairs[idx] for idx in indices]
+            return infer_batch(
+                processor,
+                model,
+                device,
+                subset,
+                max_new_tokens,
+                batch_size=batch_size,
+                stop_on_verdict=stop_on_verdict,
+                rationale_tokens=rationale_tokens,
+                image_tokens=image_tokens,
+                **generate_kwargs,
+            )
+
+        if generate_kwargs.get("do_sample"):
+            return compute(list(range(len(pairs))))  # sampled answers are not reproducible, never cache them
+        kind = budget_kind(generate_kind(stop_on_verdict, rationale_tokens), image_tokens)
+        return self.cached(kind, pairs, max_new_tokens, compute)  # type: ignore[return-value]
+
+    def score_yes_no(
+        self,
+        processor,
+        model,
+        device,
+        pairs: Sequence[Tuple[Image.Image, str]],
+        batch_size: int = 8,
+        image_tokens: Optional[int] = None,
+    ) -> List[float]:
+        from llava_quant import score_yes_no
+
+        def compute(indices: List[int]) -> List[object]:
+            subset = [pairs[idx] for idx in indices]
+            return score_yes_no(processor, model, device, subset, batch_size=batch_size, image_tokens=image_tokens)
+
+        return self.cached(budget_kind("logprob", image_tokens), pairs, 0, compute)  # type: ignore[return-value]
+
+    def stats(self) -> Dict[str, object]:
+        counters = dict(self.conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "size_mb": round(size / (1024 * 1024), 3),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 3),
+            "session_hits": self.hits,
+            "session_misses": self.misses,
+            "total_hits": counters.get("hits", 0),
+            "total_misses": counters.get("misses", 0),
+            "total_evicted": counters.get("evicted", 0),
+        }
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM entries")
+        self.conn.execute("DELETE FROM counters")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or clear the LLaVA inference cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH)
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parents[1]
+    path = Path(args.path)
+    if not path.is_absolute():
+        path = project_root / path
+    if not path.exists():
+        print(f"Cache not found: {path}")
+        return
+    cache = InferenceCache(path, model_dir="", quant="")
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {path}")
+    else:
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
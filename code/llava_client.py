@@ -0,0 +1,184 @@
+"""Drop-in client for a running ``llava_server.py``.
+
+``build()`` returns ``(processor, model, device)`` like ``llava_quant.build`` but the model is a
+``RemoteLlava`` handle; ``llava_quant.infer`` / ``infer_batch`` / ``score_yes_no`` recognise the handle
+and forward the call to the server, so callers keep their existing code paths:
+
+  python code/llava_server.py --model-dir models/llava-1.5-7b-hf --quant 4bit
+  python code/run_mfa_ffpp.py --server http://127.0.0.1:8765 ...
+
+``LLAVA_SERVER`` in the environment is used when no URL is passed explicitly.
+"""
+from __future__ import annotations
+
+import base64
+import io
+import json
+import os
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+SERVER_ENV = "LLAVA_SERVER"
+
+
+class ServerError(RuntimeError):
+    """Raised when the server is unreachable or reports a failed request."""
+
+
+def encode_image(image: Image.Image) -> str:
+    """PNG keeps pixels exact, so server-side cache keys match local ones."""
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def decode_image(data: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(data))).convert("RGB")
+
+
+def resolve_url(server: Optional[str] = None) -> str:
+    return (server or os.environ.get(SERVER_ENV) or DEFAULT_URL).rstrip("/")
+
+
+class RemoteLlava:
+    """Model handle backed by a ``llava_server.py`` process.
+
+    ``last_timing`` holds the server-side queueing / compute latency of the latest request.
+    """
+
+    is_remote = True
+
+    def __init__(self, url: str, timeout: float = 600.0) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.last_timing: Dict[str, Any] = {}
+        self.info = self.request("GET", "/health")
+
+    def request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(
+            self.url + path,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                body = json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as err:
+            detail = err.read().decode("utf-8", errors="replace")
+            raise ServerError(f"{path} failed ({err.code}): {detail}") from err
+        except urllib.error.URLError as err:
+            raise ServerError(f"LLaVA server not reachable at {self.url}: {err.reason}") from err
+        self.last_timing = {k: body[k] for k in ("queue_ms", "compute_ms", "batch_items", "elapsed_sec") if k in body}
+        return body
+
+    def infer_batch(
+        self,
+        pairs: Sequence[Tuple[Image.Image, str]],
+        max_new_tokens: int,
+        batch_size: int = 8,
+        stop_on_verdict: bool = False,
+        rationale_tokens: int = 0,
+        **generate_kwargs,
+    ) -> List[str]:
+        body = self.request(
+            "POST",
+            "/infer_batch",
+            {
+                "pairs": [{"image": encode_image(image), "prompt": prompt} for image, prompt in pairs],
+                "max_new_tokens": max_new_tokens,
+                "batch_size": batch_size,
+                "stop_on_verdict": stop_on_verdict,
+                "rationale_tokens": rationale_tokens,
+                "generate_kwargs": generate_kwargs,
+            },
+        )
+        return body["answers"]
+
+    def score_yes_no(self, pairs: Sequence[Tuple[Image.Image, str]], batch_size: int = 8) -> List[float]:
+        body = self.request(
+            "POST",
+            "/score_yes_no",
+            {
+                "pairs": [{"image": encode_image(image), "prompt": prompt} for image, prompt in pairs],
+                "batch_size": batch_size,
+            },
+        )
+        return body["scores"]
+
+
+def build(
+    model_dir: str,
+    quant: str = "4bit",
+    max_new_tokens: int = 64,
+    force_cpu: bool = False,
+    quant_cache: Optional[str] = None,
+    cpu_bf16: bool = False,
+    server: Optional[str] = None,
+):
+    """Connect instead of loading; the load options only serve as a consistency check."""
+    model = RemoteLlava(resolve_url(server))
+    served = model.info
+    if model_dir and os.path.abspath(model_dir) != served.get("model_dir"):
+        print(f"[WARN] Server holds {served.get('model_dir')}, requested {model_dir}")
+    requested = quant + ("+bf16" if cpu_bf16 else "")
+    if requested != served.get("quant"):
+        print(f"[WARN] Server quantisation is {served.get('quant')}, requested {requested}")
+    print(f"[INFO] Using LLaVA server {model.url} ({served.get('device')})")
+    return None, model, "remote"
+
+
+def infer(
+    processor,
+    model: RemoteLlava,
+    device,
+    image: Image.Image,
+    question: str,
+    max_new_tokens: int,
+    stop_on_verdict: bool = False,
+    rationale_tokens: int = 0,
+) -> str:
+    return model.infer_batch(
+        [(image, question)],
+        max_new_tokens,
+        stop_on_verdict=stop_on_verdict,
+        rationale_tokens=rationale_tokens,
+    )[0]
+
+
+def infer_batch(
+    processor,
+    model: RemoteLlava,
+    device,
+    pairs: Sequence[Tuple[Image.Image, str]],
+    max_new_tokens: int,
+    batch_size: int = 8,
+    stop_on_verdict: bool = False,
+    rationale_tokens: int = 0,
+    **generate_kwargs,
+) -> List[str]:
+    return model.infer_batch(
+        pairs,
+        max_new_tokens,
+        batch_size=batch_size,
+        stop_on_verdict=stop_on_verdict,
+        rationale_tokens=rationale_tokens,
+        **generate_kwargs,
+    )
+
+
+def score_yes_no(
+    processor,
+    model: RemoteLlava,
+    device,
+    pairs: Sequence[Tuple[Image.Image, str]],
+    batch_size: int = 8,
+) -> List[float]:
+    return model.score_yes_no(pairs, batch_size=batch_size)
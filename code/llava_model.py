@@ -5,67 +5,111 @@ LLaVA 模型集成模块
 
 from __future__ import annotations
 
-from typing import Dict, List
+import os
+from typing import Dict, List, Optional
 
-import torch
-from transformers import LlavaForConditionalGeneration, LlavaProcessor
 from PIL import Image
 import warnings
 
+from llava_quant import infer_batch
+
 warnings.filterwarnings("ignore")
 
 
 class LLaVADetector:
     """LLaVA 深度伪造检测器"""
 
-    def __init__(self, model_path: str = "llava-hf/llava-1.5-7b-hf") -> None:
+    def __init__(
+        self,
+        model_path: str = "llava-hf/llava-1.5-7b-hf",
+        batch_size: int = 4,
+        server: Optional[str] = None,
+        quant: str = "none",
+        cpu_bf16: bool = False,
+    ) -> None:
         """初始化 LLaVA 模型
 
         Args:
             model_path: HuggingFace 模型名称或本地模型路径
+            batch_size: 批量提问时每次 generate 合并的问题数
+            server: 已运行的 llava_server.py 地址; 为空时读取环境变量 LLAVA_SERVER, 都没有则本地加载
+            quant: 量化方式 (同 llava_quant.QUANT_CHOICES)
+            cpu_bf16: CPU 推理时启用 bf16 autocast
+
+        本地模型经 llava_registry 加载, 与 llava_quant.build 共享同一份权重; 不再使用时调用 close()。
         """
         self.model_path = model_path
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"使用设备: {self.device}")
+        self.batch_size = batch_size
+        server = server or os.environ.get("LLAVA_SERVER")
+        if server:
+            from llava_client import build as connect
 
+            self.processor, self.model, self.device = connect(model_path, quant="none", server=server)
+            return
         try:
+            from llava_registry import acquire
+
             print("正在加载 LLaVA 模型...")
-            self.processor = LlavaProcessor.from_pretrained(model_path)
-            self.model = LlavaForConditionalGeneration.from_pretrained(
-                model_path,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                low_cpu_mem_usage=True,
-            )
-            self.model.to(self.device)
-            print("LLaVA 模型加载完成")
+            self.processor, self.model, self.device = acquire(model_path, quant=quant, cpu_bf16=cpu_bf16)
+            print(f"LLaVA 模型加载完成, 使用设备: {self.device}")
         except Exception as err:  # pragma: no cover
             print(f"加载 LLaVA 模型失败: {err}")
             raise
 
-    def analyze_image(self, image: Image.Image, question: str) -> str:
-        """分析图像并回答问题"""
+    def close(self) -> None:
+        """释放对共享模型的引用 (最后一个持有者释放时卸载权重)"""
+        from llava_registry import release
+
+        if getattr(self, "model", None) is not None:
+            release(self.model)
+            self.model = None
+
+    def analyze_image(
+        self,
+        image: Image.Image,
+        question: str,
+        stop_on_verdict: bool = False,
+        rationale_tokens: int = 0,
+    ) -> str:
+        """分析图像并回答问题
+
+        Args:
+            stop_on_verdict: 是/否 (yes/no) 结论可解析后即停止生成
+            rationale_tokens: 结论之后额外保留的解释 token 数
+        """
         try:
-            prompt = f"USER: <image>\n{question}\nASSISTANT:"
-            inputs = self.processor(text=prompt, images=image, return_tensors="pt")
-            inputs = {key: value.to(self.device) for key, value in inputs.items()}
-
-            with torch.no_grad():
-                output = self.model.generate(
-                    **inputs,
-                    max_new_tokens=200,
-                    do_sample=True,
-                    temperature=0.7,
-                    pad_token_id=self.processor.tokenizer.eos_token_id,
-                )
-
-            generated_text = self.processor.decode(output[0], skip_special_tokens=True)
-            if "ASSISTANT:" in generated_text:
-                return generated_text.split("ASSISTANT:")[-1].strip()
-            return generated_text.strip()
+            return infer_batch(
+                self.processor,
+                self.model,
+                self.device,
+                [(image, question)],
+                max_new_tokens=200,
+                stop_on_verdict=stop_on_verdict,
+                rationale_tokens=rationale_tokens,
+                do_sample=True,
+                temperature=0.7,
+            )[0]
         except Exception as err:
             print(f"图像分析失败: {err}")
             return "分析失败"
 
+    def analyze_batch(self, image: Image.Image, questions: List[str], batch_size: Optional[int] = None) -> List[str]:
+        """对同一张图像批量提问, 按顺序返回回答"""
+        try:
+            return infer_batch(
+                self.processor,
+                self.model,
+                self.device,
+                [(image, question) for question in questions],
+                max_new_tokens=200,
+                batch_size=batch_size or self.batch_size,
+                do_sample=True,
+                temperature=0.7,
+            )
+        except Exception as err:
+            print(f"图像分析失败: {err}")
+            return ["分析失败"] * len(questions)
+
     def detect_deepfake_basic(self, image: Image.Image | str) -> Dict[str, Dict[str, str]]:
         """执行基础深度伪造检测"""
         if isinstance(image, str):
@@ -90,7 +134,12 @@ class LLaVADetector:
             results[f"question_{idx}"] = {"question": question, "answer": answer}
         return results
 
-    def assess_features(self, image: Image.Image | str, features: List[str]) -> Dict[str, Dict[str, str]]:
+    def assess_features(
+        self,
+        image: Image.Image | str,
+        features: List[str],
+        batch_size: Optional[int] = None,
+    ) -> Dict[str, Dict[str, str]]:
         """评估图像的特定特征"""
         if isinstance(image, str):
             from .image_utils import ImageProcessor
@@ -101,10 +150,10 @@ class LLaVADetector:
         if image is None:
             return {"error": "无法加载图像"}  # type: ignore[return-value]
 
+        questions = [f"这张图片中的{feature}看起来自然吗？请给出是或否的回答并简单说明原因" for feature in features]
+        answers = self.analyze_batch(image, questions, batch_size=batch_size)
         feature_results: Dict[str, Dict[str, str]] = {}
-        for feature in features:
-            question = f"这张图片中的{feature}看起来自然吗？请给出是或否的回答并简单说明原因"
-            answer = self.analyze_image(image, question)
+        for feature, question, answer in zip(features, questions, answers):
             feature_results[feature] = {"question": question, "answer": answer}
         return feature_results
 
@@ -0,0 +1,315 @@
+"""Multi-replica CPU inference pool with memory-mapped, page-cache-shared weights.
+
+A single process stops scaling well before the core count of a large node, while loading N
+independent copies of the 7B model needs N times the RAM. ``ReplicaPool`` starts N worker
+processes pinned to disjoint core sets (``os.sched_setaffinity``, Linux). Each worker maps the
+``*.safetensors`` files copy-on-write and builds its parameters directly on the mapped pages,
+so all replicas read the same physical memory through the page cache.
+
+The pool is a drop-in model handle: ``build()`` returns ``(None, pool, "pool")`` and
+``llava_quant.infer_batch`` / ``score_yes_no`` forward to it. A call is split into chunks of
+``batch_size`` pairs that are dispatched round-robin or to the least-loaded replica, then
+reassembled in order.
+
+Sharing only holds while weights stay in their stored dtype. Asking for another dtype, or
+for int8 quantisation, gives every replica a private copy. Save a converted checkpoint instead.
+
+  python code/llava_pool.py --model-dir models/llava-1.5-7b-hf --replicas 4 --image data/test_images/real_face_1.jpg
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import mmap
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import torch
+from PIL import Image
+
+DISPATCH_CHOICES = ("least-loaded", "round-robin")
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+DTYPE_CHOICES = {"auto": None, "float32": torch.float32, "bfloat16": torch.bfloat16, "float16": torch.float16}
+
+
+def mmap_safetensors(path: Path) -> Dict[str, torch.Tensor]:
+    """Tensors backed by a copy-on-write mapping of ``path``; nothing is read until touched."""
+    with path.open("rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    base = 8 + header_len
+    tensors: Dict[str, torch.Tensor] = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        flat = torch.frombuffer(mapped, dtype=dtype, count=count, offset=base + start)
+        tensors[name] = flat.view(info["shape"])
+    return tensors
+
+
+def load_shared_model(model_dir: str, dtype: Optional[torch.dtype] = None):
+    """Build LlavaForConditionalGeneration on top of mapped weights (no random init, no copy)."""
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig, LlavaForConditionalGeneration
+
+    files = sorted(Path(model_dir).glob("*.safetensors"))
+    if not files:
+        raise FileNotFoundError(f"no *.safetensors in {model_dir}; shared loading needs safetensors weights")
+    state: Dict[str, torch.Tensor] = {}
+    for path in files:
+        state.update(mmap_safetensors(path))
+    stored = {t.dtype for t in state.values() if t.is_floating_point()}
+    if dtype is not None and stored != {dtype}:
+        print(f"[WARN] Weights stored as {sorted(map(str, stored))}, converting to {dtype}: replicas will not share memory")
+        state = {k: v.to(dtype) if v.is_floating_point() else v for k, v in state.items()}
+
+    config = AutoConfig.from_pretrained(model_dir)
+    with init_empty_weights(include_buffers=False):
+        model = LlavaForConditionalGeneration(config)
+    model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise RuntimeError(f"weights missing from {model_dir}: {missing[:5]}")
+    return model.eval()
+
+
+def core_sets(replicas: int, cores: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """Split the available cores into ``replicas`` contiguous, disjoint groups."""
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    cores = list(cores)
+    if replicas > len(cores):
+        print(f"[WARN] {replicas} replicas on {len(cores)} cores: core sets will overlap")
+        return [[cores[i % len(cores)]] for i in range(replicas)]
+    size, extra = divmod(len(cores), replicas)
+    groups, start = [], 0
+    for i in range(replicas):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def _worker_main(index, model_dir, cores, dtype_name, cpu_bf16, requests, results) -> None:
+    from llava_quant import build_processor, enable_cpu_bf16, infer_batch, score_yes_no
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(max(1, len(cores)))
+    try:
+        processor = build_processor(model_dir)
+        model = load_shared_model(model_dir, DTYPE_CHOICES[dtype_name])
+        if cpu_bf16:
+            enable_cpu_bf16(model, include_language_model=True)
+    except Exception as err:
+        results.put((None, index, False, f"{type(err).__name__}: {err}"))
+        return
+    results.put((None, index, True, None))
+    device = torch.device("cpu")
+    while True:
+        message = requests.get()
+        if message is None:
+            return
+        job_id, op, pairs, kwargs = message
+        try:
+            if op == "score":
+                value = score_yes_no(processor, model, device, pairs, **kwargs)
+            else:
+                value = infer_batch(processor, model, device, pairs, **kwargs)
+            results.put((job_id, index, True, value))
+        except Exception as err:
+            results.put((job_id, index, False, f"{type(err).__name__}: {err}"))
+
+
+class ReplicaPool:
+    """Worker processes sharing one set of mapped weights; usable wherever a model handle is expected."""
+
+    is_remote = True
+
+    def __init__(
+        self,
+        model_dir: str,
+        replicas: int = 2,
+        dispatch: str = "least-loaded",
+        dtype: str = "auto",
+        cpu_bf16: bool = False,
+        cores: Optional[Sequence[int]] = None,
+        timeout: float = 600.0,
+    ) -> None:
+        if dispatch not in DISPATCH_CHOICES:
+            raise ValueError(f"dispatch must be one of {DISPATCH_CHOICES}")
+        self.model_dir = model_dir
+        self.dispatch = dispatch
+        self.groups = core_sets(replicas, cores)
+        ctx = mp.get_context("spawn")
+        self.results = ctx.Queue()
+        self.requests = [ctx.Queue() for _ in self.groups]
+        self.workers = [
+            ctx.Process(
+                target=_worker_main,
+                args=(i, model_dir, group, dtype, cpu_bf16, self.requests[i], self.results),
+                daemon=True,
+            )
+            for i, group in enumerate(self.groups)
+        ]
+        self.load = [0] * len(self.groups)
+        self.served = [0] * len(self.groups)
+        self.pending: Dict[int, Tuple[Future, int]] = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.rr = itertools.cycle(range(len(self.groups)))
+        start = time.time()
+        for worker in self.workers:
+            worker.start()
+        ready = 0
+        while ready < len(self.workers):
+            job_id, index, ok, detail = self.results.get(timeout=timeout)
+            if not ok:
+                self.close()
+                raise RuntimeError(f"replica {index} failed to load: {detail}")
+            ready += 1
+        print(f"[OK] {len(self.workers)} replicas ready in {time.time() - start:.1f}s, cores {self.groups}")
+        self.collector = threading.Thread(target=self._collect, name="llava-pool", daemon=True)
+        self.collector.start()
+
+    def _collect(self) -> None:
+        while True:
+            message = self.results.get()
+            if message is None:
+                return
+            job_id, index, ok, value = message
+            with self.lock:
+                future, _ = self.pending.pop(job_id)
+                self.load[index] -= 1
+                self.served[index] += 1
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(f"replica {index}: {value}"))
+
+    def _pick(self) -> int:
+        if self.dispatch == "round-robin":
+            return next(self.rr)
+        return min(range(len(self.load)), key=lambda i: self.load[i])
+
+    def submit(self, op: str, pairs: Sequence[Tuple[Image.Image, str]], **kwargs) -> Future:
+        future: Future = Future()
+        with self.lock:
+            index = self._pick()
+            job_id = next(self.ids)
+            self.pending[job_id] = (future, index)
+            self.load[index] += 1
+        self.requests[index].put((job_id, op, list(pairs), kwargs))
+        return future
+
+    def _map(self, op: str, pairs: Sequence[Tuple[Image.Image, str]], batch_size: int, **kwargs) -> List[Any]:
+        batch_size = max(1, int(batch_size))
+        futures = [
+            self.submit(op, pairs[i : i + batch_size], batch_size=batch_size, **kwargs)
+            for i in range(0, len(pairs), batch_size)
+        ]
+        return [value for future in futures for value in future.result()]
+
+    def infer_batch(
+        self,
+        pairs: Sequence[Tuple[Image.Image, str]],
+        max_new_tokens: int,
+        batch_size: int = 8,
+        stop_on_verdict: bool = False,
+        rationale_tokens: int = 0,
+        **generate_kwargs,
+    ) -> List[str]:
+        return self._map(
+            "infer",
+            pairs,
+            batch_size,
+            max_new_tokens=max_new_tokens,
+            stop_on_verdict=stop_on_verdict,
+            rationale_tokens=rationale_tokens,
+            **generate_kwargs,
+        )
+
+    def score_yes_no(self, pairs: Sequence[Tuple[Image.Image, str]], batch_size: int = 8) -> List[float]:
+        return self._map("score", pairs, batch_size)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"replicas": len(self.workers), "cores": self.groups, "in_flight": list(self.load), "served": list(self.served)}
+
+    def close(self) -> None:
+        for queue in self.requests:
+            queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        if getattr(self, "collector", None) is not None:
+            self.results.put(None)
+            self.collector.join()
+
+
+def build(
+    model_dir: str,
+    replicas: int = 2,
+    dispatch: str = "least-loaded",
+    dtype: str = "auto",
+    cpu_bf16: bool = False,
+):
+    """Same return shape as ``llava_quant.build``; the model slot holds the pool."""
+    pool = ReplicaPool(model_dir, replicas=replicas, dispatch=dispatch, dtype=dtype, cpu_bf16=cpu_bf16)
+    return None, pool, "pool"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Start a LLaVA replica pool and run a quick check")
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--dispatch", choices=DISPATCH_CHOICES, default="least-loaded")
+    parser.add_argument("--dtype", choices=list(DTYPE_CHOICES), default="auto")
+    parser.add_argument("--cpu-bf16", action="store_true")
+    parser.add_argument("--image", default="data/test_images/real_face_1.jpg")
+    parser.add_argument("--question", default="Is this face fake? Please answer yes or no.")
+    parser.add_argument("--copies", type=int, default=8, help="Identical requests to spread over the replicas")
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert("RGB")
+    _, pool, _ = build(args.model_dir, args.replicas, args.dispatch, args.dtype, args.cpu_bf16)
+    try:
+        start = time.time()
+        answers = pool.infer_batch([(image, args.question)] * args.copies, args.max_new_tokens, batch_size=1)
+        elapsed = time.time() - start
+        print(f"[INFO] {args.copies} requests in {elapsed:.2f}s ({args.copies / elapsed:.2f}/s)")
+        print(f"[INFO] First answer: {answers[0]}")
+        print(json.dumps(pool.stats()))
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
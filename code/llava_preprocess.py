@@ -0,0 +1,89 @@
+"""Vectorised CLIP preprocessing.
+
+``preprocess_images`` reproduces ``CLIPImageProcessor`` (convert RGB, bicubic resize of the
+shortest edge, centre crop, rescale, normalise). Only the resize runs per image, in PIL. Rescale
+and normalise become one lookup of the stacked uint8 batch in a 3x256 table, so the result is
+bit-identical to the processor without per-image float64 passes.
+
+Callers preprocess each frame once (run_mfa_ffpp.load_video) and pass the tensor to
+``llava_quant.infer_batch`` / ``score_yes_no`` / ``prepare_image_prefix`` through ``pixel_values=``,
+so every question asked about a frame reuses it.
+"""
+from __future__ import annotations
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+def _size_of(image_processor) -> Tuple[Optional[int], Optional[Tuple[int, int]]]:
+    size = image_processor.size if image_processor.do_resize else None
+    shortest = size.get("shortest_edge") if isinstance(size, dict) else None
+    crop = None
+    if image_processor.do_center_crop:
+        crop_size = image_processor.crop_size
+        crop = (crop_size["height"], crop_size["width"])
+    return shortest, crop
+
+
+def supports_fast_path(image_processor) -> bool:
+    """Only plain CLIP settings are reimplemented; anything else falls back to the processor."""
+    size = getattr(image_processor, "size", None)
+    return (
+        type(image_processor).__name__ == "CLIPImageProcessor"
+        and (not image_processor.do_resize or (isinstance(size, dict) and "shortest_edge" in size))
+        and image_processor.do_rescale
+        and image_processor.do_normalize
+    )
+
+
+def _resize_crop(image: Image.Image, shortest: Optional[int], crop: Optional[Tuple[int, int]], resample) -> Optional[np.ndarray]:
+    if shortest is not None:
+        width, height = image.size
+        short, long = (width, height) if width <= height else (height, width)
+        new_short, new_long = shortest, int(shortest * long / short)
+        new_size = (new_short, new_long) if width <= height else (new_long, new_short)
+        if new_size != image.size:
+            image = image.resize(new_size, resample=resample, reducing_gap=None)
+    array = np.asarray(image)
+    if crop is not None:
+        crop_h, crop_w = crop
+        height, width = array.shape[:2]
+        if crop_h > height or crop_w > width:
+            return None  # CLIPImageProcessor pads here; leave that case to it
+        top, left = (height - crop_h) // 2, (width - crop_w) // 2
+        array = array[top : top + crop_h, left : left + crop_w]
+    return array
+
+
+def preprocess_images(images: Sequence[Image.Image], image_processor) -> torch.Tensor:
+    """``pixel_values`` (N, 3, H, W) float32 for ``images``; matches ``image_processor(images)``."""
+    if not images:
+        raise ValueError("no images to preprocess")
+    if not supports_fast_path(image_processor):
+        return image_processor(list(images), return_tensors="pt")["pixel_values"]
+    shortest, crop = _size_of(image_processor)
+    arrays = []
+    for image in images:
+        array = _resize_crop(image.convert("RGB"), shortest, crop, image_processor.resample)
+        if array is None:
+            return image_processor(list(images), return_tensors="pt")["pixel_values"]
+        arrays.append(array)
+    if len({a.shape for a in arrays}) != 1:
+        return image_processor(list(images), return_tensors="pt")["pixel_values"]
+    batch = np.stack(arrays)
+    lut = normalize_table(image_processor)
+    out = np.empty((batch.shape[0], 3) + batch.shape[1:3], dtype=np.float32)
+    for channel in range(3):
+        np.take(lut[channel], batch[..., channel], out=out[:, channel])
+    return torch.from_numpy(out)
+
+
+def normalize_table(image_processor) -> np.ndarray:
+    """(3, 256) float32: rescale + normalise of every uint8 value, same arithmetic as the processor."""
+    values = (np.arange(256, dtype=np.float64) * image_processor.rescale_factor).astype(np.float32)
+    mean = np.asarray(image_processor.image_mean, dtype=np.float32)
+    std = np.asarray(image_processor.image_std, dtype=np.float32)
+    return (values[None, :] - mean[:, None]) / std[:, None]
@@ -0,0 +1,276 @@
+"""Opt-in stage-level latency profiler for LLaVA calls.
+
+``LlavaProfiler.attach`` installs hooks on the image processor, the vision tower / projector and
+the language model. Each profiled call (``with profiler.call("infer_batch", items=n): ...``)
+appends one JSONL record with:
+
+  preprocess_ms  image preprocessing (resize / crop / normalise)
+  vision_ms      vision tower + multimodal projector
+  prefill_ms     language-model forwards over more than one position
+  decode_ms      single-position language-model forwards (one per generated token)
+  other_ms       remainder of the call (tokenisation, text decoding, generation bookkeeping)
+  decode_steps / generated_tokens / peak_rss_mb
+
+``generated_tokens`` counts one token per batch row per language-model forward, including rows
+that already finished (0 for scoring calls); ``peak_rss_mb`` is the process high-water mark when the call ended.
+
+Work that runs outside any call, such as run_mfa_ffpp preprocessing frames with
+``llava_preprocess.preprocess_images`` on its prefetch threads, is timed with ``measure``. It
+becomes a record of its own op (``preprocess_images``), with the time under its stage.
+
+CLI:
+  python code/llava_profile.py summarize mfa/profile/llava_trace.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+STAGES = ("preprocess_ms", "vision_ms", "prefill_ms", "decode_ms", "other_ms", "wall_ms")
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes on macOS, KiB on Linux
+    return round(peak / scale, 1)
+
+
+def _seq_len(args, kwargs) -> int:
+    for name in ("inputs_embeds", "input_ids"):
+        value = kwargs.get(name)
+        if value is not None:
+            return int(value.shape[1])
+    if args and hasattr(args[0], "shape") and len(args[0].shape) >= 2:
+        return int(args[0].shape[1])
+    return 1
+
+
+class LlavaProfiler:
+    """Accumulates per-stage time between ``call`` boundaries and writes one record per call."""
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.handle = self.path.open("a", encoding="utf-8")
+        self.sync = None
+        self.handles: List[object] = []
+        self.lock = threading.Lock()  # measure() writes from other threads
+        self._reset()
+
+    def _reset(self) -> None:
+        self.totals: Dict[str, float] = defaultdict(float)
+        self.decode_steps = 0
+        self.tokens = 0
+        self._lm_stage = "prefill_ms"
+        self._starts: Dict[str, float] = {}
+
+    def _now(self) -> float:
+        if self.sync is not None:
+            self.sync()
+        return time.perf_counter()
+
+    def _start(self, stage: str) -> None:
+        self._starts[stage] = self._now()
+
+    def _stop(self, stage: str) -> None:
+        start = self._starts.pop(stage, None)
+        if start is not None:
+            self.totals[stage] += (self._now() - start) * 1000.0
+
+    def attach(self, processor, model) -> "LlavaProfiler":
+        """Install timing hooks; ``detach`` removes them."""
+        import torch
+
+        if torch.cuda.is_available() and any(p.is_cuda for p in model.parameters()):
+            self.sync = torch.cuda.synchronize
+
+        image_processor = getattr(processor, "image_processor", None)
+        if image_processor is not None and hasattr(image_processor, "preprocess"):
+            original = image_processor.preprocess
+
+            def preprocess(*args, **kwargs):
+                self._start("preprocess_ms")
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self._stop("preprocess_ms")
+
+            image_processor.preprocess = preprocess
+            self.handles.append(lambda: delattr(image_processor, "preprocess"))
+
+        for name in ("vision_tower", "multi_modal_projector"):
+            module = getattr(model, name, None)
+            if module is None:
+                continue
+            self.handles.append(module.register_forward_pre_hook(lambda *_: self._start("vision_ms")))
+            self.handles.append(module.register_forward_hook(lambda *_: self._stop("vision_ms")))
+
+        language_model = getattr(model, "language_model", None)
+        if language_model is not None:
+
+            def lm_pre(module, args, kwargs):
+                stage = "prefill_ms" if _seq_len(args, kwargs) > 1 else "decode_ms"
+                if stage == "decode_ms":
+                    self.decode_steps += 1
+                rows = kwargs.get("inputs_embeds")
+                if rows is None:
+                    rows = kwargs.get("input_ids")
+                self.tokens += int(rows.shape[0]) if rows is not None else 1  # one next token per row
+                self._lm_stage = stage
+                self._start(stage)
+
+            def lm_post(module, args, kwargs, output):
+                self._stop(self._lm_stage)
+
+            self.handles.append(language_model.register_forward_pre_hook(lm_pre, with_kwargs=True))
+            self.handles.append(language_model.register_forward_hook(lm_post, with_kwargs=True))
+        return self
+
+    def detach(self) -> None:
+        for handle in self.handles:
+            if callable(handle):
+                handle()
+            else:
+                handle.remove()
+        self.handles = []
+
+    @contextmanager
+    def call(self, op: str, items: int = 1, generate: bool = True, **extra) -> Iterator[None]:
+        """Profile everything run inside the block as one record."""
+        self._reset()
+        start = self._now()
+        try:
+            yield
+        finally:
+            wall = (self._now() - start) * 1000.0
+            staged = sum(self.totals[s] for s in ("preprocess_ms", "vision_ms", "prefill_ms", "decode_ms"))
+            record = {
+                "ts": round(time.time(), 3),
+                "op": op,
+                "items": items,
+                "wall_ms": round(wall, 3),
+                **{stage: round(self.totals[stage], 3) for stage in STAGES[:4]},
+                "other_ms": round(max(0.0, wall - staged), 3),
+                "decode_steps": self.decode_steps,
+                "generated_tokens": self.tokens if generate else 0,
+                "peak_rss_mb": peak_rss_mb(),
+                **extra,
+            }
+            self._write(record)
+
+    @contextmanager
+    def measure(self, op: str, stage: str = "preprocess_ms", items: int = 1, **extra) -> Iterator[None]:
+        """Time a block that runs outside ``call`` (any thread) as one record of ``op`` with all its time in ``stage``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = round((time.perf_counter() - start) * 1000.0, 3)
+            record = {
+                "ts": round(time.time(), 3),
+                "op": op,
+                "items": items,
+                "wall_ms": elapsed,
+                **{name: 0.0 for name in STAGES[:5]},
+                stage: elapsed,
+                "decode_steps": 0,
+                "generated_tokens": 0,
+                "peak_rss_mb": peak_rss_mb(),
+                **extra,
+            }
+            self._write(record)
+
+    def _write(self, record: Dict[str, object]) -> None:
+        with self.lock:
+            self.handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.handle.flush()
+
+    def close(self) -> None:
+        self.detach()
+        self.handle.close()
+
+
+def load_trace(paths: Sequence[Path]) -> List[Dict[str, object]]:
+    records: List[Dict[str, object]] = []
+    for path in paths:
+        with path.open("r", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def summarize(records: Sequence[Dict[str, object]]) -> Dict[str, Dict[str, object]]:
+    """p50 / p95 / mean per stage, grouped by op, plus each stage's share of wall time."""
+    groups: Dict[str, List[Dict[str, object]]] = defaultdict(list)
+    for record in records:
+        groups[str(record.get("op", "?"))].append(record)
+    summary: Dict[str, Dict[str, object]] = {}
+    for op, rows in sorted(groups.items()):
+        wall_total = sum(float(r.get("wall_ms", 0.0)) for r in rows) or 1.0
+        stages: Dict[str, Dict[str, float]] = {}
+        for stage in STAGES:
+            values = np.array([float(r.get(stage, 0.0)) for r in rows])
+            stages[stage] = {
+                "p50": round(float(np.percentile(values, 50)), 3),
+                "p95": round(float(np.percentile(values, 95)), 3),
+                "mean": round(float(values.mean()), 3),
+                "share": round(float(values.sum()) / wall_total, 4),
+            }
+        tokens = sum(int(r.get("generated_tokens", 0)) for r in rows)
+        decode_total = sum(float(r.get("decode_ms", 0.0)) for r in rows)
+        rss = [float(r["peak_rss_mb"]) for r in rows if r.get("peak_rss_mb") is not None]
+        summary[op] = {
+            "calls": len(rows),
+            "items": sum(int(r.get("items", 0)) for r in rows),
+            "stages": stages,
+            "generated_tokens": tokens,
+            "decode_ms_per_step": round(
+                decode_total / max(1, sum(int(r.get("decode_steps", 0)) for r in rows)), 3
+            ),
+            "peak_rss_mb": max(rss) if rss else None,
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict[str, object]]) -> None:
+    for op, info in summary.items():
+        print(f"== {op}: {info['calls']} calls, {info['items']} items, {info['generated_tokens']} tokens")
+        print(f"   {'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'share':>8}")
+        for stage, stats in info["stages"].items():  # type: ignore[union-attr]
+            print(f"   {stage:<14}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['mean']:>10.1f}{stats['share']:>8.1%}")
+        print(f"   decode ms/step {info['decode_ms_per_step']}, peak RSS {info['peak_rss_mb']} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarise LLaVA profiler traces")
+    parser.add_argument("command", choices=["summarize"])
+    parser.add_argument("traces", nargs="+", help="JSONL trace files written by LlavaProfiler")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = summarize(load_trace([Path(p) for p in args.traces]))
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,21 @@
   2. 安装 CUDA 版 torch 与 bitsandbytes (Windows 原生可能不稳定, 若失败可用 WSL)
   3. 运行示例:
      python code/llava_quant.py --model-dir models/llava-1.5-7b-hf --quant 4bit --image data/test_images/real_face_1.jpg
+  4. 无 GPU 时可用 CPU int8 动态量化 (可缓存量化结果, 可叠加 bf16 autocast):
+     python code/llava_quant.py --model-dir models/llava-1.5-7b-hf --quant cpu-int8 --quant-cache models/llava-1.5-7b-hf-cpu-int8.pt --cpu-bf16
+  5. 多次运行时可先启动常驻推理服务, 模型只加载一次:
+     python code/llava_server.py --model-dir models/llava-1.5-7b-hf --quant 4bit
+     python code/llava_quant.py --model-dir models/llava-1.5-7b-hf --quant 4bit --server http://127.0.0.1:8765
+  6. 视觉 token 预算模式: 图像特征池化到 144 / 64 个 token, prefill 更短, 适合批量初筛:
+     python code/llava_quant.py --model-dir models/llava-1.5-7b-hf --quant 4bit --image-tokens 144
 
 若量化条件不满足会自动回退 FP16 / CPU。
 """
 from __future__ import annotations
-import argparse, os, sys, time
-from typing import Optional
+import argparse, json, os, re, sys, time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 os.environ.setdefault("USE_SLOW_TOKENIZERS", "1")
 os.environ.setdefault("TRANSFORMERS_USE_FAST_TOKENIZER", "0")
@@ -22,7 +31,13 @@ from transformers import (
     CLIPImageProcessor,
     LlavaForConditionalGeneration,
     LlavaProcessor,
+    StoppingCriteria,
+    StoppingCriteriaList,
 )
+try:
+    from transformers import DynamicCache  # type: ignore
+except Exception:  # 旧版 transformers 只有 tuple 形式的 cache
+    DynamicCache = None
 try:
     from transformers import BitsAndBytesConfig  # type: ignore
     BNB_AVAILABLE = True
@@ -37,13 +52,137 @@ def load_image(path: str) -> Optional[Image.Image]:
         print(f"[ERR] 加载图像失败: {e}")
         return None
 
-def build(model_dir: str, quant: str, max_new_tokens: int, force_cpu: bool):
-    has_cuda = torch.cuda.is_available() and not force_cpu
+QUANT_CHOICES = ['none', '4bit', '8bit', 'cpu-int8']
+
+class _CpuAutocast(torch.nn.Module):
+    """在 CPU bf16 autocast 下运行被包装的子模块, 输出中的 bf16 张量转回 float32。"""
+
+    def __init__(self, module: torch.nn.Module) -> None:
+        super().__init__()
+        self.module = module
+
+    def __getattr__(self, name: str):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(self.module, name)
+
+    def forward(self, *args, **kwargs):
+        with torch.autocast('cpu', dtype=torch.bfloat16):
+            out = self.module(*args, **kwargs)
+        return _to_float32(out)
+
+def _to_float32(value):
+    if torch.is_tensor(value):
+        return value.float() if value.dtype == torch.bfloat16 else value
+    if isinstance(value, dict):  # transformers ModelOutput 也是 dict
+        for key in list(value.keys()):
+            value[key] = _to_float32(value[key])
+        return value
+    if isinstance(value, (tuple, list)):
+        return type(value)(_to_float32(v) for v in value)
+    return value
+
+def _language_parts(model):
+    """返回 (decoder 层容器, 拥有 lm_head 的模块), 兼容新旧 transformers 的 Llava 结构。"""
+    lm = model.language_model
+    layers_owner = getattr(lm, 'model', lm)
+    head_owner = lm if hasattr(lm, 'lm_head') else model
+    return layers_owner, head_owner
+
+def quantize_cpu_int8(model) -> None:
+    """对语言模型 (含 lm_head) 的 nn.Linear 做动态 int8 量化: 权重 int8 存储, 激活运行时量化。
+
+    激活的量化尺度随输入张量变化, 前缀缓存路径与完整 prefill 之间会有微小数值差异。
+    """
+    from torch.ao.quantization import quantize_dynamic
+
+    _, head_owner = _language_parts(model)
+    quantize_dynamic(model.language_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if head_owner is model and isinstance(model.lm_head, torch.nn.Linear):
+        model.lm_head = quantize_dynamic(torch.nn.Sequential(model.lm_head), {torch.nn.Linear}, dtype=torch.qint8)[0]
+
+def enable_cpu_bf16(model, include_language_model: bool) -> bool:
+    """把视觉塔/投影层 (以及未量化时的 decoder 层与 lm_head) 包装到 bf16 autocast 中。
+
+    int8 动态量化的 Linear 只接受 float32 输入, 因此量化后只对视觉部分启用 autocast。
+    """
+    if not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+        print('[WARN] 当前 CPU 不支持 bf16 -> 保持 float32')
+        return False
+    model.vision_tower = _CpuAutocast(model.vision_tower)
+    model.multi_modal_projector = _CpuAutocast(model.multi_modal_projector)
+    if include_language_model:
+        layers_owner, head_owner = _language_parts(model)
+        for idx, layer in enumerate(layers_owner.layers):
+            layers_owner.layers[idx] = _CpuAutocast(layer)
+        head_owner.lm_head = _CpuAutocast(head_owner.lm_head)
+    return True
+
+def _cpu_int8_cache_meta(model_dir: str) -> dict:
+    from llava_cache import model_fingerprint
+    return {'model_fingerprint': model_fingerprint(model_dir), 'torch': torch.__version__}
+
+def _load_cpu_int8_cache(path: str, model_dir: str):
+    meta_path = path + '.json'
+    if not (os.path.exists(path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta != _cpu_int8_cache_meta(model_dir):
+        print('[WARN] int8 量化缓存与模型/torch 版本不一致 -> 重新量化')
+        return None
+    print(f'[STEP] 从缓存加载 int8 模型: {path}')
+    # 缓存文件由本脚本写入, 保存的是完整模块对象, 需要 weights_only=False
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+def _save_cpu_int8_cache(model, path: str, model_dir: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save(model, path)
+    with open(path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(_cpu_int8_cache_meta(model_dir), f)
+    print(f'[OK] int8 量化结果已缓存: {path}')
+
+def build_processor(model_dir: str) -> LlavaProcessor:
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
+    image_processor = CLIPImageProcessor.from_pretrained(model_dir)
+    return LlavaProcessor(image_processor=image_processor, tokenizer=tokenizer)
+
+def build(
+    model_dir: str,
+    quant: str,
+    max_new_tokens: int,
+    force_cpu: bool,
+    quant_cache: Optional[str] = None,
+    cpu_bf16: bool = False,
+    server: Optional[str] = None,
+):
+    """加载模型; 指定 server 时改为连接已运行的 llava_server.py, 返回远程模型句柄。
+
+    本地模型经 llava_registry 加载: 同一进程内相同 (模型目录, 量化, 设备) 只保留一份权重,
+    用完可调用 llava_registry.release(model) 释放引用。
+    """
+    if server:
+        import llava_client
+        return llava_client.build(model_dir, quant, max_new_tokens, force_cpu, quant_cache, cpu_bf16, server=server)
+    from llava_registry import acquire
+    return acquire(model_dir, quant, force_cpu, quant_cache=quant_cache, cpu_bf16=cpu_bf16)
+
+def load_model(
+    model_dir: str,
+    quant: str,
+    force_cpu: bool,
+    quant_cache: Optional[str] = None,
+    cpu_bf16: bool = False,
+):
+    """实际加载 (处理器, 模型, 设备); 一般经 build / llava_registry.acquire 调用以共享权重。"""
+    quant = quant.lower()
+    use_cpu_int8 = quant == 'cpu-int8'
+    has_cuda = torch.cuda.is_available() and not force_cpu and not use_cpu_int8
     device = torch.device('cuda' if has_cuda else 'cpu')
     print(f"[INFO] 设备: {device}")
     print(f"[INFO] 模型: {model_dir}")
 
-    quant = quant.lower()
     use4 = quant == '4bit'
     use8 = quant == '8bit'
 
@@ -51,7 +190,7 @@ def build(model_dir: str, quant: str, max_new_tokens: int, force_cpu: bool):
         print('[WARN] 同时指定 4bit/8bit, 采用 4bit')
         use8 = False
     if (use4 or use8) and not has_cuda:
-        print('[WARN] 无 GPU, 量化失效 -> 回退全精度')
+        print('[WARN] 无 GPU, 量化失效 -> 回退全精度 (CPU 上可改用 --quant cpu-int8)')
         use4 = use8 = False
     if (use4 or use8) and not BNB_AVAILABLE:
         print('[WARN] bitsandbytes 不可用 -> 回退全精度')
@@ -73,6 +212,8 @@ def build(model_dir: str, quant: str, max_new_tokens: int, force_cpu: bool):
         print('[INFO] 尝试 8bit 量化')
         load_kwargs['quantization_config'] = BitsAndBytesConfig(load_in_8bit=True)
         load_kwargs['device_map'] = 'auto'
+    elif use_cpu_int8:
+        print('[INFO] 使用 CPU int8 动态量化 (语言模型 Linear 层)')
     else:
         if has_cuda:
             print('[INFO] 使用 FP16')
@@ -81,17 +222,30 @@ def build(model_dir: str, quant: str, max_new_tokens: int, force_cpu: bool):
 
     t0 = time.time()
     print('[STEP] 加载处理器 ...')
-    tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False)
-    image_processor = CLIPImageProcessor.from_pretrained(model_dir)
-    processor = LlavaProcessor(image_processor=image_processor, tokenizer=tokenizer)
-    print('[STEP] 加载模型 ...')
-    model = LlavaForConditionalGeneration.from_pretrained(
-        model_dir,
-        torch_dtype=dtype,
-        **load_kwargs,
-    )
-    if load_kwargs.get('device_map') is None:
-        model.to(device)
+    processor = build_processor(model_dir)
+    model = None
+    if use_cpu_int8 and quant_cache:
+        model = _load_cpu_int8_cache(quant_cache, model_dir)
+    if model is None:
+        print('[STEP] 加载模型 ...')
+        model = LlavaForConditionalGeneration.from_pretrained(
+            model_dir,
+            torch_dtype=dtype,
+            **load_kwargs,
+        )
+        if load_kwargs.get('device_map') is None:
+            model.to(device)
+        if use_cpu_int8:
+            print('[STEP] int8 动态量化 ...')
+            quantize_cpu_int8(model)
+            if quant_cache:
+                _save_cpu_int8_cache(model, quant_cache, model_dir)
+    model.eval()
+    if cpu_bf16:
+        if has_cuda:
+            print('[WARN] --cpu-bf16 仅作用于 CPU 推理, 已忽略')
+        elif enable_cpu_bf16(model, include_language_model=not use_cpu_int8):
+            print('[INFO] 已启用 CPU bf16 autocast')
     print(f'[OK] 模型加载完成，用时 {time.time()-t0:.1f}s')
     try:
         params = sum(p.numel() for p in model.parameters())/1e9
@@ -100,54 +254,517 @@ def build(model_dir: str, quant: str, max_new_tokens: int, force_cpu: bool):
         pass
     return processor, model, device
 
-def infer(processor, model, device, image: Image.Image, question: str, max_new_tokens: int):
-    prompt = f"USER: <image>\n{question}\nASSISTANT:"
-    # 需要使用关键字参数，避免新版 transformers 将第一个位置参数当作 images 处理
-    # 正确形式: text=prompt, images=image
-    inputs = processor(text=prompt, images=image, return_tensors='pt')
-    inputs = {k: v.to(device) for k, v in inputs.items()}
-    with torch.no_grad():
-        out = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            do_sample=False,
-            pad_token_id=processor.tokenizer.eos_token_id,
-        )
-    text = processor.batch_decode(out, skip_special_tokens=True)[0]
+def build_prompt(question: str) -> str:
+    return f"USER: <image>\n{question}\nASSISTANT:"
+
+def _extract_answer(text: str) -> str:
     if 'ASSISTANT:' in text:
-        text = text.split('ASSISTANT:')[-1].strip()
-    return text
+        text = text.split('ASSISTANT:')[-1]
+    return text.strip()
+
+_VERDICT_PUNCT = '.,!?;:"\'。，！？；：'
+
+def parse_yes_no(answer: str) -> Optional[bool]:
+    text = answer.strip().lower()
+    if not text:
+        return None
+    first = text.split()[0].strip(_VERDICT_PUNCT)  # "Yes," / "No." 也算有效回答
+    if first in {"yes", "y", "yeah"}:
+        return True
+    if first in {"no", "n", "nope"}:
+        return False
+
+    # Chinese handling
+    if text.startswith("是") or text.startswith("对"):
+        return True
+    if text.startswith("否") or text.startswith("不"):
+        return False
+    return None
+
+def early_verdict(text: str) -> Optional[bool]:
+    """解码途中判断 verdict 是否已确定: 英文首词已结束 (后接空白/标点), 或以是/否等中文开头。"""
+    stripped = text.lstrip()
+    if not stripped:
+        return None
+    if stripped[0] in '是对否不':
+        return parse_yes_no(stripped)
+    match = re.match(r'[A-Za-z]+', stripped)
+    if match is None or match.end() == len(stripped):
+        return None  # 首词可能还在增长 (例如 "No" -> "None")
+    return parse_yes_no(stripped)
+
+class VerdictStoppingCriteria(StoppingCriteria):
+    """一旦 yes/no (是/否) verdict 可解析就停止生成, 可额外保留 rationale_tokens 个 token 的解释。"""
+
+    def __init__(self, tokenizer, prompt_length: int, rationale_tokens: int = 0) -> None:
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.rationale_tokens = max(0, int(rationale_tokens))
+        self.decided_at: Dict[int, int] = {}
+
+    def is_done(self, row: int, generated: Sequence[int]) -> bool:
+        if row not in self.decided_at:
+            text = self.tokenizer.decode(generated, skip_special_tokens=True)
+            if early_verdict(text) is None:
+                return False
+            self.decided_at[row] = len(generated)
+        return len(generated) >= self.decided_at[row] + self.rationale_tokens
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = [
+            self.is_done(row, input_ids[row, self.prompt_length:].tolist())
+            for row in range(input_ids.shape[0])
+        ]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+def infer(
+    processor,
+    model,
+    device,
+    image: Image.Image,
+    question: str,
+    max_new_tokens: int,
+    stop_on_verdict: bool = False,
+    rationale_tokens: int = 0,
+    image_tokens: Optional[int] = None,
+):
+    return infer_batch(
+        processor,
+        model,
+        device,
+        [(image, question)],
+        max_new_tokens,
+        stop_on_verdict=stop_on_verdict,
+        rationale_tokens=rationale_tokens,
+        image_tokens=image_tokens,
+    )[0]
+
+def _iter_batches(
+    processor,
+    pairs: Sequence[Tuple[Image.Image, str]],
+    batch_size: int,
+    device,
+    pixel_values: Optional[torch.Tensor] = None,
+):
+    """按 batch_size 切分 pairs, 逐批产出已 padding 并搬到 device 的输入张量。
+
+    给定 pixel_values (与 pairs 一一对应, 见 llava_preprocess) 时只做分词, 跳过图像预处理。
+    """
+    tokenizer = processor.tokenizer
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    batch_size = max(1, int(batch_size))
+    # decoder-only 模型批量推理需要左侧 padding, 结束后恢复原设置
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = 'left'
+    try:
+        for start in range(0, len(pairs), batch_size):
+            chunk = pairs[start:start + batch_size]
+            images = [image for image, _ in chunk]
+            prompts = [build_prompt(question) for _, question in chunk]
+            if pixel_values is not None:
+                inputs = dict(tokenizer(prompts, padding=True, return_tensors='pt'))
+                inputs['pixel_values'] = pixel_values[start:start + batch_size]
+                yield {k: v.to(device) for k, v in inputs.items()}
+                continue
+            # 需要使用关键字参数，避免新版 transformers 将第一个位置参数当作 images 处理
+            # 正确形式: text=prompt, images=image
+            inputs = processor(text=prompts, images=images, padding=True, return_tensors='pt')
+            yield {k: v.to(device) for k, v in inputs.items()}
+    finally:
+        tokenizer.padding_side = padding_side
+
+def _iter_embedded_batches(
+    processor,
+    model,
+    pairs: Sequence[Tuple[Image.Image, str]],
+    batch_size: int,
+    device,
+    image_tokens: int,
+    pixel_values: Optional[torch.Tensor] = None,
+):
+    """视觉 token 预算模式下的 _iter_batches: 图像特征池化后直接拼成左侧 padding 的 inputs_embeds。
+
+    产出 inputs_embeds / attention_mask / position_ids, 可直接传给 model(...) 或 model.generate(...)。
+    """
+    tokenizer = processor.tokenizer
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    embed = model.get_input_embeddings()
+    batch_size = max(1, int(batch_size))
+    for start in range(0, len(pairs), batch_size):
+        chunk = pairs[start:start + batch_size]
+        if pixel_values is not None:
+            batch_pixels = pixel_values[start:start + batch_size]
+        else:
+            batch_pixels = processor.image_processor([image for image, _ in chunk], return_tensors='pt')['pixel_values']
+        with torch.no_grad():
+            feats = encode_image(model, batch_pixels.to(device, dtype=model.dtype), image_tokens)
+            rows = [embed_prompt(model, _prompt_ids(processor, question), feats[i:i + 1])[0] for i, (_, question) in enumerate(chunk)]
+            width = max(row.shape[0] for row in rows)
+            pad = embed(torch.tensor([pad_id], device=embed.weight.device))[0]
+            inputs_embeds = torch.stack([
+                torch.cat([pad.expand(width - row.shape[0], -1), row]) for row in rows
+            ])
+        attention_mask = torch.tensor(
+            [[0] * (width - row.shape[0]) + [1] * row.shape[0] for row in rows], device=inputs_embeds.device,
+        )
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        yield {'inputs_embeds': inputs_embeds, 'attention_mask': attention_mask, 'position_ids': position_ids}
+
+def infer_batch(
+    processor,
+    model,
+    device,
+    pairs: Sequence[Tuple[Image.Image, str]],
+    max_new_tokens: int,
+    batch_size: int = 8,
+    stop_on_verdict: bool = False,
+    rationale_tokens: int = 0,
+    pixel_values: Optional[torch.Tensor] = None,
+    image_tokens: Optional[int] = None,
+    **generate_kwargs,
+) -> List[str]:
+    """批量推理: pairs 为 (image, question) 列表, 按顺序返回回答。
+
+    每 batch_size 条拼成一个 batch, 左侧 padding 后单次 generate。
+    stop_on_verdict 时每条回答在 yes/no verdict 可解析 (再加 rationale_tokens 个 token) 后即停止解码。
+    generate_kwargs 透传给 model.generate (例如 do_sample/temperature)。
+    pixel_values 为预先算好的图像张量 (见 llava_preprocess), 可跳过逐次预处理。
+    image_tokens 为视觉 token 预算 (例如 144 / 64), 图像特征池化后再进入语言模型, 缩短 prefill。
+    model 为 llava_client.RemoteLlava 时请求转发给推理服务 (忽略 pixel_values)。
+    """
+    if getattr(model, 'is_remote', False):
+        if image_tokens is not None:
+            raise ValueError('视觉 token 预算需要本地模型, 远程推理服务与副本池不支持')
+        return model.infer_batch(
+            pairs, max_new_tokens, batch_size=batch_size,
+            stop_on_verdict=stop_on_verdict, rationale_tokens=rationale_tokens, **generate_kwargs,
+        )
+    gen_kwargs = dict(do_sample=False, pad_token_id=processor.tokenizer.eos_token_id)
+    gen_kwargs.update(generate_kwargs)
+    answers: List[str] = []
+    if image_tokens is not None:
+        # inputs_embeds 路径下 generate 只返回新 token; position_ids 由 generate 根据 attention_mask 自行计算
+        batches = (
+            {k: v for k, v in inputs.items() if k != 'position_ids'}
+            for inputs in _iter_embedded_batches(processor, model, pairs, batch_size, device, image_tokens, pixel_values)
+        )
+    else:
+        batches = _iter_batches(processor, pairs, batch_size, device, pixel_values)
+    for inputs in batches:
+        if stop_on_verdict:
+            prompt_length = inputs['input_ids'].shape[1] if 'input_ids' in inputs else 0
+            criteria = VerdictStoppingCriteria(processor.tokenizer, prompt_length, rationale_tokens)
+            gen_kwargs['stopping_criteria'] = StoppingCriteriaList([criteria])
+        with torch.no_grad():
+            out = model.generate(**inputs, max_new_tokens=max_new_tokens, **gen_kwargs)
+        texts = processor.batch_decode(out, skip_special_tokens=True)
+        answers.extend(_extract_answer(text) for text in texts)
+    return answers
+
+YES_WORDS = ('yes', 'Yes', 'YES', '是')
+NO_WORDS = ('no', 'No', 'NO', '否')
+_VERDICT_IDS: Dict[int, Tuple[List[int], List[int]]] = {}
+
+def verdict_token_ids(tokenizer) -> Tuple[List[int], List[int]]:
+    """返回 yes / no 各变体 (大小写、前导空格、中文) 的首个 token id。"""
+    cached = _VERDICT_IDS.get(id(tokenizer))
+    if cached is not None:
+        return cached
+
+    def first_ids(words: Sequence[str]) -> set:
+        ids = set()
+        for word in words:
+            for variant in (word, ' ' + word):
+                for tok in tokenizer.encode(variant, add_special_tokens=False):
+                    piece = tokenizer.decode([tok]).strip()
+                    if not piece:
+                        continue  # 跳过 sentencepiece 的纯空格前缀
+                    if word.lower().startswith(piece.lower()):
+                        ids.add(tok)
+                    break
+        return ids
+
+    yes_ids, no_ids = first_ids(YES_WORDS), first_ids(NO_WORDS)
+    shared = yes_ids & no_ids
+    result = (sorted(yes_ids - shared), sorted(no_ids - shared))
+    if not result[0] or not result[1]:
+        raise ValueError('tokenizer 中找不到 yes/no token, 无法使用打分模式')
+    _VERDICT_IDS[id(tokenizer)] = result
+    return result
+
+def score_yes_no(
+    processor,
+    model,
+    device,
+    pairs: Sequence[Tuple[Image.Image, str]],
+    batch_size: int = 8,
+    pixel_values: Optional[torch.Tensor] = None,
+    image_tokens: Optional[int] = None,
+) -> List[float]:
+    """单次 prefill 打分: 读取下一个 token 的 logits, 返回 P(yes) (yes/no 两类归一化)。
+
+    不进入解码循环, 适用于以 "Please answer yes or no." 结尾的问题。
+    pixel_values / image_tokens 含义同 infer_batch。
+    """
+    if getattr(model, 'is_remote', False):
+        if image_tokens is not None:
+            raise ValueError('视觉 token 预算需要本地模型, 远程推理服务与副本池不支持')
+        return model.score_yes_no(pairs, batch_size=batch_size)
+    yes_ids, no_ids = verdict_token_ids(processor.tokenizer)
+    scores: List[float] = []
+    if image_tokens is not None:
+        batches = _iter_embedded_batches(processor, model, pairs, batch_size, device, image_tokens, pixel_values)
+    else:
+        batches = _iter_batches(processor, pairs, batch_size, device, pixel_values)
+    for inputs in batches:
+        with torch.no_grad():
+            logits = model(**inputs).logits[:, -1, :]
+        probs = torch.softmax(logits.float(), dim=-1)
+        p_yes = probs[:, yes_ids].sum(dim=-1)
+        p_no = probs[:, no_ids].sum(dim=-1)
+        denom = p_yes + p_no
+        p = torch.where(denom > 0, p_yes / denom.clamp_min(1e-12), torch.full_like(denom, 0.5))
+        scores.extend(float(v) for v in p.cpu())
+    return scores
+
+@dataclass
+class ImagePrefix:
+    """同一张图像的 "USER: <image>" 前缀: 视觉特征与 prefill 后的 KV cache, 供多个问题复用。"""
+    image: Image.Image
+    input_ids: List[int]          # 前缀 token id (到最后一个 <image> 为止)
+    image_features: torch.Tensor  # (1, n_tokens, hidden)
+    past_key_values: Any
+    length: int                   # 前缀展开后的序列长度 (含全部图像 token)
+    image_tokens: Optional[int] = None  # 视觉 token 预算 (None 为模型原始数量)
+
+IMAGE_TOKEN_CHOICES = (576, 144, 64)
+
+def pool_image_features(features: torch.Tensor, image_tokens: Optional[int]) -> torch.Tensor:
+    """把 (batch, n, hidden) 的投影后图像特征按空间网格平均池化到 image_tokens 个 (须为完全平方数)。
+
+    LLaVA-1.5 的 576 = 24x24 个 patch, 例如 144 -> 12x12, 64 -> 8x8; None 或等于 n 时原样返回。
+    """
+    if image_tokens is None:
+        return features
+    batch, n, hidden = features.shape
+    side, target = int(round(n ** 0.5)), int(round(image_tokens ** 0.5))
+    if side * side != n:
+        raise ValueError(f'图像特征数 {n} 不是正方形网格, 无法池化')
+    if target < 1 or target * target != image_tokens or image_tokens > n:
+        raise ValueError(f'image_tokens 须为不超过 {n} 的完全平方数, 收到 {image_tokens}')
+    if image_tokens == n:
+        return features
+    grid = features.transpose(1, 2).reshape(batch, hidden, side, side)
+    pooled = torch.nn.functional.adaptive_avg_pool2d(grid.float(), target).to(features.dtype)
+    return pooled.flatten(2).transpose(1, 2)
+
+def encode_image(model, pixel_values: torch.Tensor, image_tokens: Optional[int] = None) -> torch.Tensor:
+    """视觉塔 + 投影层, 返回 (batch, n_tokens, hidden) 的图像特征; image_tokens 见 pool_image_features。"""
+    cfg = model.config
+    outputs = model.vision_tower(pixel_values, output_hidden_states=True)
+    feats = outputs.hidden_states[cfg.vision_feature_layer]
+    if cfg.vision_feature_select_strategy == 'default':
+        feats = feats[:, 1:]
+    return pool_image_features(model.multi_modal_projector(feats), image_tokens)
+
+def embed_prompt(model, input_ids: Sequence[int], image_features: Optional[torch.Tensor]) -> torch.Tensor:
+    """把 token id 序列嵌入, 并用图像特征替换 <image> 位置, 返回 (1, L, hidden)。
+
+    兼容两种处理器: 只含单个 <image> 占位 (旧式, 就地展开) 或已展开为 n_tokens 个占位。
+    """
+    embed = model.get_input_embeddings()
+    device = embed.weight.device
+    image_token = model.config.image_token_index
+    ids = torch.tensor([list(input_ids)], device=device)
+    embeds = embed(ids)
+    positions = [i for i, tok in enumerate(input_ids) if tok == image_token]
+    if image_features is None or not positions:
+        return embeds
+    feats = image_features[0].to(device, embeds.dtype)
+    if len(positions) == feats.shape[0]:
+        embeds = embeds.clone()
+        embeds[0, positions] = feats
+        return embeds
+    if len(positions) != 1:
+        raise ValueError(f'<image> token 数 ({len(positions)}) 与图像特征数 ({feats.shape[0]}) 不匹配')
+    pos = positions[0]
+    return torch.cat([embeds[:, :pos], feats.unsqueeze(0), embeds[:, pos + 1:]], dim=1)
+
+def _prompt_ids(processor, question: str) -> List[int]:
+    return processor.tokenizer(build_prompt(question)).input_ids
+
+def _restore_prefix(prefix: ImagePrefix) -> None:
+    # DynamicCache 会被就地追加, 用完后裁回前缀长度; 旧式 tuple cache 不会被修改
+    if hasattr(prefix.past_key_values, 'crop'):
+        prefix.past_key_values.crop(prefix.length)
+
+def prepare_image_prefix(
+    processor,
+    model,
+    device,
+    image: Image.Image,
+    pixel_values: Optional[torch.Tensor] = None,
+    image_tokens: Optional[int] = None,
+) -> ImagePrefix:
+    """对图像只做一次视觉编码与前缀 prefill, 返回可被多个问题复用的 ImagePrefix。
+
+    pixel_values 为该图像预先算好的 (1, 3, H, W) 张量时跳过预处理。
+    image_tokens 为视觉 token 预算 (见 pool_image_features)。
+    """
+    if getattr(model, 'is_remote', False):
+        raise ValueError('前缀 KV cache 需要本地模型, 远程推理服务与副本池不支持')
+    if pixel_values is None:
+        pixel_values = processor.image_processor(image, return_tensors='pt')['pixel_values']
+    pixel_values = pixel_values.to(device, dtype=model.dtype)
+    ids = _prompt_ids(processor, '')
+    image_token = model.config.image_token_index
+    cut = max(i for i, tok in enumerate(ids) if tok == image_token) + 1
+    prefix_ids = ids[:cut]
+    with torch.no_grad():
+        image_features = encode_image(model, pixel_values, image_tokens)
+        embeds = embed_prompt(model, prefix_ids, image_features)
+        cache = DynamicCache() if DynamicCache is not None else None
+        out = model(inputs_embeds=embeds, past_key_values=cache, use_cache=True)
+    return ImagePrefix(
+        image=image,
+        input_ids=prefix_ids,
+        image_features=image_features,
+        past_key_values=out.past_key_values,
+        length=embeds.shape[1],
+        image_tokens=image_tokens,
+    )
+
+def _prefill_suffix(processor, model, prefix: ImagePrefix, question: str):
+    """在前缀 KV cache 上 prefill 问题后缀; 若分词无法与前缀对齐返回 None。"""
+    ids = _prompt_ids(processor, question)
+    if ids[:len(prefix.input_ids)] != prefix.input_ids:
+        return None
+    suffix = ids[len(prefix.input_ids):]
+    embeds = embed_prompt(model, suffix, None)
+    out = model(inputs_embeds=embeds, past_key_values=prefix.past_key_values, use_cache=True)
+    return ids, out
+
+def infer_with_prefix(
+    processor,
+    model,
+    device,
+    prefix: ImagePrefix,
+    question: str,
+    max_new_tokens: int,
+    stop_on_verdict: bool = False,
+    rationale_tokens: int = 0,
+) -> str:
+    """复用图像前缀的贪心解码, 与 infer() 的 do_sample=False 路径逐 token 一致。"""
+    eos = processor.tokenizer.eos_token_id
+    criteria = VerdictStoppingCriteria(processor.tokenizer, 0, rationale_tokens) if stop_on_verdict else None
+    try:
+        with torch.no_grad():
+            prefilled = _prefill_suffix(processor, model, prefix, question)
+            if prefilled is None:
+                return infer(
+                    processor, model, device, prefix.image, question, max_new_tokens,
+                    stop_on_verdict=stop_on_verdict, rationale_tokens=rationale_tokens,
+                    image_tokens=prefix.image_tokens,
+                )
+            ids, out = prefilled
+            new_tokens: List[int] = []
+            for step in range(max_new_tokens):
+                next_token = int(out.logits[0, -1].argmax())
+                new_tokens.append(next_token)
+                if next_token == eos or step == max_new_tokens - 1:
+                    break
+                if criteria is not None and criteria.is_done(0, new_tokens):
+                    break
+                embeds = embed_prompt(model, [next_token], None)
+                out = model(inputs_embeds=embeds, past_key_values=out.past_key_values, use_cache=True)
+    finally:
+        _restore_prefix(prefix)
+    text = processor.tokenizer.decode(ids + new_tokens, skip_special_tokens=True)
+    return _extract_answer(text)
+
+def score_with_prefix(processor, model, device, prefix: ImagePrefix, question: str) -> float:
+    """score_yes_no 的前缀复用版本, 只 prefill 问题后缀。"""
+    yes_ids, no_ids = verdict_token_ids(processor.tokenizer)
+    try:
+        with torch.no_grad():
+            prefilled = _prefill_suffix(processor, model, prefix, question)
+            if prefilled is None:
+                return score_yes_no(
+                    processor, model, device, [(prefix.image, question)], image_tokens=prefix.image_tokens,
+                )[0]
+            _, out = prefilled
+    finally:
+        _restore_prefix(prefix)
+    probs = torch.softmax(out.logits[0, -1].float(), dim=-1)
+    p_yes = float(probs[yes_ids].sum())
+    p_no = float(probs[no_ids].sum())
+    return p_yes / (p_yes + p_no) if (p_yes + p_no) > 0 else 0.5
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument('--model-dir', required=True)
     ap.add_argument('--image', default='data/test_images/real_face_1.jpg')
     ap.add_argument('--question', default='Describe the face briefly.')
-    ap.add_argument('--quant', choices=['none','4bit','8bit'], default='4bit')
+    ap.add_argument('--quant', choices=QUANT_CHOICES, default='4bit')
+    ap.add_argument('--quant-cache', default=None, help='cpu-int8 量化结果缓存文件, 再次加载时跳过转换')
+    ap.add_argument('--cpu-bf16', action='store_true', help='CPU 推理时启用 bf16 autocast (需 CPU 支持)')
     ap.add_argument('--max-new-tokens', type=int, default=64)
     ap.add_argument('--force-cpu', action='store_true')
+    ap.add_argument('--server', default=None, help='连接已运行的 llava_server.py (例如 http://127.0.0.1:8765), 不在本进程加载模型')
+    ap.add_argument('--cache', default=None, help='持久化回答缓存 (SQLite), 例如 cache/llava_infer.sqlite')
+    ap.add_argument('--stop-on-verdict', action='store_true', help='yes/no verdict 可解析后即停止生成')
+    ap.add_argument('--rationale-tokens', type=int, default=0, help='verdict 之后额外保留的解释 token 数')
+    ap.add_argument('--profile', default=None, help='记录各阶段耗时的 JSONL trace (用 llava_profile.py summarize 汇总)')
+    ap.add_argument('--image-tokens', type=int, default=None, help='视觉 token 预算: 把 576 个图像 token 池化到该数量 (如 144 / 64)')
     args = ap.parse_args()
 
-    if not os.path.isdir(args.model_dir):
+    if not args.server and not os.path.isdir(args.model_dir):
         print('[ERR] 模型目录不存在')
         sys.exit(1)
     img = load_image(args.image)
     if img is None:
         sys.exit(1)
 
-    processor, model, device = build(args.model_dir, args.quant, args.max_new_tokens, args.force_cpu)
+    processor, model, device = build(
+        args.model_dir, args.quant, args.max_new_tokens, args.force_cpu,
+        quant_cache=args.quant_cache, cpu_bf16=args.cpu_bf16, server=args.server,
+    )
+    run = infer
+    cache = None
+    if args.cache:
+        from llava_cache import InferenceCache
+        quant_label = args.quant + ('+bf16' if args.cpu_bf16 else '')
+        cache = InferenceCache(args.cache, model_dir=args.model_dir, quant=quant_label)
+        run = cache.infer
+    profiler = None
+    if args.profile and not args.server:
+        from llava_profile import LlavaProfiler
+        profiler = LlavaProfiler(args.profile).attach(processor, model)
     print('[STEP] 推理 ...')
     t0 = time.time()
-    ans = infer(processor, model, device, img, args.question, args.max_new_tokens)
+    with profiler.call('infer', items=1) if profiler else nullcontext():
+        ans = run(
+            processor, model, device, img, args.question, args.max_new_tokens,
+            stop_on_verdict=args.stop_on_verdict, rationale_tokens=args.rationale_tokens,
+            image_tokens=args.image_tokens,
+        )
     dt = time.time() - t0
     print('\n==== 英文回答 ====' )
     print(ans)
     zh_q = '请判断这张人脸是否真实，仅回答: 真实 / 可疑 / 伪造'
-    zh_ans = infer(processor, model, device, img, zh_q, 32)
+    zh_ans = run(processor, model, device, img, zh_q, 32, image_tokens=args.image_tokens)
     print('\n==== 中文回答 ====' )
     print(zh_q)
     print(zh_ans)
     print(f'\n[INFO] 生成耗时 {dt:.2f}s (不含加载)')
+    if profiler is not None:
+        profiler.close()
+        print(f'[INFO] 分阶段耗时已写入 {args.profile}')
+    if cache is not None:
+        stats = cache.stats()
+        print(f"[INFO] 缓存命中 {stats['session_hits']} / 未命中 {stats['session_misses']} ({stats['path']})")
+        cache.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,121 @@
+"""Process-wide registry of loaded LLaVA models.
+
+``llava_quant.build`` and ``llava_model.LLaVADetector`` both load through ``acquire()``, so a
+process that uses several front ends holds one copy of the weights per
+(model dir, quant, device) and every caller gets the same configuration (processor,
+quantisation, bf16 autocast). Each ``acquire`` takes a reference. ``release`` drops it and frees
+the weights once the last holder is gone (``keep_loaded=True`` keeps them warm for the next
+``acquire``). ``unload`` takes models out of memory explicitly.
+
+  processor, model, device = acquire("models/llava-1.5-7b-hf", quant="4bit")
+  ...
+  release(model)
+"""
+from __future__ import annotations
+
+import gc
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+
+RegistryKey = Tuple[str, str, str]
+
+
+@dataclass
+class _Entry:
+    processor: Any
+    model: Any
+    device: Any
+    refs: int = 0
+
+
+_ENTRIES: Dict[RegistryKey, _Entry] = {}
+_LOCK = threading.RLock()
+
+
+def registry_key(model_dir: str, quant: str = "none", force_cpu: bool = False, cpu_bf16: bool = False) -> RegistryKey:
+    """(model dir, quant label, device) that identifies one loaded copy."""
+    quant = quant.lower()
+    source = os.path.realpath(model_dir) if os.path.isdir(model_dir) else model_dir  # local dir or hub id
+    on_cpu = force_cpu or quant == "cpu-int8" or not torch.cuda.is_available()
+    label = quant + ("+bf16" if cpu_bf16 and on_cpu else "")
+    return source, label, "cpu" if on_cpu else "cuda"
+
+
+def acquire(
+    model_dir: str,
+    quant: str = "none",
+    force_cpu: bool = False,
+    quant_cache: Optional[str] = None,
+    cpu_bf16: bool = False,
+):
+    """``(processor, model, device)`` for the configuration, loading it on first use."""
+    key = registry_key(model_dir, quant, force_cpu, cpu_bf16)
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None:
+            from llava_quant import load_model
+
+            processor, model, device = load_model(model_dir, quant, force_cpu, quant_cache=quant_cache, cpu_bf16=cpu_bf16)
+            entry = _ENTRIES[key] = _Entry(processor, model, device)
+        else:
+            print(f"[INFO] Reusing loaded model {key[0]} ({key[1]}, {key[2]}), {entry.refs} other holder(s)")
+        entry.refs += 1
+        return entry.processor, entry.model, entry.device
+
+
+def _find(model: Any) -> Optional[RegistryKey]:
+    for key, entry in _ENTRIES.items():
+        if entry.model is model:
+            return key
+    return None
+
+
+def _free(key: RegistryKey) -> None:
+    entry = _ENTRIES.pop(key)
+    on_cuda = key[2] == "cuda"
+    del entry
+    gc.collect()
+    if on_cuda:
+        torch.cuda.empty_cache()
+    print(f"[INFO] Unloaded model {key[0]} ({key[1]}, {key[2]})")
+
+
+def release(model: Any, keep_loaded: bool = False) -> None:
+    """Drop one reference taken by ``acquire``; the last release frees the weights unless ``keep_loaded``."""
+    with _LOCK:
+        key = _find(model)
+        if key is None:
+            return  # remote handles, pools and models loaded outside the registry
+        entry = _ENTRIES[key]
+        entry.refs = max(0, entry.refs - 1)
+        if entry.refs == 0 and not keep_loaded:
+            _free(key)
+
+
+def unload(model_dir: Optional[str] = None, force: bool = False) -> List[RegistryKey]:
+    """Free models kept loaded with no holders (of ``model_dir`` only, if given); ``force`` also frees held ones.
+
+    Holders of a force-unloaded model keep a working handle; the registry just stops sharing it.
+    """
+    source = None
+    if model_dir is not None:
+        source = os.path.realpath(model_dir) if os.path.isdir(model_dir) else model_dir
+    with _LOCK:
+        keys = [
+            key
+            for key, entry in _ENTRIES.items()
+            if (source is None or key[0] == source) and (force or entry.refs == 0)
+        ]
+        for key in keys:
+            _free(key)
+    return keys
+
+
+def loaded() -> Dict[RegistryKey, int]:
+    """Loaded configurations and their reference counts."""
+    with _LOCK:
+        return {key: entry.refs for key, entry in _ENTRIES.items()}
@@ -0,0 +1,215 @@
+"""Dynamic batching scheduler for concurrent LLaVA requests.
+
+Callers ``submit`` work from any thread; a single worker collects requests that share a
+batch key (same operation and generation settings) for up to ``max_wait_ms`` after the
+oldest one arrived, or until ``max_batch_size`` items are waiting, then runs them as one
+batched call. Every caller gets its own slice back together with its queueing and compute
+latency.
+
+  scheduler = BatchScheduler(make_llava_runner(processor, model, device, batch_size=8), max_batch_size=8, max_wait_ms=15)
+  result = scheduler.submit(infer_key(64), [(image, question)]).result()
+  result.value, result.queue_ms, result.compute_ms
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+RunFn = Callable[[Hashable, List[Any]], List[Any]]
+
+
+@dataclass
+class ScheduledResult:
+    value: List[Any]
+    queue_ms: float
+    compute_ms: float
+    batch_items: int
+
+
+@dataclass
+class _Request:
+    key: Hashable
+    items: List[Any]
+    future: Future
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+def _percentile(values: Sequence[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class BatchScheduler:
+    """Collects compatible requests into batches and runs them on one worker thread."""
+
+    def __init__(
+        self,
+        run: RunFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        history: int = 1000,
+    ) -> None:
+        self.run = run
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.history = history
+        self.pending: List[_Request] = []
+        self.cond = threading.Condition()
+        self.closed = False
+        self.batches = 0
+        self.batched_items = 0
+        self.failed = 0
+        self.queue_ms: List[float] = []
+        self.compute_ms: List[float] = []
+        self.worker = threading.Thread(target=self._loop, name="llava-scheduler", daemon=True)
+        self.worker.start()
+
+    def submit(self, key: Hashable, items: Sequence[Any]) -> Future:
+        """Queue ``items`` under batch ``key``; the future resolves to a ``ScheduledResult``."""
+        request = _Request(key, list(items), Future())
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("scheduler is closed")
+            self.pending.append(request)
+            self.cond.notify()
+        return request.future
+
+    def _take_batch(self) -> Optional[List[_Request]]:
+        with self.cond:
+            while not self.pending and not self.closed:
+                self.cond.wait()
+            if not self.pending:
+                return None
+            first = self.pending[0]
+            deadline = first.enqueued + self.max_wait
+            while not self.closed:
+                waiting = sum(len(r.items) for r in self.pending if r.key == first.key)
+                remaining = deadline - time.perf_counter()
+                if waiting >= self.max_batch_size or remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch: List[_Request] = []
+            size = 0
+            for request in self.pending:
+                if request.key != first.key:
+                    continue
+                if batch and size + len(request.items) > self.max_batch_size:
+                    break
+                batch.append(request)
+                size += len(request.items)
+            self.pending = [r for r in self.pending if not any(r is b for b in batch)]
+            return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for request in batch for item in request.items]
+            start = time.perf_counter()
+            try:
+                outputs = self.run(batch[0].key, items)
+            except Exception as err:  # every caller in the batch sees the failure
+                with self.cond:
+                    self.failed += len(batch)
+                for request in batch:
+                    request.future.set_exception(err)
+                continue
+            end = time.perf_counter()
+            compute_ms = (end - start) * 1000.0
+            offset = 0
+            with self.cond:
+                self.batches += 1
+                self.batched_items += len(items)
+                for request in batch:
+                    self.queue_ms.append((start - request.enqueued) * 1000.0)
+                    self.compute_ms.append(compute_ms)
+                del self.queue_ms[: -self.history]
+                del self.compute_ms[: -self.history]
+            for request in batch:
+                value = outputs[offset : offset + len(request.items)]
+                offset += len(request.items)
+                request.future.set_result(
+                    ScheduledResult(
+                        value=value,
+                        queue_ms=(start - request.enqueued) * 1000.0,
+                        compute_ms=compute_ms,
+                        batch_items=len(items),
+                    )
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "pending": sum(len(r.items) for r in self.pending),
+                "batches": self.batches,
+                "items": self.batched_items,
+                "failed": self.failed,
+                "mean_batch_items": round(self.batched_items / self.batches, 3) if self.batches else 0.0,
+                "queue_ms_p50": round(_percentile(self.queue_ms, 50), 3),
+                "queue_ms_p95": round(_percentile(self.queue_ms, 95), 3),
+                "compute_ms_p50": round(_percentile(self.compute_ms, 50), 3),
+                "compute_ms_p95": round(_percentile(self.compute_ms, 95), 3),
+            }
+
+    def close(self) -> None:
+        """Stop accepting work, finish what is queued and join the worker."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.worker.join()
+
+
+def infer_key(
+    max_new_tokens: int,
+    stop_on_verdict: bool = False,
+    rationale_tokens: int = 0,
+    generate_kwargs: Optional[Dict[str, Any]] = None,
+) -> Tuple:
+    """Batch key for generation: only requests with identical decode settings share a batch."""
+    options = tuple(sorted((generate_kwargs or {}).items()))
+    return ("infer", int(max_new_tokens), bool(stop_on_verdict), int(rationale_tokens), options)
+
+
+def score_key() -> Tuple:
+    return ("score",)
+
+
+def make_llava_runner(processor, model, device, cache=None, batch_size: int = 8) -> RunFn:
+    """Run function for ``BatchScheduler`` over ``llava_quant`` (or an ``InferenceCache`` in front of it).
+
+    Items are ``(image, prompt)`` pairs; a request larger than ``batch_size`` is split into chunks.
+    """
+    from llava_quant import infer_batch, score_yes_no
+
+    run_infer = cache.infer_batch if cache is not None else infer_batch
+    run_score = cache.score_yes_no if cache is not None else score_yes_no
+
+    def run(key: Hashable, pairs: List[Any]) -> List[Any]:
+        if key[0] == "score":
+            return run_score(processor, model, device, pairs, batch_size=batch_size)
+        _, max_new_tokens, stop_on_verdict, rationale_tokens, generate_kwargs = key
+        return run_infer(
+            processor,
+            model,
+            device,
+            pairs,
+            max_new_tokens,
+            batch_size=batch_size,
+            stop_on_verdict=stop_on_verdict,
+            rationale_tokens=rationale_tokens,
+            **dict(generate_kwargs),
+        )
+
+    return run
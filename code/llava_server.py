@@ -0,0 +1,201 @@
+"""Long-running local LLaVA inference server.
+
+Loads the model once and serves JSON requests on localhost. Requests go through a
+``llava_scheduler.BatchScheduler``: a single worker thread owns the model and merges
+compatible requests that arrive within ``--max-wait-ms`` into one batched call of up to
+``--max-batch-size`` items. Responses report each request's ``queue_ms`` and ``compute_ms``.
+
+  python code/llava_server.py --model-dir models/llava-1.5-7b-hf --quant 4bit --port 8765
+
+Endpoints:
+  GET  /health        model directory, quantisation, device, scheduler batching/latency stats
+  POST /infer_batch   {"pairs": [{"image": <base64 PNG>, "prompt": str}], "max_new_tokens": int, ...}
+  POST /score_yes_no  {"pairs": [...]}
+
+Batch sizes sent by clients are ignored; ``--max-batch-size`` decides how work is merged.
+
+Use ``llava_client.build`` (or ``--server`` on the MFA / EFFPP scripts) to talk to it.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from llava_client import DEFAULT_HOST, DEFAULT_PORT, decode_image
+from llava_quant import QUANT_CHOICES, build
+from llava_scheduler import BatchScheduler, ScheduledResult, infer_key, make_llava_runner, score_key
+
+GENERATE_KWARGS = ("do_sample", "temperature", "top_p", "top_k", "num_beams", "repetition_penalty")
+
+
+class LlavaService:
+    """Owns the model; concurrent requests are merged into batches by a ``BatchScheduler``."""
+
+    def __init__(
+        self,
+        model_dir: str,
+        quant: str,
+        processor,
+        model,
+        device,
+        cache=None,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+    ) -> None:
+        self.model_dir = os.path.abspath(model_dir)
+        self.quant = quant
+        self.device = device
+        self.cache = cache
+        runner = make_llava_runner(processor, model, device, cache=cache, batch_size=max_batch_size)
+        self.scheduler = BatchScheduler(runner, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def stop(self) -> None:
+        self.scheduler.close()
+
+    def health(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {
+            "model_dir": self.model_dir,
+            "quant": self.quant,
+            "device": str(self.device),
+            "scheduler": self.scheduler.stats(),
+        }
+        if self.cache is not None:
+            info["cache"] = self.cache.stats()
+        return info
+
+    @staticmethod
+    def _timing(result: ScheduledResult) -> Dict[str, Any]:
+        return {
+            "queue_ms": round(result.queue_ms, 3),
+            "compute_ms": round(result.compute_ms, 3),
+            "batch_items": result.batch_items,
+        }
+
+    def infer_batch(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        pairs = [(decode_image(item["image"]), item["prompt"]) for item in payload["pairs"]]
+        generate_kwargs = {k: v for k, v in (payload.get("generate_kwargs") or {}).items() if k in GENERATE_KWARGS}
+        key = infer_key(
+            int(payload["max_new_tokens"]),
+            stop_on_verdict=bool(payload.get("stop_on_verdict", False)),
+            rationale_tokens=int(payload.get("rationale_tokens", 0)),
+            generate_kwargs=generate_kwargs,
+        )
+        result = self.scheduler.submit(key, pairs).result()
+        return {"answers": result.value, **self._timing(result)}
+
+    def score_yes_no(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        pairs = [(decode_image(item["image"]), item["prompt"]) for item in payload["pairs"]]
+        result = self.scheduler.submit(score_key(), pairs).result()
+        return {"scores": result.value, **self._timing(result)}
+
+
+def make_handler(service: LlavaService):
+    routes: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+        "/infer_batch": service.infer_batch,
+        "/score_yes_no": service.score_yes_no,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self._reply(200, service.health())
+            else:
+                self._reply(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self) -> None:
+            route = routes.get(self.path)
+            if route is None:
+                self._reply(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length).decode("utf-8"))
+            except (ValueError, UnicodeDecodeError) as err:
+                self._reply(400, {"error": f"bad request body: {err}"})
+                return
+            start = time.time()
+            try:
+                body = route(payload)
+            except (KeyError, TypeError, ValueError) as err:
+                self._reply(400, {"error": f"{type(err).__name__}: {err}"})
+                return
+            except Exception as err:
+                self._reply(500, {"error": f"{type(err).__name__}: {err}"})
+                return
+            body["elapsed_sec"] = round(time.time() - start, 4)
+            self._reply(200, body)
+
+        def log_message(self, format: str, *args) -> None:
+            print(f"[INFO] {self.address_string()} {format % args}")
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a local LLaVA model over localhost HTTP")
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--quant", choices=QUANT_CHOICES, default="4bit")
+    parser.add_argument("--quant-cache", default=None, help="Cache file for cpu-int8 weights (skips re-quantising)")
+    parser.add_argument("--cpu-bf16", action="store_true", help="Enable bf16 autocast for CPU inference")
+    parser.add_argument("--force-cpu", action="store_true")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache", default=None, help="Persistent answer cache (SQLite) shared by all clients")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Largest merged batch (items)")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="How long the oldest request waits for batch mates")
+    args = parser.parse_args()
+
+    processor, model, device = build(
+        args.model_dir,
+        args.quant,
+        64,
+        args.force_cpu,
+        quant_cache=args.quant_cache,
+        cpu_bf16=args.cpu_bf16,
+    )
+    quant_label = args.quant + ("+bf16" if args.cpu_bf16 else "")
+    cache = None
+    if args.cache:
+        from llava_cache import InferenceCache
+
+        cache = InferenceCache(Path(args.cache), model_dir=args.model_dir, quant=quant_label)
+    service = LlavaService(
+        args.model_dir,
+        quant_label,
+        processor,
+        model,
+        device,
+        cache=cache,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"[OK] LLaVA server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Miniature random-weight LLaVA for offline benchmarking and regression checks.
+
+Builds a ``LlavaForConditionalGeneration`` with the LLaVA-1.5 layout (CLIP vision tower,
+two-layer projector, Llama decoder) but a few tiny layers, plus a small BPE tokenizer whose
+vocabulary covers the MFA prompts and the yes/no verdict words. The saved directory loads
+with ``llava_quant.build`` like the real model; answers are meaningless but every code path
+(batched generate, logprob scoring, prefix KV cache, quantisation) runs in well under a second.
+
+  python code/llava_tiny.py --out models/llava-tiny
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+IMAGE_SIZE = 56
+PATCH_SIZE = 14
+CORPUS = (
+    "USER: ASSISTANT: yes no Yes No YES NO Please answer yes or no. "
+    "Is the face fake real blurry smooth skin eyes mouth teeth hair jawline lighting shadow edge blending "
+    "Describe the face briefly. 是 否 真实 可疑 伪造 请判断这张人脸是否真实"
+)
+SPECIAL_TOKENS = ["<unk>", "<s>", "</s>", "<pad>", "<image>"]
+
+
+def build_tokenizer(vocab_size: int = 320):
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    backend = Tokenizer(models.BPE(unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=SPECIAL_TOKENS,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    backend.train_from_iterator([CORPUS] * 50, trainer)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        pad_token="<pad>",
+        model_input_names=["input_ids", "attention_mask"],  # no token_type_ids, like the Llama tokenizer
+    )
+    tokenizer.add_special_tokens({"additional_special_tokens": ["<image>"]})
+    return tokenizer
+
+
+def make_tiny_llava(
+    out_dir: Optional[str] = None,
+    seed: int = 0,
+    hidden_size: int = 64,
+    num_layers: int = 2,
+    vision_hidden_size: int = 32,
+) -> str:
+    """Write a random-weight LLaVA (model, tokenizer, image processor) and return its directory.
+
+    ``out_dir`` defaults to a fresh temporary directory. The same seed gives identical weights.
+    """
+    from transformers import (
+        CLIPImageProcessor,
+        CLIPVisionConfig,
+        LlamaConfig,
+        LlavaConfig,
+        LlavaForConditionalGeneration,
+    )
+
+    target = Path(out_dir) if out_dir else Path(tempfile.mkdtemp(prefix="llava-tiny-"))
+    target.mkdir(parents=True, exist_ok=True)
+
+    tokenizer = build_tokenizer()
+    tokenizer.save_pretrained(str(target))
+
+    vision_config = CLIPVisionConfig(
+        hidden_size=vision_hidden_size,
+        intermediate_size=vision_hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=2,
+        image_size=IMAGE_SIZE,
+        patch_size=PATCH_SIZE,
+        projection_dim=vision_hidden_size,
+    )
+    text_config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=512,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    config = LlavaConfig(
+        vision_config=vision_config,
+        text_config=text_config,
+        image_token_index=tokenizer.convert_tokens_to_ids("<image>"),
+        vision_feature_layer=-2,
+        vision_feature_select_strategy="default",
+        image_seq_length=(IMAGE_SIZE // PATCH_SIZE) ** 2,
+    )
+    torch.manual_seed(seed)
+    model = LlavaForConditionalGeneration(config)
+    model.save_pretrained(str(target))
+
+    image_processor = CLIPImageProcessor(
+        size={"shortest_edge": IMAGE_SIZE},
+        crop_size={"height": IMAGE_SIZE, "width": IMAGE_SIZE},
+    )
+    image_processor.save_pretrained(str(target))
+    return str(target)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a tiny random-weight LLaVA for offline benchmarks")
+    parser.add_argument("--out", default=None, help="Output directory (default: a new temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hidden-size", type=int, default=64)
+    parser.add_argument("--num-layers", type=int, default=2)
+    args = parser.parse_args()
+
+    path = make_tiny_llava(args.out, seed=args.seed, hidden_size=args.hidden_size, num_layers=args.num_layers)
+    print(f"[OK] Tiny LLaVA written to {path}")
+
+
+if __name__ == "__main__":
+    main()
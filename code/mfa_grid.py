@@ -0,0 +1,90 @@
+"""Multi-frame grid prompting: one composite image per video instead of one prefill per frame.
+
+The frames picked for a video are tiled row-major into a near-square grid (2x2 for 4 frames)
+and the grid is sent to LLaVA as a single image. ``run_mfa_ffpp.py --grid MODE`` supports two modes:
+
+  video  one prompt per question over the whole grid, giving a single video-level verdict
+         (``VideoQuestionStat`` with total=1)
+  tiles  one prompt per tile that names its row and column, giving per-tile verdicts like the
+         per-frame mode. With ``--prefix-cache`` the grid is encoded and prefilled once per video,
+         and each tile question only prefills its short text suffix.
+
+Compare a grid run against the per-frame run on the same split (BA and per-video wall time):
+
+  python code/mfa_grid.py compare mfa/ffpp_c23/mfa_ffpp_val_progress.jsonl mfa/ffpp_c23/mfa_ffpp_val_grid-video_progress.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from PIL import Image
+
+GRID_MODES = ("video", "tiles")
+TILE_SIZE = 224
+
+
+def grid_shape(count: int) -> Tuple[int, int]:
+    """(rows, cols) of the smallest near-square grid holding ``count`` tiles."""
+    cols = max(1, math.ceil(math.sqrt(count)))
+    return max(1, math.ceil(count / cols)), cols
+
+
+def tile_frames(images: Sequence[Image.Image], tile_size: int = TILE_SIZE) -> Image.Image:
+    """Paste ``images`` row-major into one RGB grid; unused cells stay black."""
+    if not images:
+        raise ValueError("no frames to tile")
+    rows, cols = grid_shape(len(images))
+    grid = Image.new("RGB", (cols * tile_size, rows * tile_size))
+    for index, image in enumerate(images):
+        row, col = divmod(index, cols)
+        tile = image.convert("RGB")
+        if tile.size != (tile_size, tile_size):
+            tile = tile.resize((tile_size, tile_size), resample=Image.BICUBIC)
+        grid.paste(tile, (col * tile_size, row * tile_size))
+    return grid
+
+
+def grid_prompts(question: str, count: int, mode: str) -> List[str]:
+    """Question texts for a grid of ``count`` frames: one for ``video``, one per tile for ``tiles``."""
+    rows, cols = grid_shape(count)
+    intro = f"The image is a {rows}x{cols} grid of {count} face crops from the same video."
+    if mode == "video":
+        return [f"{intro} Considering all crops, {question}"]
+    if mode == "tiles":
+        prompts = []
+        for index in range(count):
+            row, col = divmod(index, cols)
+            prompts.append(f"{intro} Look only at the crop in row {row + 1}, column {col + 1}. {question}")
+        return prompts
+    raise ValueError(f"grid mode must be one of {GRID_MODES}")
+
+
+def main() -> None:
+    from eval_mfa_ffpp import compare_runs, load_progress, print_comparison
+
+    parser = argparse.ArgumentParser(description="Compare per-frame and grid MFA runs (BA vs wall time)")
+    parser.add_argument("command", choices=["compare"])
+    parser.add_argument("logs", nargs="+", help="Progress logs; the first is the baseline (usually the per-frame run)")
+    parser.add_argument("--split", default="val")
+    parser.add_argument("--json", default=None, help="Also write the comparison to this JSON file")
+    args = parser.parse_args()
+
+    runs: Dict[str, list] = {}
+    for log in args.logs:
+        path = Path(log)
+        runs[path.stem.replace("_progress", "")] = load_progress(path, args.split)
+    rows = compare_runs(runs)
+    print_comparison(rows)
+    if args.json:
+        out = Path(args.json)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Comparison written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Rebuild MFA question stats from the raw per-frame sidecar without running LLaVA again.
+
+``run_mfa_ffpp.py --raw-log`` appends one compact JSON line per answered (video, frame, question) cell:
+
+  {"v": video_key, "f": frame, "q": qid, "a": answer text | "p": P(yes), "y": 1/0/null, "ms": latency, "fp": fingerprint}
+
+This tool folds those cells back into ``VideoQuestionStat``s under another rule (parser, P(yes)
+threshold, vote share, fewer frames), prints per-question BA next to the logged run, and can
+write the result as a progress log for eval_mfa_ffpp.py or ``mfa_grid.py compare``. Videos and
+questions without raw cells keep their logged stats, so both BA columns cover the same records:
+
+  python code/mfa_reaggregate.py mfa/ffpp_c23/mfa_ffpp_val_progress.raw.jsonl --vote-share 0.25 --max-frames 2
+  python code/mfa_reaggregate.py mfa/ffpp_c23/mfa_ffpp_val_progress.raw.jsonl --parser mymod:parse --out mfa/ffpp_c23/mfa_ffpp_val_reparsed_progress.jsonl
+
+With the defaults the rebuilt stats equal the logged ones.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+from collections import defaultdict
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from mfa_store import store_path
+from run_mfa_ffpp import VideoQuestionStat, VideoRecord, compute_results, load_progress, load_questions, resolve_path
+
+RawCells = Dict[str, Dict[str, List[Dict[str, object]]]]  # video_key -> question id -> cells by frame
+
+
+def load_raw(path: Path) -> RawCells:
+    """Cells per video and question, frame-ordered. For a repeated frame the last line wins, and a
+    new fingerprint for a (video, question) drops the cells written under the old one."""
+    cells: Dict[str, Dict[str, Dict[int, Dict[str, object]]]] = defaultdict(dict)
+    fingerprints: Dict[tuple, object] = {}
+    with path.open("r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                cell = json.loads(line)
+                key = (cell["v"], cell["q"])
+                frame = int(cell["f"])
+            except (ValueError, KeyError, TypeError):
+                continue  # torn or foreign line
+            if key in fingerprints and cell.get("fp") != fingerprints[key]:
+                cells[key[0]].pop(key[1], None)
+            fingerprints[key] = cell.get("fp")
+            cells[key[0]].setdefault(key[1], {})[frame] = cell
+    return {
+        video_key: {qid: [frames[f] for f in sorted(frames)] for qid, frames in questions.items()}
+        for video_key, questions in cells.items()
+    }
+
+
+def load_parser(spec: str) -> Callable[[str], Optional[bool]]:
+    """``module:function`` mapping an answer text to True / False / None."""
+    module, _, name = spec.partition(":")
+    if not name:
+        raise ValueError(f"parser must look like module:function, got {spec!r}")
+    return getattr(importlib.import_module(module), name)
+
+
+def rebuild_stat(
+    cells: List[Dict[str, object]],
+    parser: Optional[Callable[[str], Optional[bool]]] = None,
+    score_threshold: float = 0.5,
+    vote_share: float = 0.5,
+    max_frames: Optional[int] = None,
+) -> Optional[VideoQuestionStat]:
+    """One question's stat from its frame cells; None when no answer parses (as in ``fold_answers``).
+
+    Logprob cells vote yes at P(yes) >= ``score_threshold``. Generated cells reuse the logged verdict,
+    or re-parse the answer text with ``parser``. The prediction is yes >= ``vote_share`` of the votes.
+    """
+    if max_frames:
+        cells = cells[:max_frames]
+    scores: Optional[List[float]] = None
+    if cells and all(cell.get("p") is not None for cell in cells):
+        scores = [float(cell["p"]) for cell in cells]
+        verdicts = [score >= score_threshold for score in scores]
+    elif parser is not None:
+        verdicts = [verdict for verdict in (parser(str(cell.get("a", ""))) for cell in cells) if verdict is not None]
+    else:
+        verdicts = [bool(cell["y"]) for cell in cells if cell.get("y") is not None]
+    yes_count, total = sum(verdicts), len(verdicts)
+    if total == 0:
+        return None
+    return VideoQuestionStat(yes=yes_count, total=total, prediction=yes_count >= vote_share * total, scores=scores)
+
+
+def rebuild_record(record: VideoRecord, cells: Dict[str, List[Dict[str, object]]], **rule) -> VideoRecord:
+    """``record`` with every question that has raw cells (under its logged fingerprint) rebuilt by ``rule``.
+
+    Questions without raw cells keep their logged stat; a question none of whose cells parse is dropped.
+    """
+    questions = dict(record.questions)
+    for qid, question_cells in cells.items():
+        fingerprint = (record.fingerprints or {}).get(qid)
+        if fingerprint is not None:
+            question_cells = [cell for cell in question_cells if cell.get("fp") in (None, fingerprint)]
+        if not question_cells:
+            continue
+        stat = rebuild_stat(question_cells, **rule)
+        if stat is not None:
+            questions[qid] = stat
+        else:
+            questions.pop(qid, None)
+    return replace(record, questions=questions)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-aggregate MFA answers from a --raw-log sidecar")
+    parser.add_argument("raw", help="Raw sidecar written by run_mfa_ffpp.py --raw-log")
+    parser.add_argument("--progress", default=None, help="Progress log of the same run. Default: derived from the sidecar name")
+    parser.add_argument("--questions", default="config/mfa_questions.json")
+    parser.add_argument("--parser", default=None, help="module:function to re-parse generated answers (default: logged verdicts)")
+    parser.add_argument("--score-threshold", type=float, default=0.5, help="P(yes) that counts as a yes vote (logprob runs)")
+    parser.add_argument("--vote-share", type=float, default=0.5, help="Share of yes votes for a yes prediction")
+    parser.add_argument("--max-frames", type=int, default=None, help="Use only the first N frames of each video")
+    parser.add_argument("--out", default=None, help="Write the rebuilt records as a progress log")
+    parser.add_argument("--json", default=None, help="Write the per-question results to this JSON file")
+    args = parser.parse_args()
+
+    project_root = Path(__file__).resolve().parents[1]
+    raw_path = resolve_path(project_root, args.raw)
+    if args.progress:
+        progress_path = resolve_path(project_root, args.progress)
+    else:
+        progress_path = raw_path.with_name(raw_path.name.replace(".raw.jsonl", ".jsonl"))
+    out = resolve_path(project_root, args.out) if args.out else None
+    if out is not None and store_path(out).exists():
+        parser.error(f"{store_path(out)} exists and readers would load it instead of --out; pick another name")
+    raw = load_raw(raw_path)
+    logged = load_progress(progress_path)
+    rule = dict(
+        parser=load_parser(args.parser) if args.parser else None,
+        score_threshold=args.score_threshold,
+        vote_share=args.vote_share,
+        max_frames=args.max_frames,
+    )
+    base = list(logged.values())
+    rebuilt = [rebuild_record(record, raw[record.video_key], **rule) if record.video_key in raw else record for record in base]
+    with_raw = sum(1 for record in base if record.video_key in raw)
+    kept = sum(1 for record in base for qid in record.questions if not raw.get(record.video_key, {}).get(qid))
+    print(
+        f"[MFA] rebuilt {with_raw} videos from {raw_path}; {kept} logged question stats have no raw cells "
+        f"and are kept as logged ({len(base) - with_raw} videos have none at all)"
+    )
+
+    questions = load_questions(project_root / args.questions)
+    present = {qid for record in base for qid in record.questions}
+    questions = [question for question in questions if question.qid in present]
+    before = {row["id"]: row for row in compute_results(base, questions)}
+    results = compute_results(rebuilt, questions)
+    print(f"{'question':>28}{'logged BA':>11}{'rebuilt BA':>12}{'tp':>6}{'tn':>6}{'fp':>6}{'fn':>6}")
+    for row in results:
+        print(
+            f"{row['id']:>28}{before[row['id']]['balanced_accuracy']:>11.4f}{row['balanced_accuracy']:>12.4f}"
+            f"{row['tp']:>6}{row['tn']:>6}{row['fp']:>6}{row['fn']:>6}"
+        )
+
+    if out is not None:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text("".join(record.to_json() + "\n" for record in rebuilt), encoding="utf-8")
+        print(f"Rebuilt progress log written to {out}")
+    if args.json:
+        out = resolve_path(project_root, args.json)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""SQLite store for MFA per-video results, replacing the append-only progress JSONL.
+
+Each run keeps one store next to the progress log it replaces (``mfa_ffpp_val_progress.jsonl`` ->
+``mfa_ffpp_val_progress.sqlite``). Videos and their per-question stats are rows indexed on
+(split, video_key) and (split, video_key, question). The runner can therefore check and update a
+single video without parsing the log, and eval loads one split with one query. Every write is one
+transaction in WAL mode, so concurrent workers and runs can insert and top up records safely.
+
+Records go in and come out as progress JSONL dicts (``run_mfa_ffpp.VideoRecord.to_dict``).
+``export_jsonl`` writes a log in the old format, and run_mfa_ffpp.py exports after every run, so
+the tracked JSONL stays current. The file is only rewritten when its records changed, and it keeps
+its line endings. The store remembers the size and mtime of its JSONL at the last import or export,
+and the version of every video it held then. ``sync_jsonl`` re-imports a JSONL that was pulled or
+edited since, and ``load_records`` (eval_mfa_ffpp, generate_sample_cases) overlays such a JSONL on
+the store. Neither lets a JSONL row replace a video the store changed since the last sync (a newer
+answer); ``import --force`` does. Readers open the store read-only and also accept logs that never had one.
+
+CLI:
+  python code/mfa_store.py import mfa/ffpp_c23/mfa_ffpp_val_progress.jsonl [--force]
+  python code/mfa_store.py export mfa/ffpp_c23/mfa_ffpp_val_progress.jsonl --out /tmp/val_progress.jsonl
+  python code/mfa_store.py stats mfa/ffpp_c23/mfa_ffpp_val_progress.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+BASE_FIELDS = ("video_key", "video_id", "label", "method", "split")
+RESERVED_FIELDS = BASE_FIELDS + ("questions", "runtime_sec")
+
+
+def store_path(path: Path | str) -> Path:
+    """The store that backs the progress log ``path`` (either name works)."""
+    path = Path(path)
+    return path if path.suffix == ".sqlite" else path.with_suffix(".sqlite")
+
+
+def log_path(path: Path | str) -> Path:
+    """The progress JSONL name of a store or log."""
+    path = Path(path)
+    return path.with_suffix(".jsonl") if path.suffix == ".sqlite" else path
+
+
+def jsonl_signature(path: Path) -> Optional[str]:
+    """Size and mtime of a JSONL, or None when it does not exist."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def write_if_changed(path: Path, text: str) -> bool:
+    """Atomically replace ``path`` with ``text`` in the file's existing line ending.
+
+    Returns False, leaving the file untouched, when it already holds exactly that content.
+    """
+    try:
+        current: Optional[bytes] = path.read_bytes()
+    except FileNotFoundError:
+        current = None
+    newline = "\r\n" if current and current.split(b"\n", 1)[0].endswith(b"\r") else "\n"
+    data = text.replace("\n", newline).encode("utf-8")
+    if data == current:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile("wb", dir=path.parent, prefix=path.name + ".", suffix=".tmp", delete=False)
+    try:
+        with tmp:
+            tmp.write(data)
+        os.chmod(tmp.name, path.stat().st_mode & 0o777 if current is not None else 0o644)
+        os.replace(tmp.name, path)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return True
+
+
+def read_jsonl(path: Path, split: Optional[str] = None) -> Dict[str, Dict[str, object]]:
+    """Records of a progress JSONL by video_key; the last line of a video wins."""
+    records: Dict[str, Dict[str, object]] = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue  # torn last line of a killed run
+            if split is None or data.get("split") == split:
+                records[str(data.get("video_key", data.get("video_id", "")))] = data
+    return records
+
+
+def find_logs(directory: Path, pattern: str) -> List[Path]:
+    """Progress logs in ``directory`` matching a ``*_progress.jsonl`` glob, kept as JSONL, store or both.
+
+    Paths use the JSONL name; ``load_records`` reads whichever exists.
+    """
+    names = {path.name for path in directory.glob(pattern)}
+    names.update(log_path(path).name for path in directory.glob(str(Path(pattern).with_suffix(".sqlite"))))
+    return [directory / name for name in sorted(names)]
+
+
+class ResultStore:
+    def __init__(self, path: Path | str, readonly: bool = False) -> None:
+        self.path = store_path(path)
+        self.readonly = readonly
+        if readonly:
+            self.conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=60)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit; writes open their own BEGIN IMMEDIATE transaction.
+        self.conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            "video_key TEXT PRIMARY KEY, split TEXT NOT NULL, video_id TEXT, label INTEGER NOT NULL, "
+            "method TEXT, runtime_sec REAL, extra TEXT, version INTEGER NOT NULL DEFAULT 1, "
+            "synced INTEGER NOT NULL DEFAULT 0)"
+        )
+        with self.transaction() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(videos)")}
+            if "synced" not in columns:
+                # Stores from before per-video sync tracking: take every row as matching its JSONL.
+                conn.execute("ALTER TABLE videos ADD COLUMN synced INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE videos SET synced = version")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "split TEXT NOT NULL, video_key TEXT NOT NULL, qid TEXT NOT NULL, yes INTEGER NOT NULL, "
+            "total INTEGER NOT NULL, prediction INTEGER NOT NULL, scores TEXT, skipped INTEGER, "
+            "PRIMARY KEY (video_key, qid))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_split ON videos(split, video_key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_split ON questions(split, video_key, qid)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    @staticmethod
+    def _video_row(record: Dict[str, object]) -> Tuple[object, ...]:
+        extra = {key: value for key, value in record.items() if key not in RESERVED_FIELDS}
+        return (
+            str(record["video_key"]),
+            str(record.get("split", "")),
+            record.get("video_id"),
+            int(record.get("label", 0)),
+            record.get("method", ""),
+            record.get("runtime_sec"),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+
+    @staticmethod
+    def _question_rows(record: Dict[str, object]) -> List[Tuple[object, ...]]:
+        rows = []
+        for qid, stats in dict(record.get("questions", {})).items():
+            scores = stats.get("scores")
+            rows.append(
+                (
+                    str(record.get("split", "")),
+                    str(record["video_key"]),
+                    qid,
+                    int(stats.get("yes", 0)),
+                    int(stats.get("total", 0)),
+                    int(bool(stats.get("prediction", False))),
+                    json.dumps(scores) if scores is not None else None,
+                    stats.get("skipped"),
+                )
+            )
+        return rows
+
+    @staticmethod
+    def _record(video: sqlite3.Row, questions: List[sqlite3.Row]) -> Dict[str, object]:
+        video_key, split, video_id, label, method, runtime_sec, extra = video[:7]
+        stats: Dict[str, Dict[str, object]] = {}
+        for _, _, qid, yes, total, prediction, scores, skipped in questions:
+            item: Dict[str, object] = {"yes": yes, "total": total, "prediction": bool(prediction)}
+            if scores is not None:
+                item["scores"] = json.loads(scores)
+            if skipped is not None:
+                item["skipped"] = skipped
+            stats[qid] = item
+        record: Dict[str, object] = {
+            "video_key": video_key,
+            "video_id": video_id,
+            "label": label,
+            "method": method,
+            "split": split,
+            "questions": stats,
+        }
+        if runtime_sec is not None:
+            record["runtime_sec"] = runtime_sec
+        if extra:
+            record.update(json.loads(extra))
+        return record
+
+    def _write(self, conn: sqlite3.Connection, record: Dict[str, object]) -> None:
+        conn.execute("DELETE FROM questions WHERE video_key = ?", (str(record["video_key"]),))
+        conn.executemany("INSERT INTO questions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._question_rows(record))
+
+    def get(self, video_key: str) -> Optional[Tuple[Dict[str, object], int]]:
+        """(record, version) of one video, or None."""
+        video = self.conn.execute(
+            "SELECT video_key, split, video_id, label, method, runtime_sec, extra, version FROM videos WHERE video_key = ?",
+            (video_key,),
+        ).fetchone()
+        if video is None:
+            return None
+        questions = self.conn.execute(
+            "SELECT * FROM questions WHERE video_key = ? ORDER BY rowid", (video_key,)
+        ).fetchall()
+        return self._record(video, questions), int(video[7])
+
+    def __contains__(self, video_key: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM videos WHERE video_key = ?", (video_key,)).fetchone() is not None
+
+    def count(self, split: Optional[str] = None) -> int:
+        if split is None:
+            return self.conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM videos WHERE split = ?", (split,)).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def records(self, split: Optional[str] = None) -> Iterator[Dict[str, object]]:
+        """Records in first-logged order; ``split`` uses the indices instead of scanning everything."""
+        where, params = ("WHERE split = ?", (split,)) if split is not None else ("", ())
+        questions: Dict[str, List[sqlite3.Row]] = {}
+        for row in self.conn.execute(f"SELECT * FROM questions {where} ORDER BY rowid", params):
+            questions.setdefault(row[1], []).append(row)
+        videos = self.conn.execute(
+            f"SELECT video_key, split, video_id, label, method, runtime_sec, extra FROM videos {where} ORDER BY rowid",
+            params,
+        )
+        for video in videos:
+            yield self._record(video, questions.get(video[0], []))
+
+    def insert(self, record: Dict[str, object]) -> bool:
+        """Add a video unless it is logged already; returns whether it was added."""
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO videos (video_key, split, video_id, label, method, runtime_sec, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._video_row(record),
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._write(conn, record)
+        return True
+
+    def replace(self, record: Dict[str, object], version: int) -> bool:
+        """Swap in a new version of a logged video if it is still at ``version`` (compare-and-swap)."""
+        video_key, split, video_id, label, method, runtime_sec, extra = self._video_row(record)
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE videos SET split = ?, video_id = ?, label = ?, method = ?, runtime_sec = ?, extra = ?, "
+                "version = version + 1 WHERE video_key = ? AND version = ?",
+                (split, video_id, label, method, runtime_sec, extra, video_key, version),
+            )
+            if cursor.rowcount == 0:
+                return False
+            self._write(conn, record)
+        return True
+
+    def _own_log(self, path: Path) -> bool:
+        return path.resolve() == log_path(self.path).resolve()
+
+    def synced(self, path: Optional[Path] = None) -> bool:
+        """Whether the JSONL (default: this store's log) is unchanged since the last import or export."""
+        signature = jsonl_signature(path or log_path(self.path))
+        if signature is None:
+            return True
+        try:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'jsonl'").fetchone()
+        except sqlite3.OperationalError:  # read-only store created before the meta table
+            return False
+        return row is not None and row[0] == signature
+
+    def unsynced(self) -> Set[str]:
+        """Videos inserted or replaced since the last import or export of this store's JSONL."""
+        try:
+            return {row[0] for row in self.conn.execute("SELECT video_key FROM videos WHERE version > synced")}
+        except sqlite3.OperationalError:  # read-only store created before sync tracking
+            return set()
+
+    def _mark_synced(self, conn: sqlite3.Connection, path: Path) -> None:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('jsonl', ?)", (jsonl_signature(path),))
+
+    def sync_jsonl(self, path: Optional[Path] = None) -> Tuple[int, int]:
+        """Import the JSONL if it is new or changed since the last import or export; see ``import_jsonl``."""
+        path = path or log_path(self.path)
+        if self.synced(path):
+            return 0, 0
+        return self.import_jsonl(path)
+
+    def import_jsonl(self, path: Path | str, force: bool = False) -> Tuple[int, int]:
+        """Load a progress JSONL (last line of a video wins) into the store; returns (imported, kept).
+
+        A JSONL row adds a missing video or overwrites one the store has not changed since the last
+        import or export. Videos inserted or topped up since are newer than the JSONL and are kept
+        (counted in ``kept``) unless ``force``. Rows equal to the store's copy are not rewritten.
+        """
+        path = Path(path)
+        own = self._own_log(path)
+        records = read_jsonl(path)
+        imported = kept = 0
+        with self.transaction() as conn:
+            for video_key, record in records.items():
+                found = conn.execute("SELECT version, synced FROM videos WHERE video_key = ?", (video_key,)).fetchone()
+                row = self._video_row(record)
+                if found is None:
+                    conn.execute(
+                        "INSERT INTO videos (video_key, split, video_id, label, method, runtime_sec, extra) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    self._write(conn, record)
+                    imported += 1
+                elif self.get(video_key)[0] != record:  # type: ignore[index]
+                    if found[0] > found[1] and not force:
+                        kept += 1
+                        continue
+                    conn.execute(
+                        "UPDATE videos SET split = ?, video_id = ?, label = ?, method = ?, runtime_sec = ?, extra = ?, "
+                        "version = version + 1 WHERE video_key = ?",
+                        row[1:] + row[:1],
+                    )
+                    self._write(conn, record)
+                    imported += 1
+                if own:  # the store's copy of this video now matches its JSONL
+                    conn.execute("UPDATE videos SET synced = version WHERE video_key = ?", (video_key,))
+            if own:
+                self._mark_synced(conn, path)
+        return imported, kept
+
+    def export_jsonl(self, path: Path | str, split: Optional[str] = None) -> Optional[int]:
+        """Write the records as a progress JSONL (atomically); returns the number written.
+
+        Returns None, leaving the file untouched, when it already holds exactly these records.
+        """
+        path = Path(path)
+        with self.transaction() as conn:  # no writer can slip in between the read and the sync mark
+            lines = [json.dumps(record, ensure_ascii=False) for record in self.records(split)]
+            changed = write_if_changed(path, "".join(line + "\n" for line in lines))
+            if split is None and self._own_log(path):
+                self._mark_synced(conn, path)
+                conn.execute("UPDATE videos SET synced = version")
+        return len(lines) if changed else None
+
+    def stats(self) -> Dict[str, object]:
+        splits = dict(self.conn.execute("SELECT split, COUNT(*) FROM videos GROUP BY split").fetchall())
+        cells = self.conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        return {"path": str(self.path), "videos": splits, "question_cells": cells, "bytes": self.path.stat().st_size}
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def load_records(path: Path | str, split: Optional[str] = None) -> List[Dict[str, object]]:
+    """Records of a progress log, without writing anything.
+
+    Reads the store (read-only) when there is one. A JSONL that changed since the store last imported
+    or exported it (pulled, edited) overrides the store's copy of the videos it holds, as
+    ``sync_jsonl`` would, except videos the store changed since. Without a store the JSONL alone is parsed.
+    """
+    db, jsonl = store_path(path), log_path(path)
+    records: Dict[str, Dict[str, object]] = {}
+    newer: Set[str] = set()
+    if db.exists():
+        store = ResultStore(db, readonly=True)
+        try:
+            records = {str(record["video_key"]): record for record in store.records(split)}
+            if store.synced(jsonl):
+                return list(records.values())
+            newer = store.unsynced()
+        finally:
+            store.close()
+    if jsonl.exists():
+        records.update((key, record) for key, record in read_jsonl(jsonl, split).items() if key not in newer)
+    return list(records.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage MFA result stores")
+    parser.add_argument("command", choices=["import", "export", "stats"])
+    parser.add_argument("log", help="Progress log (.jsonl) or its store (.sqlite)")
+    parser.add_argument("--out", default=None, help="export: target JSONL (default: the progress log name)")
+    parser.add_argument("--split", default=None, help="export: only this split")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="import: also overwrite videos the store changed since its last import or export",
+    )
+    args = parser.parse_args()
+
+    store = ResultStore(store_path(args.log))
+    try:
+        if args.command == "import":
+            count, kept = store.import_jsonl(log_path(args.log), force=args.force)
+            print(f"Imported {count} records into {store.path}")
+            if kept:
+                print(f"Kept {kept} videos the store changed since its last sync; pass --force to take the JSONL rows")
+        elif args.command == "export":
+            out = Path(args.out) if args.out else log_path(args.log)
+            count = store.export_jsonl(out, args.split)
+            print(f"Exported {count} records to {out}" if count is not None else f"{out} is already up to date")
+        else:
+            print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
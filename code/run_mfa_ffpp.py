@@ -2,16 +2,40 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
-from collections import defaultdict
-from dataclasses import dataclass
+import math
+import multiprocessing as mp
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Container, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import torch
 from PIL import Image
 
+from eval_mfa_ffpp import POOLING_CHOICES, QuestionStats, pool_scores, pooled_bounds, rank_question_ids
+from llava_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_MB, InferenceCache, budget_kind, generate_kind
+from llava_preprocess import preprocess_images
+from llava_profile import LlavaProfiler
+from llava_quant import QUANT_CHOICES
 from llava_quant import build as load_llava
-from llava_quant import infer as llava_infer
+from llava_quant import infer_batch as llava_infer_batch
+from llava_quant import infer_with_prefix as llava_infer_with_prefix
+from llava_quant import parse_yes_no
+from llava_quant import prepare_image_prefix as llava_prepare_prefix
+from llava_quant import score_with_prefix as llava_score_with_prefix
+from llava_quant import score_yes_no as llava_score_yes_no
+from mfa_grid import GRID_MODES, grid_prompts, tile_frames
+from mfa_store import ResultStore, load_records, log_path, store_path, write_if_changed
+
+DEFAULT_PROFILE_PATH = "mfa/profile/llava_trace.jsonl"
+DEFAULT_RANKINGS_PATH = "mfa/ffpp_c23/mfa_feature_rankings.json"
+DEFAULT_CASCADE_TUNE_LOG = "mfa/ffpp_c23/mfa_ffpp_val_progress.jsonl"
 
 
 @dataclass
@@ -59,9 +83,16 @@ class VideoQuestionStat:
     yes: int
     total: int
     prediction: bool
+    scores: Optional[List[float]] = None  # per-frame P(yes) in logprob scoring mode
+    skipped: Optional[int] = None  # frames not asked because the vote was already decided (--early-exit)
 
-    def to_dict(self) -> Dict[str, int | bool]:
-        return {"yes": self.yes, "total": self.total, "prediction": self.prediction}
+    def to_dict(self) -> Dict[str, object]:
+        payload: Dict[str, object] = {"yes": self.yes, "total": self.total, "prediction": self.prediction}
+        if self.scores is not None:
+            payload["scores"] = [round(score, 4) for score in self.scores]
+        if self.skipped is not None:
+            payload["skipped"] = self.skipped
+        return payload
 
 
 @dataclass
@@ -72,8 +103,11 @@ class VideoRecord:
     method: str
     split: str
     questions: Dict[str, VideoQuestionStat]
+    runtime_sec: Optional[float] = None  # wall time spent on this video's LLaVA calls
+    cascade: Optional[Dict[str, object]] = None  # --cascade: question order, how many were asked, pooled verdict
+    fingerprints: Optional[Dict[str, str]] = None  # question id -> question_fingerprint it was answered under
 
-    def to_json(self) -> str:
+    def to_dict(self) -> Dict[str, object]:
         payload = {
             "video_key": self.video_key,
             "video_id": self.video_id,
@@ -82,16 +116,30 @@ class VideoRecord:
             "split": self.split,
             "questions": {qid: stat.to_dict() for qid, stat in self.questions.items()},
         }
-        return json.dumps(payload, ensure_ascii=False)
+        if self.runtime_sec is not None:
+            payload["runtime_sec"] = round(self.runtime_sec, 3)
+        if self.cascade is not None:
+            payload["cascade"] = self.cascade
+        if self.fingerprints is not None:
+            payload["fingerprints"] = self.fingerprints
+        return payload
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
 
     @classmethod
     def from_json(cls, line: str) -> "VideoRecord":
-        data = json.loads(line)
+        return cls.from_dict(json.loads(line))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "VideoRecord":
         questions = {
             qid: VideoQuestionStat(
                 yes=stats.get("yes", 0),
                 total=stats.get("total", 0),
                 prediction=bool(stats.get("prediction", False)),
+                scores=stats.get("scores"),
+                skipped=stats.get("skipped"),
             )
             for qid, stats in data.get("questions", {}).items()
         }
@@ -102,9 +150,74 @@ class VideoRecord:
             method=data.get("method", ""),
             split=data.get("split", ""),
             questions=questions,
+            runtime_sec=data.get("runtime_sec"),
+            cascade=data.get("cascade"),
+            fingerprints=data.get("fingerprints"),
         )
 
 
+def answer_config(args: argparse.Namespace) -> str:
+    """The run settings that change a question's answers, as a canonical string."""
+    generate = args.scoring == "generate"
+    config = {
+        "model": os.path.basename(os.path.normpath(args.model_dir)),
+        "quant": args.quant + ("+bf16" if args.cpu_bf16 else ""),
+        "scoring": args.scoring,
+        "max_new_tokens": args.max_new_tokens if generate else None,
+        "stop_on_verdict": [args.stop_on_verdict, args.rationale_tokens] if generate else None,
+        "frames_per_video": args.frames_per_video,
+        "image_tokens": args.image_tokens,
+        "grid": args.grid,
+        "early_exit": [args.early_exit_step, args.early_exit_delta] if args.early_exit else None,
+    }
+    # --batch-size is left out on purpose. Batches are left-padded with an attention mask, so batching only
+    # changes the answers at float-rounding level (rarely, a greedy near-tie). InferenceCache keys on the same
+    # assumption, and a key that included it would re-ask every question whenever the batch size is retuned.
+    return json.dumps(config, sort_keys=True)
+
+
+def question_fingerprint(question: "Question", config: str) -> str:
+    """Short hash of a question's id and prompt plus ``answer_config``; changes whenever its answers would."""
+    payload = json.dumps([question.qid, question.text_en, config], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def stale_questions(
+    record: VideoRecord, questions: List["Question"], fingerprints: Dict[str, str], legacy_stale: bool = False
+) -> List["Question"]:
+    """Questions whose cell in ``record`` is missing or was answered under a different fingerprint.
+
+    Records written before fingerprints existed count as current for the questions they hold, since
+    their config is unknown; with ``legacy_stale`` every question of such a record is stale instead.
+    """
+    if record.fingerprints is None:
+        if legacy_stale:
+            return list(questions)
+        return [question for question in questions if question.qid not in record.questions]
+    return [question for question in questions if record.fingerprints.get(question.qid) != fingerprints[question.qid]]
+
+
+def merge_record(
+    base: VideoRecord,
+    stats: Dict[str, VideoQuestionStat],
+    fingerprints: Dict[str, str],
+    current: Dict[str, str],
+    elapsed: float,
+) -> VideoRecord:
+    """``base`` with the re-asked questions in ``fingerprints`` replaced by ``stats``; the rest is kept.
+
+    ``current`` holds every question's fingerprint for this run.
+    """
+    known = dict(base.fingerprints) if base.fingerprints is not None else {}
+    if base.fingerprints is None:
+        # Legacy record: what it holds was taken as current by stale_questions, so adopt today's fingerprints.
+        known.update({qid: fingerprint for qid, fingerprint in current.items() if qid in base.questions})
+    questions = {qid: stat for qid, stat in base.questions.items() if qid not in fingerprints}
+    questions.update(stats)
+    known.update(fingerprints)
+    return replace(base, questions=questions, fingerprints=known, runtime_sec=(base.runtime_sec or 0.0) + elapsed)
+
+
 def load_metadata(project_root: Path, split: str) -> List[Dict[str, str]]:
     metadata_path = project_root / "data" / "splits" / "ffpp_c23_split.json"
     with metadata_path.open("r", encoding="utf-8") as f:
@@ -118,49 +231,442 @@ def load_questions(path: Path) -> List[Question]:
     return [Question.from_dict(item) for item in data]
 
 
+def select_questions(questions: List[Question], rankings_path: Path, budget: int, diversify: bool = False) -> List[Question]:
+    """The ``budget`` best questions by val balanced accuracy in ``rankings_path``, in ranking order.
+
+    Questions missing from the rankings rank after every ranked one, in file order.
+    """
+    rows = json.loads(rankings_path.read_text(encoding="utf-8")).get("ranking", [])
+    ranked = rank_question_ids(rows, diversify=diversify)
+    order = {qid: position for position, qid in enumerate(ranked)}
+    ordered = sorted(questions, key=lambda question: order.get(question.qid, len(order)))
+    return ordered[: max(1, budget)]
+
+
 def pick_frames(base_dir: Path, max_frames: int) -> List[Path]:
     frames = sorted(base_dir.glob("frame_*.jpg"))
     return frames[:max_frames]
 
 
-def parse_yes_no(answer: str) -> Optional[bool]:
-    text = answer.strip().lower()
-    if not text:
+def faces_dir_for(project_root: Path, entry: Dict[str, str]) -> Path:
+    return (
+        project_root
+        / "data"
+        / "processed"
+        / "ffpp_c23"
+        / "faces_224"
+        / entry["split"]
+        / ("real" if entry["label"] == 0 else "fake")
+        / entry["method"]
+        / entry["video_id"]
+    )
+
+
+@dataclass
+class LoadedVideo:
+    frames: List[Path]
+    images: List[Image.Image]  # the frames, or the one composite in --grid mode
+    pixel_values: Optional[torch.Tensor] = None  # preprocessed ``images`` for local models
+
+
+def load_video(
+    project_root: Path,
+    entry: Dict[str, str],
+    frames_per_video: int,
+    image_processor=None,
+    grid: Optional[str] = None,
+    profiler: Optional[LlavaProfiler] = None,
+) -> Optional[LoadedVideo]:
+    """Resolve, pick and decode one video's frames; None when the face directory is missing or empty.
+
+    With ``image_processor`` the images are also preprocessed, so the model loop only runs LLaVA.
+    ``profiler`` records the preprocessing as a ``preprocess_images`` op.
+    """
+    faces_dir = faces_dir_for(project_root, entry)
+    if not faces_dir.exists():
         return None
-    first = text.split()[0]
-    if first in {"yes", "y", "yeah"}:
-        return True
-    if first in {"no", "n", "nope"}:
-        return False
+    frames = pick_frames(faces_dir, frames_per_video)
+    if not frames:
+        return None
+    images = [Image.open(frame_path).convert("RGB") for frame_path in frames]
+    if grid:
+        # From here on the video is a single composite image; questions fan out per tile in grid_prompts.
+        images = [tile_frames(images)]
+    pixel_values = None
+    if image_processor is not None:
+        measured = profiler.measure("preprocess_images", items=len(images)) if profiler is not None else nullcontext()
+        with measured:
+            pixel_values = preprocess_images(images, image_processor)
+    return LoadedVideo(frames=frames, images=images, pixel_values=pixel_values)
+
+
+class VideoPrefetcher:
+    """Loads upcoming videos on a thread pool while the model loop works on the current one.
 
-    # Chinese handling
-    if text.startswith("是") or text.startswith("对"):
+    At most ``depth`` videos are loading or loaded but not yet consumed, so memory stays bounded.
+    Results come back in ``entries`` order. ``stall_seconds`` is the time the consumer waited for a
+    video that was not ready yet, and ``ready`` samples how many videos were waiting in the queue
+    at each hand-off. With ``workers=0`` loading is inline, and the stall is the whole load time.
+    """
+
+    def __init__(self, entries: List[Dict[str, str]], load: Callable[[Dict[str, str]], Any], workers: int = 2, depth: int = 4) -> None:
+        self.entries = entries
+        self.load = load
+        self.workers = max(0, int(workers))
+        self.depth = max(1, int(depth))
+        self.stall_seconds = 0.0
+        self.ready: List[int] = []
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, str], Any]]:
+        if self.workers == 0:
+            for entry in self.entries:
+                started = time.perf_counter()
+                loaded = self.load(entry)
+                self.stall_seconds += time.perf_counter() - started
+                self.ready.append(0)
+                yield entry, loaded
+            return
+        pending = iter(self.entries)
+        window: Deque[Tuple[Dict[str, str], Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mfa-prefetch") as pool:
+            for entry in pending:
+                window.append((entry, pool.submit(self.load, entry)))
+                if len(window) >= self.depth:
+                    break
+            while window:
+                entry, future = window.popleft()
+                self.ready.append(int(future.done()) + sum(1 for _, queued in window if queued.done()))
+                started = time.perf_counter()
+                loaded = future.result()
+                self.stall_seconds += time.perf_counter() - started
+                for next_entry in pending:
+                    window.append((next_entry, pool.submit(self.load, next_entry)))
+                    break
+                yield entry, loaded
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "videos": len(self.ready),
+            "stall_seconds": self.stall_seconds,
+            "avg_ready": sum(self.ready) / len(self.ready) if self.ready else 0.0,
+            "max_ready": max(self.ready, default=0),
+            "depth": self.depth,
+        }
+
+
+VideoItem = Tuple[int, str, str]  # (index into the video's images, question id, prompt)
+
+
+def build_items(questions: List[Question], image_count: int, grid: Optional[str] = None, frame_count: int = 0) -> List[VideoItem]:
+    """Every (image, question) prompt of one video in frame-major order.
+
+    In grid mode the video is one composite image and each question fans out into its tile prompts.
+    """
+    if grid:
+        return [(0, question.qid, prompt) for question in questions for prompt in grid_prompts(question.text_en, frame_count, grid)]
+    return [(index, question.qid, question.text_en) for index in range(image_count) for question in questions]
+
+
+def count_votes(answers: List[object], scoring: str) -> Tuple[int, int, Optional[List[float]]]:
+    """(yes votes, parsed answers, P(yes) per frame or None) for one question's answers."""
+    if scoring == "logprob":
+        scores = [float(score) for score in answers]
+        return sum(1 for score in scores if score >= 0.5), len(scores), scores
+    verdicts = [verdict for verdict in (parse_yes_no(str(answer)) for answer in answers) if verdict is not None]
+    return sum(verdicts), len(verdicts), None
+
+
+def majority_decided(yes: int, total: int, remaining: int, delta: Optional[float] = None) -> bool:
+    """Whether ``yes >= total / 2`` is settled with ``remaining`` frames still unasked.
+
+    Exact test: the verdict stays "yes" even if every remaining frame says no or is unparseable
+    (2*yes >= total + remaining), or stays "no" even if every remaining frame says yes
+    (2*yes + remaining < total). With ``delta`` the vote also stops once a Hoeffding bound puts the
+    yes rate away from 0.5 with confidence 1 - delta. That may differ from the all-frames vote.
+    """
+    if 2 * yes >= total + remaining or 2 * yes + remaining < total:
         return True
-    if text.startswith("否") or text.startswith("不"):
-        return False
-    return None
+    if delta and total:
+        return abs(yes / total - 0.5) >= math.sqrt(math.log(2 / delta) / (2 * total))
+    return False
 
 
-def aggregate_answers(
-    frames: List[Path],
+def fold_answers(items: List[VideoItem], outputs: List[object], scoring: str) -> Dict[str, VideoQuestionStat]:
+    """Per-question yes votes / parsed answers / P(yes) from the item outputs, frames in order."""
+    grouped: Dict[str, List[object]] = defaultdict(list)
+    for (_, qid, _), output in zip(items, outputs):
+        grouped[qid].append(output)
+    question_stats: Dict[str, VideoQuestionStat] = {}
+    for qid, answers in grouped.items():
+        yes_count, total, scores = count_votes(answers, scoring)
+        if total == 0:
+            continue
+        question_stats[qid] = VideoQuestionStat(
+            yes=yes_count, total=total, prediction=yes_count >= (total / 2), scores=scores
+        )
+    return question_stats
+
+
+def answer_video(
     processor,
     model,
     device,
-    question: Question,
+    questions: List[Question],
+    images: List[Image.Image],
     max_new_tokens: int,
-) -> Tuple[int, int]:
-    yes_count = 0
-    total = 0
-    for frame_path in frames:
-        image = Image.open(frame_path).convert("RGB")
-        answer = llava_infer(processor, model, device, image, question.text_en, max_new_tokens)
-        verdict = parse_yes_no(answer)
-        if verdict is None:
+    batch_size: int = 1,
+    scoring: str = "generate",
+    prefix_cache: bool = False,
+    cache: Optional[InferenceCache] = None,
+    stop_on_verdict: bool = False,
+    rationale_tokens: int = 0,
+    profiler: Optional[LlavaProfiler] = None,
+    pixel_values: Optional[torch.Tensor] = None,
+    image_tokens: Optional[int] = None,
+    grid: Optional[str] = None,
+    frame_count: int = 0,
+    early_exit: bool = False,
+    early_exit_step: int = 1,
+    early_exit_delta: Optional[float] = None,
+    checkpoint: Optional[CellCheckpoint] = None,
+    video_key: str = "",
+    checkpoint_every: int = 0,
+    raw: Optional[List[Dict[str, object]]] = None,
+) -> Dict[str, VideoQuestionStat]:
+    """Ask every question on every frame of one video and fold the answers into per-question stats.
+
+    Frames are decoded once by the caller (``images`` / ``pixel_values``, see ``load_video``). All
+    (frame, question) items share one cache lookup, and the misses go out as batched model calls that
+    mix questions, so batches fill up even when there are few frames. With ``prefix_cache`` each
+    frame is encoded and prefilled once, and all of its questions reuse the KV cache. ``image_tokens``
+    pools the image features to that many visual tokens. In ``grid`` mode ``images`` holds the one
+    composite of ``frame_count`` frames.
+
+    With ``early_exit`` frames are asked ``early_exit_step`` at a time. A question is dropped as soon
+    as ``majority_decided`` says its vote is settled, and its stat records the frames it skipped
+    (``total`` counts the frames used). The vote is unchanged, but a logprob mean over the frames
+    used is not comparable to a full-video score.
+
+    With ``checkpoint`` every answered cell of ``video_key`` is persisted right away (every
+    ``checkpoint_every`` items, default ``batch_size``; every frame with ``prefix_cache``), and cells
+    answered before a crash are not asked again.
+
+    ``raw`` collects one dict per answered cell: frame ``f`` (the tile in ``grid`` mode), question ``q``,
+    answer text ``a`` or P(yes) ``p``, parsed verdict ``y``, and ``ms``, the model time amortised
+    over the call that computed it (None when it came from the cache or checkpoint).
+    See mfa_reaggregate.py.
+    """
+    logprob = scoring == "logprob"
+    stop_kwargs = dict(stop_on_verdict=stop_on_verdict, rationale_tokens=rationale_tokens)
+
+    def profiled(op: str, count: int, generate: bool):
+        return profiler.call(op, items=count, generate=generate) if profiler is not None else nullcontext()
+
+    def ask(items: List[VideoItem]) -> List[object]:
+        pairs = [(images[index], prompt) for index, _, prompt in items]
+        kind = budget_kind("logprob" if logprob else generate_kind(stop_on_verdict, rationale_tokens), image_tokens)
+        budget = 0 if logprob else max_new_tokens
+
+        latency: Dict[int, float] = {}
+
+        def timed(indices: List[int]) -> List[object]:
+            started = time.perf_counter()
+            values = run(items, pairs, indices)
+            per_item = (time.perf_counter() - started) * 1000 / max(1, len(indices))
+            latency.update((k, per_item) for k in indices)
+            return values
+
+        def answer(indices: List[int]) -> List[object]:
+            if cache is None:
+                return timed(indices)
+            subset = [pairs[k] for k in indices]
+            return cache.cached(kind, subset, budget, lambda hits: timed([indices[j] for j in hits]))
+
+        if checkpoint is not None:
+            outputs = checkpoint.cached(
+                video_key, f"{kind}:{budget}", items, answer, checkpoint_every or batch_size, align_frames=prefix_cache
+            )
+        else:
+            outputs = answer(list(range(len(items))))
+        if raw is not None:
+            tiles: Dict[str, int] = defaultdict(int)
+            for k, ((index, qid, _), output) in enumerate(zip(items, outputs)):
+                slot = index if grid is None else tiles[qid]
+                tiles[qid] += 1
+                if logprob:
+                    cell = {"f": slot, "q": qid, "p": float(output), "y": int(float(output) >= 0.5)}
+                else:
+                    verdict = parse_yes_no(str(output))
+                    cell = {"f": slot, "q": qid, "a": str(output), "y": None if verdict is None else int(verdict)}
+                cell["ms"] = round(latency[k], 2) if k in latency else None
+                raw.append(cell)
+        return outputs
+
+    def run(items: List[VideoItem], pairs, indices: List[int]) -> List[object]:
+        if prefix_cache:
+            needed = sorted({items[k][0] for k in indices})
+            with profiled("prepare_prefix", len(needed), False):
+                prefixes = {
+                    index: llava_prepare_prefix(
+                        processor,
+                        model,
+                        device,
+                        images[index],
+                        pixel_values=pixel_values[index : index + 1] if pixel_values is not None else None,
+                        image_tokens=image_tokens,
+                    )
+                    for index in needed
+                }
+            if logprob:
+                with profiled("score_with_prefix", len(indices), False):
+                    return [
+                        llava_score_with_prefix(processor, model, device, prefixes[items[k][0]], items[k][2])
+                        for k in indices
+                    ]
+            with profiled("infer_with_prefix", len(indices), True):
+                return [
+                    llava_infer_with_prefix(
+                        processor, model, device, prefixes[items[k][0]], items[k][2], max_new_tokens, **stop_kwargs
+                    )
+                    for k in indices
+                ]
+        subset = [pairs[k] for k in indices]
+        pixels = pixel_values[[items[k][0] for k in indices]] if pixel_values is not None else None
+        if logprob:
+            with profiled("score_yes_no", len(indices), False):
+                return llava_score_yes_no(
+                    processor,
+                    model,
+                    device,
+                    subset,
+                    batch_size=batch_size,
+                    pixel_values=pixels,
+                    image_tokens=image_tokens,
+                )
+        with profiled("infer_batch", len(indices), True):
+            return llava_infer_batch(
+                processor,
+                model,
+                device,
+                subset,
+                max_new_tokens,
+                batch_size=batch_size,
+                pixel_values=pixels,
+                image_tokens=image_tokens,
+                **stop_kwargs,
+            )
+
+    if not early_exit:
+        items = build_items(questions, len(images), grid, frame_count)
+        return fold_answers(items, ask(items), scoring)
+
+    step = max(1, int(early_exit_step))
+    open_questions = list(questions)
+    asked_items: List[VideoItem] = []
+    asked_outputs: List[object] = []
+    answers: Dict[str, List[object]] = defaultdict(list)
+    for start in range(0, len(images), step):
+        stop = min(len(images), start + step)
+        items = [(index, question.qid, question.text_en) for index in range(start, stop) for question in open_questions]
+        outputs = ask(items)
+        asked_items.extend(items)
+        asked_outputs.extend(outputs)
+        for (_, qid, _), output in zip(items, outputs):
+            answers[qid].append(output)
+        open_questions = [
+            question
+            for question in open_questions
+            if not majority_decided(*count_votes(answers[question.qid], scoring)[:2], len(images) - stop, early_exit_delta)
+        ]
+        if not open_questions:
+            break
+    question_stats = fold_answers(asked_items, asked_outputs, scoring)
+    for qid, stat in question_stats.items():
+        stat.skipped = len(images) - len(answers[qid])
+    return question_stats
+
+
+def question_score(stat: VideoQuestionStat) -> float:
+    """The score eval_mfa_ffpp pools for this stat, from the values the progress log stores."""
+    stored = stat.to_dict()
+    return QuestionStats(yes=stat.yes, total=stat.total, scores=stored.get("scores")).score
+
+
+def cascade_video(
+    ask: Callable[[List[Question]], Dict[str, VideoQuestionStat]],
+    questions: List[Question],
+    aggregation: str,
+    threshold: float,
+    step: int = 1,
+) -> Tuple[Dict[str, VideoQuestionStat], Dict[str, object]]:
+    """Ask ``questions`` in order, ``step`` at a time, until the remaining ones cannot flip the verdict.
+
+    The verdict is ``pool_scores(scores, aggregation) >= threshold`` over every question, as in
+    eval_mfa_ffpp. After each round ``pooled_bounds`` gives the lowest and highest pooled score the
+    unasked questions could still produce. Once both sit on the same side of the threshold the
+    cascade stops, and the verdict is the one the full question set would give.
+    """
+    step = max(1, int(step))
+    question_stats: Dict[str, VideoQuestionStat] = {}
+    scores: List[float] = []
+    asked = 0
+    while asked < len(questions):
+        question_stats.update(ask(questions[asked : asked + step]))
+        asked = min(len(questions), asked + step)
+        scores = [question_score(question_stats[q.qid]) for q in questions[:asked] if q.qid in question_stats]
+        low, high = pooled_bounds(scores, len(questions) - asked, aggregation)
+        if low >= threshold or high < threshold:
+            break
+    score = pool_scores(scores, aggregation) if scores else None
+    cascade = {
+        "aggregation": aggregation,
+        "threshold": threshold,
+        "order": [question.qid for question in questions],
+        "asked": asked,
+        "score": round(score, 4) if score is not None else None,
+        "prediction": score is not None and score >= threshold,
+    }
+    return question_stats, cascade
+
+
+def cascade_threshold(val_log: Path, aggregation: str, questions: List[Question], scoring: str) -> float:
+    """Threshold for ``aggregation`` tuned on a full val run over exactly the cascade's questions.
+
+    Takes the val videos of ``val_log`` that hold every cascade question answered with ``scoring``
+    (P(yes) scores for logprob, votes for generate). It pools their ``question_score``s as
+    ``cascade_video`` does and returns the cut with the best balanced accuracy; with 4:1 fake:real,
+    F1 would favour calling everything fake. Raises when there is nothing to tune on or no cut beats
+    chance, so the caller passes --cascade-threshold instead.
+    """
+    pooled: List[float] = []
+    labels: List[int] = []
+    for record in load_progress(val_log).values():
+        stats = [record.questions.get(question.qid) for question in questions]
+        if record.split != "val" or any(stat is None or (stat.scores is not None) != (scoring == "logprob") for stat in stats):
             continue
-        total += 1
-        if verdict:
-            yes_count += 1
-    return yes_count, total
+        pooled.append(pool_scores([question_score(stat) for stat in stats], aggregation))
+        labels.append(record.label)
+    if len(set(labels)) < 2:
+        raise ValueError(
+            f"{val_log} has no real and fake val videos with all {len(questions)} cascade questions under "
+            f"{scoring} scoring; run them without --cascade first or pass --cascade-threshold"
+        )
+    best_threshold, best_accuracy = None, 0.5
+    for cut in sorted(set(pooled)):
+        tp = sum(1 for score, label in zip(pooled, labels) if score >= cut and label == 1)
+        fp = sum(1 for score, label in zip(pooled, labels) if score >= cut and label == 0)
+        fn = labels.count(1) - tp
+        tn = labels.count(0) - fp
+        accuracy = balanced_accuracy(tp, tn, fp, fn)
+        if accuracy > best_accuracy:
+            best_threshold, best_accuracy = cut, accuracy
+    if best_threshold is None:
+        raise ValueError(f"no {aggregation} threshold beats chance on {val_log}; pass --cascade-threshold")
+    print(
+        f"[MFA] cascade threshold {aggregation} >= {best_threshold:.4f} tuned on {len(labels)} val videos "
+        f"of {val_log.name} (val BA {best_accuracy:.4f})"
+    )
+    return float(best_threshold)
 
 
 def balanced_accuracy(tp: int, tn: int, fp: int, fn: int) -> float:
@@ -170,17 +676,213 @@ def balanced_accuracy(tp: int, tn: int, fp: int, fn: int) -> float:
 
 
 def load_progress(path: Path) -> Dict[str, VideoRecord]:
-    if not path.exists():
-        return {}
-    progress: Dict[str, VideoRecord] = {}
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            record = VideoRecord.from_json(line)
-            progress[record.video_key] = record
-    return progress
+    records = (VideoRecord.from_dict(data) for data in load_records(path))
+    return {record.video_key: record for record in records}
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """Exclusive inter-process lock on ``<path>.lock`` (flock on POSIX, msvcrt on Windows)."""
+    lock_path = path.with_name(path.name + ".lock")
+    with lock_path.open("a+b") as handle:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10s; keep waiting
+                    continue
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def append_lines(path: Path, lines: List[str], sync: bool = False) -> None:
+    """Append JSON lines to ``path`` in one write under ``locked``, first ending any line a killed writer tore."""
+    if not lines:
+        return
+    data = "".join(line + "\n" for line in lines).encode("utf-8")
+    with locked(path):
+        if path.exists() and path.stat().st_size:
+            with path.open("rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+        with path.open("ab") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class ProgressLog:
+    """Per-video records of a run, kept in the ``ResultStore`` next to ``path`` (the progress JSONL name).
+
+    The store is shared by concurrent workers and separate runs. ``append`` adds a record only if no
+    writer has logged its ``video_key`` yet. ``replace`` swaps in a newer version of a record read
+    with ``get`` unless another writer changed it since. Both are single SQLite transactions, and
+    lookups hit the index instead of re-reading the log. A JSONL that is new or changed since the
+    store last imported or exported it (an earlier run, a pull, an edit) is imported on open, except
+    rows of videos the store logged or topped up since, and ``export`` writes the JSONL back.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.store = ResultStore(store_path(path))
+        self.versions: Dict[str, int] = {}
+        imported, kept = self.store.sync_jsonl(log_path(path))
+        if imported:
+            print(f"[MFA] imported {imported} records from {log_path(path)} (new or changed) into {self.store.path}")
+        if kept:
+            print(
+                f"[WARN] kept {kept} videos the store logged or topped up after its last export over their older rows "
+                f"in {log_path(path)}; `python code/mfa_store.py import --force` takes the JSONL rows"
+            )
+
+    def get(self, video_key: str) -> Optional[VideoRecord]:
+        found = self.store.get(video_key)
+        if found is None:
+            return None
+        data, self.versions[video_key] = found
+        return VideoRecord.from_dict(data)
+
+    def __contains__(self, video_key: str) -> bool:
+        return video_key in self.store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def records(self) -> Dict[str, VideoRecord]:
+        return {str(data["video_key"]): VideoRecord.from_dict(data) for data in self.store.records()}
+
+    def append(self, record: VideoRecord) -> bool:
+        """Write ``record`` unless its video is already logged; returns whether it was written."""
+        return self.store.insert(record.to_dict())
+
+    def replace(self, base: VideoRecord, record: VideoRecord) -> bool:
+        """Log ``record`` as the new version of ``base`` (read with ``get``) unless another writer changed that video first."""
+        version = self.versions.get(base.video_key)
+        return version is not None and self.store.replace(record.to_dict(), version)
+
+    def export(self, path: Optional[Path] = None) -> Optional[int]:
+        """Write the records as a progress JSONL (default: ``log_path``); returns the number written, None if unchanged."""
+        return self.store.export_jsonl(path or log_path(self.path))
+
+
+class CellCheckpoint:
+    """Answers of single (video, frame, prompt) cells for videos that are not in the progress log yet.
+
+    ``answer_video`` writes each chunk of new answers here as soon as it comes back: one JSON
+    line per cell, appended under ``locked``, flushed and fsynced. A crash or Ctrl-C therefore loses
+    at most the chunk in flight, and the next run resumes at the first missing cell. A line cut off by
+    a crash is skipped on load. ``compact`` drops cells of finished videos. Cells are keyed by the
+    run's ``answer_config`` (model, quant, scoring, frames, ...), the answer kind (decode budget,
+    visual tokens), frame index and prompt text, so a resume under another model or config re-asks.
+    """
+
+    def __init__(self, path: Path, config: str = "") -> None:
+        self.path = path
+        self.config = config
+        self.cells = self._load()
+        self.resumed = 0
+        self.written = 0
+
+    def _load(self) -> Dict[str, Dict[str, object]]:
+        cells: Dict[str, Dict[str, object]] = defaultdict(dict)
+        if self.path.exists():
+            for line in self.path.read_bytes().decode("utf-8", errors="replace").splitlines():
+                try:
+                    data = json.loads(line)
+                    cells[data["video_key"]][data["cell"]] = data["output"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # torn or foreign line
+        return cells
+
+    def cell_key(self, kind: str, index: int, prompt: str) -> str:
+        return hashlib.sha256(f"{self.config}\0{kind}\0{index}\0{prompt}".encode("utf-8")).hexdigest()[:24]
+
+    def __len__(self) -> int:
+        return sum(len(cells) for cells in self.cells.values())
+
+    def _append(self, lines: List[str]) -> None:
+        append_lines(self.path, lines, sync=True)
+
+    def cached(
+        self,
+        video_key: str,
+        kind: str,
+        items: List[VideoItem],
+        answer: Callable[[List[int]], List[object]],
+        chunk_size: int,
+        align_frames: bool = False,
+    ) -> List[object]:
+        """Outputs for ``items``: checkpointed cells as stored, the rest from ``answer`` chunk by chunk.
+
+        Chunks hold ``chunk_size`` items, or one frame's items with ``align_frames`` (one prefill each).
+        """
+        stored = self.cells[video_key]
+        keys = [self.cell_key(kind, index, prompt) for index, _, prompt in items]
+        outputs: List[object] = [stored.get(key) for key in keys]
+        missing = [k for k, output in enumerate(outputs) if output is None]
+        self.resumed += len(items) - len(missing)
+        chunks: List[List[int]] = []
+        for k in missing:
+            if chunks and (
+                items[chunks[-1][-1]][0] == items[k][0] if align_frames else len(chunks[-1]) < max(1, chunk_size)
+            ):
+                chunks[-1].append(k)
+            else:
+                chunks.append([k])
+        for chunk in chunks:
+            values = answer(chunk)
+            lines = []
+            for k, value in zip(chunk, values):
+                outputs[k] = stored[keys[k]] = value
+                cell = {"video_key": video_key, "frame": items[k][0], "qid": items[k][1], "kind": kind, "cell": keys[k], "output": value}
+                lines.append(json.dumps(cell, ensure_ascii=False))
+            self._append(lines)
+            self.written += len(lines)
+        return outputs
+
+    def forget(self, video_key: str) -> None:
+        self.cells.pop(video_key, None)
+
+    def compact(self, finished: Container[str]) -> int:
+        """Rewrite the file without the cells of ``finished`` videos (atomically); returns cells kept.
+
+        The file is re-read under the lock first, so cells other processes appended since this one
+        loaded it are kept.
+        """
+        with locked(self.path):
+            self.cells = self._load()
+            for video_key in [key for key in self.cells if key in finished]:
+                self.forget(video_key)
+            if not self.cells or not any(self.cells.values()):
+                if self.path.exists():
+                    self.path.unlink()
+                return 0
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                for video_key, cells in self.cells.items():
+                    for cell, output in cells.items():
+                        f.write(json.dumps({"video_key": video_key, "cell": cell, "output": output}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        return len(self)
 
 
 def compute_results(records: Iterable[VideoRecord], questions: List[Question]) -> List[Dict[str, object]]:
@@ -233,24 +935,489 @@ def resolve_path(base: Path, raw: str) -> Path:
     return path
 
 
+def process_videos(
+    args: argparse.Namespace,
+    entries: List[Dict[str, str]],
+    questions: List[Question],
+    project_root: Path,
+    progress_path: Path,
+    worker: Optional[int] = None,
+) -> Tuple[int, int, int]:
+    """Run MFA on ``entries`` and append or top up one record per video.
+
+    Returns (new videos, logged videos topped up with re-asked questions, videos without frames).
+
+    Loads its own model (or connects to ``--server``), so it runs unchanged inside a worker process.
+    """
+    tag = f" w{worker}" if worker is not None else ""
+    remote = bool(args.server) or args.replicas > 1
+    if args.replicas > 1:
+        from llava_pool import build as load_pool
+
+        processor, model, device = load_pool(
+            args.model_dir,
+            replicas=args.replicas,
+            dispatch=args.dispatch,
+            dtype=args.replica_dtype,
+            cpu_bf16=args.cpu_bf16,
+        )
+    else:
+        processor, model, device = load_llava(
+            args.model_dir,
+            args.quant,
+            args.max_new_tokens,
+            force_cpu=False,
+            quant_cache=args.quant_cache,
+            cpu_bf16=args.cpu_bf16,
+            server=args.server,
+        )
+    cache: Optional[InferenceCache] = None
+    if args.infer_cache:
+        cache = InferenceCache(
+            resolve_path(project_root, args.infer_cache),
+            model_dir=args.model_dir,
+            quant=args.quant + ("+bf16" if args.cpu_bf16 else ""),
+            max_bytes=args.infer_cache_max_mb * 1024 * 1024,
+        )
+    profiler: Optional[LlavaProfiler] = None
+    if args.profile:
+        trace_path = resolve_path(project_root, args.profile)
+        if worker is not None:
+            trace_path = trace_path.with_name(f"{trace_path.stem}.w{worker}{trace_path.suffix}")
+        profiler = LlavaProfiler(trace_path).attach(processor, model)
+    # Decode and preprocess every frame once per video, ahead of the model loop; all questions reuse the tensors.
+    image_processor = processor.image_processor if not remote else None
+    prefetcher = VideoPrefetcher(
+        entries,
+        lambda entry: load_video(project_root, entry, args.frames_per_video, image_processor, args.grid, profiler),
+        workers=args.prefetch_workers,
+        depth=args.prefetch_depth,
+    )
+
+    progress = ProgressLog(progress_path)
+    config = answer_config(args)
+    checkpoint: Optional[CellCheckpoint] = None
+    if args.checkpoint:
+        # answer_config names the model by its directory; the local checkpoint can tell two checkpoints apart.
+        model_source = os.path.realpath(args.model_dir) if os.path.isdir(args.model_dir) else args.model_dir
+        checkpoint = CellCheckpoint(Path(args.checkpoint), f"{config}\0{model_source}")
+    raw_path = Path(args.raw_log) if args.raw_log else None
+    new_processed = 0
+    skipped_missing = 0
+    frames_skipped = frames_possible = 0
+    questions_asked = videos_asked = 0
+    cells_updated = videos_updated = 0
+    fingerprints = {question.qid: question_fingerprint(question, config) for question in questions}
+
+    for entry, loaded in prefetcher:
+        video_key = entry["path"]
+        base = progress.get(video_key)
+        todo = questions
+        if base is not None:
+            # Logged already: only questions added or changed since (cascade runs never top up).
+            todo = [] if args.cascade else stale_questions(base, questions, fingerprints, args.refresh_legacy)
+            if not todo:
+                continue  # finished by another worker or run meanwhile
+        if loaded is None:
+            skipped_missing += 1
+            continue
+
+        label = int(entry["label"])
+        started = time.perf_counter()
+        frames, images, pixel_values = loaded.frames, loaded.images, loaded.pixel_values
+
+        raw_cells: Optional[List[Dict[str, object]]] = [] if raw_path is not None else None
+
+        def ask(subset: List[Question]) -> Dict[str, VideoQuestionStat]:
+            return answer_video(
+                processor,
+                model,
+                device,
+                subset,
+                images,
+                args.max_new_tokens,
+                batch_size=args.batch_size,
+                scoring=args.scoring,
+                prefix_cache=args.prefix_cache,
+                cache=cache,
+                stop_on_verdict=args.stop_on_verdict,
+                rationale_tokens=args.rationale_tokens,
+                profiler=profiler,
+                pixel_values=pixel_values,
+                image_tokens=args.image_tokens,
+                grid=args.grid,
+                frame_count=len(frames),
+                early_exit=args.early_exit,
+                early_exit_step=args.early_exit_step,
+                early_exit_delta=args.early_exit_delta,
+                checkpoint=checkpoint,
+                video_key=video_key,
+                checkpoint_every=args.checkpoint_every,
+                raw=raw_cells,
+            )
+
+        cascade: Optional[Dict[str, object]] = None
+        if args.cascade:
+            question_stats, cascade = cascade_video(ask, todo, args.cascade, args.cascade_threshold, args.cascade_step)
+            asked = todo[: int(cascade["asked"])]
+        else:
+            question_stats = ask(todo)
+            asked = todo
+        questions_asked += len(asked)
+        frames_skipped += sum(stat.skipped or 0 for stat in question_stats.values())
+        frames_possible += len(frames) * len(asked)
+        asked_fingerprints = {question.qid: fingerprints[question.qid] for question in asked}
+
+        if base is not None:
+            record = merge_record(base, question_stats, asked_fingerprints, fingerprints, time.perf_counter() - started)
+            appended = progress.replace(base, record)
+        else:
+            # Even if no question had total>0 we still store record to avoid reprocessing next time
+            record = VideoRecord(
+                video_key=video_key,
+                video_id=str(entry["video_id"]),
+                label=label,
+                method=str(entry["method"]),
+                split=str(entry["split"]),
+                questions=question_stats,
+                runtime_sec=time.perf_counter() - started,
+                cascade=cascade,
+                fingerprints=asked_fingerprints,
+            )
+            appended = progress.append(record)
+        if checkpoint is not None:
+            checkpoint.forget(video_key)
+        if not appended:
+            continue
+        if raw_path is not None and raw_cells:
+            raw_lines = []
+            for cell in raw_cells:
+                cell = {"v": video_key, **cell, "fp": asked_fingerprints.get(str(cell["q"]))}
+                raw_lines.append(json.dumps(cell, ensure_ascii=False, separators=(",", ":")))
+            append_lines(raw_path, raw_lines)
+        videos_asked += 1
+        if base is not None:
+            videos_updated += 1
+            cells_updated += len(asked)
+        else:
+            new_processed += 1
+
+        if args.progress_interval and videos_asked % args.progress_interval == 0:
+            print(
+                f"[MFA{tag}] processed {new_processed} new and topped up {videos_updated} of {len(entries)} videos "
+                f"(cumulative {len(progress)} in log)"
+            )
+
+    if videos_updated:
+        print(f"[MFA{tag}] updated {videos_updated} logged videos with {cells_updated} missing or stale question cells")
+    if checkpoint is not None and (checkpoint.resumed or checkpoint.written):
+        print(f"[MFA{tag}] checkpoint: resumed {checkpoint.resumed} cells, wrote {checkpoint.written} ({checkpoint.path})")
+    prefetch = prefetcher.stats()
+    if prefetch["videos"]:
+        print(
+            f"[MFA{tag}] prefetch ({args.prefetch_workers} threads): waited {prefetch['stall_seconds']:.2f}s for frames "
+            f"over {prefetch['videos']} videos, {prefetch['avg_ready']:.1f} ready on average "
+            f"(max {prefetch['max_ready']}, depth {prefetch['depth']})"
+        )
+    if args.cascade and videos_asked:
+        print(
+            f"[MFA{tag}] cascade asked {questions_asked / videos_asked:.2f}/{len(questions)} questions per video "
+            f"({args.cascade} >= {args.cascade_threshold:.4f})"
+        )
+    if args.early_exit and frames_possible:
+        print(
+            f"[MFA{tag}] early exit skipped {frames_skipped}/{frames_possible} frame-question calls "
+            f"({frames_skipped / frames_possible:.1%})"
+        )
+    if cache is not None:
+        stats = cache.stats()
+        print(f"[MFA{tag}] inference cache: {stats['session_hits']} hits, {stats['session_misses']} misses ({stats['path']})")
+        cache.close()
+    if profiler is not None:
+        profiler.close()
+        print(f"[MFA{tag}] LLaVA profile trace: {profiler.path} (summarise with code/llava_profile.py summarize)")
+    if args.replicas > 1:
+        print(f"[MFA{tag}] replica pool: {model.stats()}")
+        model.close()
+    return new_processed, videos_updated, skipped_missing
+
+
+def _worker_main(worker: int, args, entries, questions, project_root: Path, progress_path: Path, threads: int, results) -> None:
+    if threads:
+        torch.set_num_threads(threads)
+    new_processed, updated, skipped_missing = process_videos(args, entries, questions, project_root, progress_path, worker)
+    print(f"[MFA w{worker}] done: {new_processed} new videos, {updated} topped up, {skipped_missing} without frames")
+    results.put((new_processed, updated, skipped_missing))
+
+
+def run_workers(
+    args: argparse.Namespace,
+    entries: List[Dict[str, str]],
+    questions: List[Question],
+    project_root: Path,
+    progress_path: Path,
+) -> Tuple[int, int, int]:
+    """Shard ``entries`` round-robin over ``--workers`` processes that share the locked progress log.
+
+    Each worker loads its own model, or connects to ``--server``. Local CPU workers split the cores
+    between them, and local GPU workers are spread over the visible GPUs. Returns the workers' summed
+    ``process_videos`` counts (new, topped up, without frames).
+    """
+    workers = min(args.workers, len(entries))
+    ctx = mp.get_context("spawn")
+    gpus = torch.cuda.device_count() if not args.server else 0
+    threads = 0 if args.server or gpus else max(1, (os.cpu_count() or 1) // workers)
+    results = ctx.Queue()
+    processes = []
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    try:
+        for worker in range(workers):
+            if gpus > 1:
+                os.environ["CUDA_VISIBLE_DEVICES"] = str(worker % gpus)  # inherited by the spawned child
+            process = ctx.Process(
+                target=_worker_main,
+                args=(worker, args, entries[worker::workers], questions, project_root, progress_path, threads, results),
+            )
+            process.start()
+            processes.append(process)
+    finally:
+        if gpus > 1:
+            if visible is None:
+                os.environ.pop("CUDA_VISIBLE_DEVICES", None)
+            else:
+                os.environ["CUDA_VISIBLE_DEVICES"] = visible
+    print(f"[MFA] {workers} workers started on {len(entries)} pending videos")
+    failed = []
+    for worker, process in enumerate(processes):
+        process.join()
+        if process.exitcode != 0:
+            failed.append(worker)
+    if failed:
+        print(f"[WARN] workers {failed} exited with errors; re-run to resume their remaining videos")
+    new_processed = updated = skipped_missing = 0
+    for _ in range(len(processes) - len(failed)):
+        done, topped_up, missing = results.get()
+        new_processed += done
+        updated += topped_up
+        skipped_missing += missing
+    return new_processed, updated, skipped_missing
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Run MFA with LLaVA on FF++ c23 faces")
     parser.add_argument("--split", choices=["train", "val", "test"], default="val")
     parser.add_argument("--model-dir", required=True, help="Path to local LLaVA model directory")
-    parser.add_argument("--quant", choices=["none", "4bit", "8bit"], default="4bit")
+    parser.add_argument("--quant", choices=QUANT_CHOICES, default="4bit")
+    parser.add_argument("--quant-cache", default=None, help="Cache file for cpu-int8 weights (skips re-quantising)")
+    parser.add_argument("--cpu-bf16", action="store_true", help="Enable bf16 autocast for CPU inference")
+    parser.add_argument(
+        "--server",
+        default=None,
+        help="URL of a running llava_server.py (e.g. http://127.0.0.1:8765); skips loading the model here",
+    )
+    parser.add_argument(
+        "--replicas",
+        type=int,
+        default=1,
+        help="CPU worker processes sharing memory-mapped weights (llava_pool); needs --quant none",
+    )
+    parser.add_argument("--dispatch", choices=["least-loaded", "round-robin"], default="least-loaded")
+    parser.add_argument(
+        "--replica-dtype",
+        choices=["auto", "float32", "bfloat16", "float16"],
+        default="auto",
+        help="Replica weight dtype; anything but the stored dtype gives each replica a private copy",
+    )
     parser.add_argument("--max-new-tokens", type=int, default=64)
     parser.add_argument("--frames-per-video", type=int, default=4)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=4,
+        help="(frame, question) items per batched LLaVA call, for generate and logprob scoring alike "
+        "(unused with --prefix-cache, which answers one item at a time)",
+    )
+    parser.add_argument(
+        "--scoring",
+        choices=["generate", "logprob"],
+        default="generate",
+        help="generate: decode and parse yes/no; logprob: single prefill, store per-frame P(yes)",
+    )
+    parser.add_argument(
+        "--image-tokens",
+        type=int,
+        default=None,
+        help="Visual-token budget: pool the 576 projected image tokens down to this perfect square "
+        "(e.g. 144 or 64) for a faster, cheaper screening pass. Default: full resolution",
+    )
+    parser.add_argument(
+        "--grid",
+        choices=GRID_MODES,
+        default=None,
+        help="Tile a video's frames into one image: 'video' asks each question once for a single verdict, "
+        "'tiles' asks once per tile (one grid prefill per video with --prefix-cache). See mfa_grid.py",
+    )
+    parser.add_argument(
+        "--early-exit",
+        action="store_true",
+        help="Ask frames a few at a time and stop a question once its majority vote cannot change; "
+        "skipped frames are recorded per question. Votes match a full run, but logprob means cover only the "
+        "frames asked, so eval_mfa_ffpp.py reports these videos separately",
+    )
+    parser.add_argument("--early-exit-step", type=int, default=1, help="Frames asked per round with --early-exit")
+    parser.add_argument(
+        "--early-exit-delta",
+        type=float,
+        default=None,
+        help="Also stop when a Hoeffding bound at confidence 1-delta excludes a 50%% yes rate (may change predictions)",
+    )
+    parser.add_argument(
+        "--prefix-cache",
+        action="store_true",
+        help="Encode each frame and prefill its image prefix once, then reuse the KV cache for every question",
+    )
+    parser.add_argument(
+        "--infer-cache",
+        nargs="?",
+        const=DEFAULT_CACHE_PATH,
+        default=None,
+        help=f"Persistent answer cache (SQLite). Bare flag uses {DEFAULT_CACHE_PATH}",
+    )
+    parser.add_argument("--infer-cache-max-mb", type=int, default=DEFAULT_MAX_MB)
+    parser.add_argument(
+        "--stop-on-verdict",
+        action="store_true",
+        help="Stop decoding as soon as a yes/no verdict is parseable (generate scoring only)",
+    )
+    parser.add_argument(
+        "--rationale-tokens",
+        type=int,
+        default=0,
+        help="Extra tokens allowed after the verdict when --stop-on-verdict is set",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=DEFAULT_PROFILE_PATH,
+        default=None,
+        help=f"Write per-call stage latencies (JSONL) for llava_profile.py. Bare flag uses {DEFAULT_PROFILE_PATH}",
+    )
+    parser.add_argument(
+        "--cascade",
+        choices=POOLING_CHOICES,
+        default=None,
+        help="Ask questions per video in ranked order and stop once the pooled score (mean/max/topk, as in "
+        "eval_mfa_ffpp) cannot cross the threshold whatever the remaining questions answer",
+    )
+    parser.add_argument(
+        "--cascade-threshold",
+        type=float,
+        default=None,
+        help="Decision threshold for --cascade. Default: tuned on --cascade-tune-log for the cascade's questions and scoring",
+    )
+    parser.add_argument(
+        "--cascade-tune-log",
+        default=DEFAULT_CASCADE_TUNE_LOG,
+        help="Full (non-cascade) val progress log the default --cascade-threshold is tuned on",
+    )
+    parser.add_argument("--cascade-step", type=int, default=1, help="Questions asked per round with --cascade")
     parser.add_argument("--limit", type=int, default=None)
     parser.add_argument("--questions", default="config/mfa_questions.json")
+    parser.add_argument(
+        "--question-budget",
+        type=int,
+        default=None,
+        help="Ask only the top-K questions by val balanced accuracy in --rankings (eval_mfa_ffpp.py reports "
+        "accuracy vs K under efficiency.question_budget). Default: every question",
+    )
+    parser.add_argument(
+        "--rankings", default=DEFAULT_RANKINGS_PATH, help="Question ranking used by --question-budget and --cascade"
+    )
+    parser.add_argument(
+        "--diversify",
+        action="store_true",
+        help="With --question-budget, take each category's best question before any category's second",
+    )
     parser.add_argument("--output", default=None, help="Optional output prefix for reports")
     parser.add_argument(
         "--progress-log",
         default=None,
-        help="Optional progress log (jsonl). Defaults to mfa/ffpp_c23/mfa_ffpp_<split>_progress.jsonl",
+        help="Optional progress log (jsonl), exported from the .sqlite store next to it after each run. "
+        "Defaults to mfa/ffpp_c23/mfa_ffpp_<split>_progress.jsonl",
+    )
+    parser.add_argument(
+        "--no-export-jsonl",
+        action="store_true",
+        help="Skip rewriting the progress JSONL from the store at the end of the run (one pass over the store)",
+    )
+    parser.add_argument(
+        "--refresh-legacy",
+        action="store_true",
+        help="Re-ask every question of logged videos that predate question fingerprints "
+        "(default: keep their answers as current, since the config that produced them is unknown)",
+    )
+    parser.add_argument(
+        "--prefetch-workers",
+        type=int,
+        default=2,
+        help="Threads that find, decode and preprocess upcoming videos while the model runs (0 = load inline)",
+    )
+    parser.add_argument("--prefetch-depth", type=int, default=4, help="Videos loaded ahead of the model loop at most")
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="Per-cell answer checkpoint (jsonl) for resuming mid-video. Defaults to <progress log>.cells.jsonl",
+    )
+    parser.add_argument("--no-checkpoint", action="store_true", help="Only save whole videos to the progress log")
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=0,
+        help="Items answered between checkpoint writes (default: --batch-size; one frame with --prefix-cache)",
+    )
+    parser.add_argument(
+        "--raw-log",
+        nargs="?",
+        const="",
+        default=None,
+        help="Also append every frame's raw answer / P(yes), parsed verdict and latency to a JSONL sidecar "
+        "for mfa_reaggregate.py. Bare flag uses <progress log>.raw.jsonl",
     )
     parser.add_argument("--progress-interval", type=int, default=20, help="Print progress every N new videos")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Shard pending videos over N processes, each with its own model (or --server connection); "
+        "they append to the same progress log under a file lock",
+    )
 
     args = parser.parse_args()
+    if args.replicas > 1 and args.server:
+        parser.error("--replicas and --server are mutually exclusive")
+    if args.replicas > 1 and args.quant != "none":
+        parser.error("--replicas runs unquantised CPU replicas; use --quant none")
+    if args.early_exit and args.grid:
+        parser.error("--early-exit votes over frames; --grid asks about all frames at once")
+    if args.question_budget is not None and args.question_budget < 1:
+        parser.error("--question-budget must be at least 1")
+    if args.workers > 1 and args.replicas > 1:
+        parser.error("--workers and --replicas both start processes; pick one")
+    remote = bool(args.server) or args.replicas > 1
+    if remote and args.prefix_cache:
+        parser.error("--prefix-cache needs a local model and cannot be combined with --server/--replicas")
+    if remote and args.profile:
+        parser.error("--profile hooks the local model and cannot be combined with --server/--replicas")
+    if remote and args.image_tokens is not None:
+        parser.error("--image-tokens needs a local model and cannot be combined with --server/--replicas")
+    # Budgeted runs get their own default logs/reports so they can be compared against full runs.
+    budget_suffix = f"_img{args.image_tokens}" if args.image_tokens is not None else ""
+    if args.grid:
+        budget_suffix += f"_grid-{args.grid}"
+    if args.question_budget is not None:
+        budget_suffix += f"_top{args.question_budget}" + ("d" if args.diversify else "")
+    if args.cascade:
+        budget_suffix += f"_cascade-{args.cascade}"
     project_root = Path(__file__).resolve().parents[1]
 
     entries = load_metadata(project_root, args.split)
@@ -258,91 +1425,103 @@ def main() -> None:
         entries = entries[: args.limit]
 
     questions = load_questions(project_root / args.questions)
+    if args.question_budget is not None or args.cascade:
+        budget = args.question_budget if args.question_budget is not None else len(questions)
+        questions = select_questions(questions, resolve_path(project_root, args.rankings), budget, args.diversify)
+        print(f"[MFA] questions in ranked order: {', '.join(question.qid for question in questions)}")
+    if args.cascade and args.cascade_threshold is None:
+        try:
+            args.cascade_threshold = cascade_threshold(
+                resolve_path(project_root, args.cascade_tune_log), args.cascade, questions, args.scoring
+            )
+        except ValueError as err:
+            parser.error(str(err))
 
-    progress_default = f"mfa/ffpp_c23/mfa_ffpp_{args.split}_progress.jsonl"
+    progress_default = f"mfa/ffpp_c23/mfa_ffpp_{args.split}{budget_suffix}_progress.jsonl"
     progress_path = resolve_path(project_root, args.progress_log or progress_default)
     progress_path.parent.mkdir(parents=True, exist_ok=True)
-    progress_records = load_progress(progress_path)
-    processed_keys = set(progress_records.keys())
+    progress = ProgressLog(progress_path)
+    if args.raw_log is not None:
+        default_raw = progress_path.with_name(progress_path.stem + ".raw.jsonl")
+        args.raw_log = str(resolve_path(project_root, args.raw_log) if args.raw_log else default_raw)
+    if args.no_checkpoint:
+        args.checkpoint = None
+    else:
+        default_checkpoint = progress_path.with_name(progress_path.stem + ".cells.jsonl")
+        args.checkpoint = str(resolve_path(project_root, args.checkpoint) if args.checkpoint else default_checkpoint)
 
     total_entries = len(entries)
-    already_done = len(processed_keys)
+    already_done = len(progress)
     if already_done:
-        print(f"[MFA] found {already_done} previously processed videos in {progress_path}")
-
-    processor, model, device = load_llava(args.model_dir, args.quant, args.max_new_tokens, force_cpu=False)
-
-    new_processed = 0
-    skipped_existing = 0
-    skipped_missing = 0
+        print(f"[MFA] found {already_done} previously processed videos in {progress.store.path}")
+    config = answer_config(args)
+    fingerprints = {question.qid: question_fingerprint(question, config) for question in questions}
 
-    for idx, entry in enumerate(entries, 1):
-        video_key = entry["path"]
-        if video_key in processed_keys:
-            skipped_existing += 1
-            continue
+    def finished_videos(records: Dict[str, VideoRecord]) -> Set[str]:
+        # A logged video still being topped up keeps its checkpointed cells until no question is stale.
+        if args.cascade:
+            return set(records)
+        return {
+            key for key, record in records.items() if not stale_questions(record, questions, fingerprints, args.refresh_legacy)
+        }
 
-        faces_dir = (
-            project_root
-            / "data"
-            / "processed"
-            / "ffpp_c23"
-            / "faces_224"
-            / entry["split"]
-            / ("real" if entry["label"] == 0 else "fake")
-            / entry["method"]
-            / entry["video_id"]
-        )
-        if not faces_dir.exists():
-            skipped_missing += 1
-            continue
-        frames = pick_frames(faces_dir, args.frames_per_video)
-        if not frames:
-            skipped_missing += 1
+    if args.checkpoint:
+        kept = CellCheckpoint(Path(args.checkpoint)).compact(finished_videos(progress.records()))
+        if kept:
+            print(f"[MFA] checkpoint holds {kept} cells of unfinished videos ({args.checkpoint})")
+    pending: List[Dict[str, str]] = []
+    seen_keys = set()
+    stale_videos = stale_cells = legacy_kept = 0
+    for entry in entries:
+        if entry["path"] in seen_keys:
             continue
-
-        label = int(entry["label"])
-        question_stats: Dict[str, VideoQuestionStat] = {}
-        for question in questions:
-            yes_count, total = aggregate_answers(frames, processor, model, device, question, args.max_new_tokens)
-            if total == 0:
+        record = progress.get(entry["path"])
+        if record is not None:
+            stale = [] if args.cascade else stale_questions(record, questions, fingerprints, args.refresh_legacy)
+            if record.fingerprints is None and not args.refresh_legacy:
+                legacy_kept += 1
+            if not stale:
                 continue
-            prediction = yes_count >= (total / 2)
-            question_stats[question.qid] = VideoQuestionStat(yes=yes_count, total=total, prediction=prediction)
-
-        # Even if no question had total>0 we still store record to avoid reprocessing next time
-        record = VideoRecord(
-            video_key=video_key,
-            video_id=str(entry["video_id"]),
-            label=label,
-            method=str(entry["method"]),
-            split=str(entry["split"]),
-            questions=question_stats,
+            stale_videos += 1
+            stale_cells += len(stale)
+        seen_keys.add(entry["path"])
+        pending.append(entry)
+    skipped_existing = total_entries - len(pending)
+    if stale_videos:
+        print(f"[MFA] {stale_videos} logged videos miss {stale_cells} question cells (new or changed questions/config)")
+    if legacy_kept:
+        print(
+            f"[WARN] {legacy_kept} logged videos predate question fingerprints; their answers are kept as current "
+            "whatever config produced them. Pass --refresh-legacy to re-ask them"
         )
-        with progress_path.open("a", encoding="utf-8") as f:
-            f.write(record.to_json() + "\n")
-        progress_records[video_key] = record
-        processed_keys.add(video_key)
-        new_processed += 1
-
-        if args.progress_interval and new_processed % args.progress_interval == 0:
-            cumulative = len(progress_records)
-            print(
-                f"[MFA] processed new {new_processed}/{total_entries - skipped_existing} videos "
-                f"(cumulative {cumulative}/{total_entries})"
-            )
 
-    results = compute_results(progress_records.values(), questions)
+    if args.workers > 1 and pending:
+        new_processed, updated, skipped_missing = run_workers(args, pending, questions, project_root, progress_path)
+    else:
+        new_processed, updated, skipped_missing = process_videos(args, pending, questions, project_root, progress_path)
+    progress_records = progress.records()
+    if args.checkpoint:
+        CellCheckpoint(Path(args.checkpoint)).compact(finished_videos(progress_records))
+    if not args.no_export_jsonl:
+        exported = progress.export()
+        if exported is None:
+            print(f"[MFA] {log_path(progress_path)} is up to date")
+        else:
+            print(f"[MFA] exported {exported} records to {log_path(progress_path)}")
 
-    output_prefix = resolve_path(project_root, args.output) if args.output else project_root / "mfa" / "ffpp_c23" / f"mfa_ffpp_{args.split}"
+    output_prefix = resolve_path(project_root, args.output) if args.output else project_root / "mfa" / "ffpp_c23" / f"mfa_ffpp_{args.split}{budget_suffix}"
     output_prefix.parent.mkdir(parents=True, exist_ok=True)
 
     json_path = output_prefix.with_suffix(".json")
     csv_path = output_prefix.with_suffix(".csv")
 
-    with json_path.open("w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-    with csv_path.open("w", encoding="utf-8", newline="") as f:
+    # A run that logged and topped up nothing leaves the (tracked) results alone.
+    write_outputs = bool(new_processed or updated) or not (json_path.exists() and csv_path.exists())
+    if write_outputs:
+        results = compute_results(progress_records.values(), questions)
+
+        # Identical files are not rewritten, and rewritten files keep their line endings.
+        write_if_changed(json_path, json.dumps(results, ensure_ascii=False, indent=2))
         headers = [
             "id",
             "category",
@@ -356,18 +1535,19 @@ def main() -> None:
             "yes_rate_fake",
             "yes_rate_real",
         ]
-        f.write(",".join(headers) + "\n")
-        for row in results:
-            values = [str(row[h]) for h in headers]
-            f.write(",".join(values) + "\n")
+        lines = [",".join(headers)] + [",".join(str(row[h]) for h in headers) for row in results]
+        write_if_changed(csv_path, "".join(line + "\n" for line in lines))
 
     print(
-        f"Processed videos this run: {new_processed}, skipped existing: {skipped_existing}, "
+        f"Processed videos this run: {new_processed}, topped up: {updated}, skipped existing: {skipped_existing}, "
         f"skipped missing: {skipped_missing}"
     )
     print(f"Total processed records in log: {len(progress_records)}")
-    print(f"Results written to {json_path} and {csv_path}")
-    print(f"Progress log saved at {progress_path}")
+    if write_outputs:
+        print(f"Results written to {json_path} and {csv_path}")
+    else:
+        print(f"Results unchanged: {json_path} and {csv_path}")
+    print(f"Progress store saved at {progress.store.path}")
 
 
 if __name__ == "__main__":